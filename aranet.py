@@ -2,10 +2,8 @@ import asyncio
 import logging
 import sys
 
-import co2
-import conv
-from config import Config
-from libclaranet4 import Reading, read_ara4, scan_ara4s
+from libclaranet4 import Ara4Connection, Reading, scan_ara4s
+from measurement import Measurement
 
 
 def _quiet_ble_warnings():
@@ -24,10 +22,10 @@ def ara_scan(runner: asyncio.Runner):
         print()
 
 
-def ara_read(runner: asyncio.Runner, addr: str) -> Reading:
+async def ara_read(conn: Ara4Connection) -> Reading:
     _quiet_ble_warnings()
 
-    result = read_ara4(runner, addr)
+    result = await conn.read()
     # I _always_ get humidity readings of X.3%,
     # where Aranet displays X% (with no decimal):
     result.humidity = float(int(result.humidity))
@@ -35,13 +33,11 @@ def ara_read(runner: asyncio.Runner, addr: str) -> Reading:
     return result
 
 
-def ara_print(cfg: Config, r: Reading):
-    print(f"{r.name} ({r.rssi} dBm)")
-    print(f"co2: {r.co2} ppm {co2.Co2WarningLevel.from_ppm(cfg, r.co2).emoji()}")
-    print(
-        f"temperature: {r.temperature:.1f} °C ({conv.celsius_to_fahrenheit(r.temperature):.1f} °F)"
-    )
-    print(f"pressure: {r.pressure} mbar ({conv.mbar_to_inhg(r.pressure):.2f} inHg)")
-    print(f"humidity: {r.humidity} %")
+def ara_print(m: Measurement):
+    print(f"{m.ble_name} ({m.rssi} dBm)")
+    print(f"co2: {m.co2_ppm} ppm {m.co2_level.emoji()}")
+    print(f"temperature: {m.temp_c:.1f} °C ({m.temp_f:.1f} °F)")
+    print(f"pressure: {m.pressure_mbar} mbar ({m.pressure_inhg:.2f} inHg)")
+    print(f"humidity: {m.humidity_pct} %")
     # stdout is block-buffered when redirected to a file by launchd:
     sys.stdout.flush()
@@ -0,0 +1,135 @@
+import datetime
+import json
+import os
+import threading
+from dataclasses import dataclass
+from typing import Final
+
+# gaps kept per device; past this, the oldest are given up on, e.g. for a
+# device whose history can't be read:
+BACKFILL_MAX_GAPS: Final = 100
+
+
+@dataclass
+class _DeviceSync:
+    last_live_write: datetime.datetime
+    # of (exclusive start, exclusive end), oldest first: the windows between two
+    # live writes that InfluxDB may be missing readings in. Each ends at the
+    # first live write after it, so it doesn't move as live writes carry on, and
+    # backfilling it doesn't write those readings again:
+    gaps: list[tuple[datetime.datetime, datetime.datetime]]
+
+
+class BackfillState:
+    """Tracks, per device, the gaps in InfluxDB that need backfilling.
+
+    Live writes less than the device's max gap apart (max_gap, until
+    set_max_gap() sets its own), with no failed poll of the device in between,
+    leave no gap. A longer gap (a restart, a wedged adapter, InfluxDB being
+    down) or a missed poll leaves the window between the two live writes to be
+    backfilled from the device's history. The state is saved to a JSON file,
+    so backfilling resumes where it left off after a restart. Safe to use from
+    multiple threads.
+    """
+
+    def __init__(self, path: str, max_gap: datetime.timedelta):
+        self._path = path
+        self._max_gap = max_gap
+        self._max_gaps: dict[str, datetime.timedelta] = {}  # by device name
+        # when a poll of each device, by name, first failed since its last write:
+        self._missed_at: dict[str, datetime.datetime] = {}
+        self._devices: dict[str, _DeviceSync] = {}
+        self._lock = threading.RLock()
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        for name, d in data.items():
+            self._devices[name] = _DeviceSync(
+                last_live_write=datetime.datetime.fromisoformat(d["last_live_write"]),
+                gaps=[
+                    (
+                        datetime.datetime.fromisoformat(start),
+                        datetime.datetime.fromisoformat(end),
+                    )
+                    for start, end in d["gaps"]
+                ],
+            )
+
+    def record_live_writes(self, writes: list[tuple[str, datetime.datetime]]):
+        """Record the (device name, time) of points written live, saving once"""
+        with self._lock:
+            for device_name, t in writes:
+                self._record_live_write(device_name, t)
+            self.save()
+
+    def set_max_gap(self, device_name: str, max_gap: datetime.timedelta):
+        """Set how far apart the device's live writes can be without a gap"""
+        with self._lock:
+            self._max_gaps[device_name] = max_gap
+
+    def record_missed(self, device_name: str, at: datetime.datetime):
+        """Record that polling the device at at failed, so it may have a gap"""
+        with self._lock:
+            self._missed_at.setdefault(device_name, at)
+
+    def _record_live_write(self, device_name: str, t: datetime.datetime):
+        # a failed poll before t means a measurement before t may be missing:
+        missed_at = self._missed_at.get(device_name)
+        missed = missed_at is not None and missed_at <= t
+        if missed:
+            del self._missed_at[device_name]
+        sync = self._devices.get(device_name)
+        if sync is None:
+            # nothing to backfill before the first write we know of:
+            self._devices[device_name] = _DeviceSync(last_live_write=t, gaps=[])
+            return
+        max_gap = self._max_gaps.get(device_name, self._max_gap)
+        if t - sync.last_live_write >= max_gap or missed:
+            sync.gaps.append((sync.last_live_write, t))
+            del sync.gaps[:-BACKFILL_MAX_GAPS]
+        sync.last_live_write = t
+
+    def pending(
+        self, device_name: str
+    ) -> tuple[datetime.datetime, datetime.datetime] | None:
+        """Return the oldest (exclusive start, exclusive end) window to backfill"""
+        with self._lock:
+            sync = self._devices.get(device_name)
+            if sync is None or not sync.gaps:
+                return None
+            return sync.gaps[0]
+
+    def advance(self, device_name: str, t: datetime.datetime):
+        """Record that the device's oldest gap is backfilled up to t (or all of it)"""
+        with self._lock:
+            gaps = self._devices[device_name].gaps
+            if not gaps:
+                return
+            start, end = gaps[0]
+            if t >= end:
+                del gaps[0]
+            else:
+                gaps[0] = max(start, t), end
+            self.save()
+
+    def save(self):
+        with self._lock:
+            # write-then-rename, so a crash mid-write can't lose the state:
+            tmp_path = f"{self._path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(
+                    {
+                        name: {
+                            "last_live_write": d.last_live_write.isoformat(),
+                            "gaps": [
+                                [start.isoformat(), end.isoformat()]
+                                for start, end in d.gaps
+                            ],
+                        }
+                        for name, d in self._devices.items()
+                    },
+                    f,
+                )
+            os.replace(tmp_path, self._path)
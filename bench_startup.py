@@ -0,0 +1,193 @@
+"""Measure an4mon's cold-start time and memory use in each mode.
+
+Usage: ./venv/bin/python bench_startup.py [--runs N] [--top N]
+
+Each mode runs main.py, under `python -X importtime`, with a generated config
+enabling that mode's sinks, and times it from launch until the poller logs that
+it's polling. Then it adds up the RSS of the process and its children, stops
+them, and reports the imports that took longest. The config's device address is
+fake, and its servers are closed local ports, so no hardware or network is
+needed; modes are measured with the default runtime and with --single-process.
+"""
+
+import argparse
+import json
+import os
+import queue
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Final
+
+MAIN: Final = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+READY_MARKER: Final = "poller: polling "
+READY_TIMEOUT_S: Final = 60.0
+# after the poller is ready, time for the other children to finish starting:
+SETTLE_S: Final = 1.0
+CLOSED_PORT: Final = 9  # discard; closed on most hosts
+
+_BASE: Final = {
+    "devices": [{"address": "00:00:00:00:00:00", "name": "bench"}],
+    "influx": False,
+    "notify": False,
+    "mqtt": False,
+}
+_INFLUX: Final = {
+    "influx": True,
+    "influx_host": "127.0.0.1",
+    "influx_port": CLOSED_PORT,
+    "influx_bucket": "bench",
+    "influx_measurement_name": "bench",
+}
+_MQTT: Final = {
+    "mqtt": True,
+    "mqtt_broker": "127.0.0.1",
+    "mqtt_port": CLOSED_PORT,
+    "mqtt_topic": "bench",
+}
+_NOTIFY: Final = {
+    "notify": True,
+    "ntfy_server": f"http://127.0.0.1:{CLOSED_PORT}",
+    "ntfy_topic": "bench",
+}
+_WEB: Final = {"web": True, "web_port": 18080}
+
+# by name, (config keys, extra arguments):
+MODES: Final = {
+    "print": ({}, ["--print"]),
+    "influx": (_INFLUX, []),
+    "influx-v2": (
+        _INFLUX | {"influx_api_version": 2, "influx_token": "bench"},
+        [],
+    ),
+    "mqtt": (_MQTT, []),
+    "store": ({"store": True}, []),
+    "notify": (_NOTIFY, []),
+    "web": (_WEB | {"store": True}, []),
+    "all": (_INFLUX | _MQTT | _NOTIFY | _WEB | {"store": True}, []),
+}
+RUNTIMES: Final = {"multi-process": [], "single-process": ["--single-process"]}
+
+
+def _tree_rss_kb(pid: int) -> int:
+    """Return the summed RSS, in KiB, of pid and all of its descendants"""
+    out = subprocess.run(
+        ["ps", "-A", "-o", "pid=,ppid=,rss="],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    children: dict[int, list[int]] = {}
+    rss: dict[int, int] = {}
+    for line in out.splitlines():
+        p, pp, r = (int(f) for f in line.split())
+        children.setdefault(pp, []).append(p)
+        rss[p] = r
+    total = 0
+    pending = [pid]
+    while pending:
+        p = pending.pop()
+        total += rss.get(p, 0)
+        pending.extend(children.get(p, []))
+    return total
+
+
+def _import_times(stderr: list[str]) -> dict[str, int]:
+    """Sum -X importtime's cumulative µs per top-level import, over all processes"""
+    totals: dict[str, int] = {}
+    for line in stderr:
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        # nested imports are indented by two spaces per level:
+        if name[1:].startswith(" "):
+            continue
+        name = name.strip()
+        totals[name] = totals.get(name, 0) + int(cumulative)
+    return totals
+
+
+def _pump(stream, lines: queue.Queue):
+    for line in stream:
+        lines.put(line)
+    lines.put(None)
+
+
+def run_once(config_path: str, args: list[str]) -> tuple[float, int, list[str]]:
+    """Start an4mon; returns seconds until ready, RSS in KiB, and its stderr"""
+    started_at = time.monotonic()
+    proc = subprocess.Popen(
+        [sys.executable, "-X", "importtime", MAIN, "--config", config_path, *args],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    lines: queue.Queue = queue.Queue()
+    threading.Thread(target=_pump, args=(proc.stderr, lines), daemon=True).start()
+    stderr: list[str] = []
+    ready_s = None
+    try:
+        deadline = started_at + READY_TIMEOUT_S
+        while ready_s is None:
+            line = lines.get(timeout=max(0.0, deadline - time.monotonic()))
+            if line is None:
+                raise RuntimeError(
+                    "an4mon exited before it was ready:\n" + "".join(stderr)
+                )
+            stderr.append(line)
+            if READY_MARKER in line:
+                ready_s = time.monotonic() - started_at
+        time.sleep(SETTLE_S)
+        rss_kb = _tree_rss_kb(proc.pid)
+    except queue.Empty:
+        raise RuntimeError(
+            f"an4mon wasn't ready within {READY_TIMEOUT_S:g}s:\n" + "".join(stderr)
+        ) from None
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+    while (line := lines.get()) is not None:
+        stderr.append(line)
+    return ready_s, rss_kb, stderr
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--runs", type=int, default=3, help="runs per mode")
+    parser.add_argument("--top", type=int, default=8, help="slowest imports shown")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode, (keys, extra_args) in MODES.items():
+            config_path = os.path.join(tmp, f"{mode}.json")
+            with open(config_path, "w") as f:
+                json.dump(
+                    _BASE | {"store_file": os.path.join(tmp, "bench.db")} | keys, f
+                )
+            for runtime, runtime_args in RUNTIMES.items():
+                ready: list[float] = []
+                rss: list[int] = []
+                stderr: list[str] = []
+                for _ in range(args.runs):
+                    ready_s, rss_kb, stderr = run_once(
+                        config_path, extra_args + runtime_args
+                    )
+                    ready.append(ready_s)
+                    rss.append(rss_kb)
+                print(
+                    f"{mode} ({runtime}): ready in {statistics.median(ready):.2f}s, "
+                    f"{statistics.median(rss) / 1024:.1f} MiB RSS "
+                    f"(medians of {args.runs})"
+                )
+                slowest = sorted(
+                    _import_times(stderr).items(), key=lambda kv: kv[1], reverse=True
+                )
+                for name, us in slowest[: args.top]:
+                    print(f"  {us / 1000:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import asyncio
+import datetime
+import heapq
+import itertools
+import time
+from typing import Final
+
+
+class Clock:
+    """The time, as the poller, notifier, and web server see it: the real time.
+
+    Pass a VirtualClock instead to run them faster than real time, e.g. in
+    simulate.py.
+    """
+
+    def now(self) -> datetime.datetime:
+        return datetime.datetime.now(datetime.UTC)
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    async def sleep(self, seconds: float):
+        await asyncio.sleep(seconds)
+
+    def sleep_blocking(self, seconds: float):
+        time.sleep(seconds)
+
+
+SYSTEM_CLOCK: Final = Clock()
+
+
+class VirtualClock(Clock):
+    """A clock that only moves when advanced, and whose sleeps return at once.
+
+    Sleeping advances the clock by the time slept, so code that sleeps between
+    steps runs through hours of its time in milliseconds. monotonic() counts
+    seconds since start. Tasks sleeping concurrently on one event loop wake in
+    the order they're due, each advancing the clock to when it is; until then,
+    they yield to the event loop rather than block, so they spin while other
+    tasks wait on anything else.
+    """
+
+    def __init__(self, start: datetime.datetime):
+        self._start = start
+        self._elapsed_s = 0.0
+        # of [due at, sequence number], for sleeping tasks:
+        self._sleepers: list[list[float]] = []
+        self._seq = itertools.count()
+
+    def now(self) -> datetime.datetime:
+        return self._start + datetime.timedelta(seconds=self._elapsed_s)
+
+    def monotonic(self) -> float:
+        return self._elapsed_s
+
+    def advance(self, seconds: float):
+        self._elapsed_s += max(0.0, seconds)
+
+    def advance_to(self, monotonic: float):
+        """Advance to monotonic(), unless the clock is already past it"""
+        self._elapsed_s = max(self._elapsed_s, monotonic)
+
+    async def sleep(self, seconds: float):
+        entry = [self._elapsed_s + max(0.0, seconds), next(self._seq)]
+        heapq.heappush(self._sleepers, entry)
+        try:
+            # still yield, as a real sleep would, which also lets other tasks
+            # start sleeping; then wait for those due sooner to wake first:
+            await asyncio.sleep(0)
+            while self._sleepers[0] is not entry:
+                await asyncio.sleep(0)
+        except BaseException:
+            self._sleepers.remove(entry)
+            heapq.heapify(self._sleepers)
+            raise
+        heapq.heappop(self._sleepers)
+        self.advance_to(entry[0])
+
+    def sleep_blocking(self, seconds: float):
+        self.advance(seconds)
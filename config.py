@@ -2,6 +2,20 @@ import json
 import logging
 from dataclasses import dataclass
 from enum import Enum
+from typing import Final
+
+# connect: read over a GATT connection to each device
+# passive: decode measurements from advertisements, without connecting
+BLE_READ_MODES: Final = frozenset({"connect", "passive"})
+# the longest measurement interval an Aranet4 can be set to:
+ARANET_MAX_REFRESH_MIN: Final = 10
+# 1: the InfluxDB 1.x API (and 2.x's 1.x compatibility API)
+# 2: the /api/v2/write API of InfluxDB 2.x and 3.x, with token auth
+INFLUX_API_VERSIONS: Final = frozenset({1, 2})
+# ReadingEvent fields an alert rule can watch:
+ALERT_METRICS: Final = frozenset({"co2_ppm", "temp_c", "humidity_pct", "pressure_mbar"})
+ALERT_AGGREGATES: Final = frozenset({"mean", "max", "min"})
+ALERT_LEVELS: Final = frozenset({"yellow", "red"})
 
 
 class ConfigValidationError(ValueError):
@@ -13,6 +27,10 @@ def _is_int(value) -> bool:
     return isinstance(value, int) and not isinstance(value, bool)
 
 
+def _is_number(value) -> bool:
+    return _is_int(value) or isinstance(value, float)
+
+
 class NtfyPriority(Enum):
     """copied from https://github.com/cdzombak/driveway-monitor/blob/main/ntfy.py ;
     used for config validation only"""
@@ -34,9 +52,146 @@ class NtfyPriority(Enum):
         return {e.value for e in NtfyPriority}
 
 
+@dataclass
+class DeviceConfig:
+    address: str
+    name: str
+    room_name: str | None
+    mqtt_topic: str | None
+
+    @staticmethod
+    def from_dict(data: dict, defaults: dict) -> "DeviceConfig":
+        if not isinstance(data, dict):
+            raise ConfigValidationError("each entry in devices must be an object")
+        name = data.get("name")
+        return DeviceConfig(
+            address=data.get("address"),
+            name=name,
+            room_name=data.get("room_name") or defaults.get("notify_room_name") or name,
+            mqtt_topic=data.get("mqtt_topic") or defaults.get("mqtt_topic"),
+        )
+
+    def validate(self):
+        if not self.address or not isinstance(self.address, str):
+            raise ConfigValidationError("device address is required")
+        if not self.name or not isinstance(self.name, str):
+            raise ConfigValidationError(f"device {self.address}: name is required")
+        if self.room_name is not None and not isinstance(self.room_name, str):
+            raise ConfigValidationError(
+                f"device {self.address}: room_name must be a string"
+            )
+
+
+@dataclass
+class AlertRuleConfig:
+    name: str
+    metric: str  # one of ALERT_METRICS
+    aggregate: str  # one of ALERT_AGGREGATES
+    window_min: float  # 0 means the latest reading alone
+    above: float | None  # exactly one of above and below is set
+    below: float | None
+    clear_at: float | None  # the alert clears past this; None means the threshold
+    level: str  # one of ALERT_LEVELS
+    every: int | None  # None means notify_yellow_every or notify_red_every
+    priority: str | None  # None means ntfy_priority_yellow or ntfy_priority_red
+
+    @staticmethod
+    def from_dict(data: dict) -> "AlertRuleConfig":
+        if not isinstance(data, dict):
+            raise ConfigValidationError("each entry in alert_rules must be an object")
+        return AlertRuleConfig(
+            name=data.get("name"),
+            metric=data.get("metric"),
+            aggregate=data.get("aggregate", "mean"),
+            window_min=data.get("window_min", 0),
+            above=data.get("above"),
+            below=data.get("below"),
+            clear_at=data.get("clear_at"),
+            level=data.get("level", "yellow"),
+            every=data.get("every"),
+            priority=data.get("priority"),
+        )
+
+    def validate(self):
+        if not self.name or not isinstance(self.name, str):
+            raise ConfigValidationError("alert rule name is required")
+        if self.metric not in ALERT_METRICS:
+            raise ConfigValidationError(
+                f"alert rule {self.name}: metric must be one of {sorted(ALERT_METRICS)}"
+            )
+        if self.aggregate not in ALERT_AGGREGATES:
+            raise ConfigValidationError(
+                f"alert rule {self.name}: aggregate must be one of "
+                f"{sorted(ALERT_AGGREGATES)}"
+            )
+        if not _is_number(self.window_min) or self.window_min < 0:
+            raise ConfigValidationError(
+                f"alert rule {self.name}: window_min must be a non-negative number"
+            )
+        if (self.above is None) == (self.below is None):
+            raise ConfigValidationError(
+                f"alert rule {self.name}: exactly one of above and below is required"
+            )
+        threshold = self.above if self.above is not None else self.below
+        if not _is_number(threshold):
+            raise ConfigValidationError(
+                f"alert rule {self.name}: above or below must be a number"
+            )
+        if self.clear_at is not None:
+            if not _is_number(self.clear_at):
+                raise ConfigValidationError(
+                    f"alert rule {self.name}: clear_at must be a number"
+                )
+            if self.above is not None and self.clear_at > self.above:
+                raise ConfigValidationError(
+                    f"alert rule {self.name}: clear_at must be at most above"
+                )
+            if self.below is not None and self.clear_at < self.below:
+                raise ConfigValidationError(
+                    f"alert rule {self.name}: clear_at must be at least below"
+                )
+        if self.level not in ALERT_LEVELS:
+            raise ConfigValidationError(
+                f"alert rule {self.name}: level must be one of {sorted(ALERT_LEVELS)}"
+            )
+        if self.every is not None and (not _is_int(self.every) or self.every < 1):
+            raise ConfigValidationError(
+                f"alert rule {self.name}: every must be a positive integer"
+            )
+        if self.priority is not None and self.priority not in NtfyPriority.all_values():
+            raise ConfigValidationError(
+                f"alert rule {self.name}: priority must be one of "
+                f"{NtfyPriority.all_values()}"
+            )
+
+
+def _alert_rules_from_dict(data: dict) -> list[AlertRuleConfig]:
+    rules = data.get("alert_rules", [])
+    if not isinstance(rules, list):
+        raise ConfigValidationError("alert_rules must be a list")
+    return [AlertRuleConfig.from_dict(r) for r in rules]
+
+
+def _devices_from_dict(data: dict) -> list[DeviceConfig]:
+    devices = data.get("devices")
+    if devices is None:
+        # single-device configs predate the devices list:
+        return [
+            DeviceConfig(
+                address=data.get("aranet_device_address"),
+                name=data.get("device_name") or data.get("influx_nametag", ""),
+                room_name=data.get("notify_room_name"),
+                mqtt_topic=data.get("mqtt_topic"),
+            )
+        ]
+    if not isinstance(devices, list):
+        raise ConfigValidationError("devices must be a list")
+    return [DeviceConfig.from_dict(d, data) for d in devices]
+
+
 @dataclass
 class Config:
-    aranet_device_address: str
+    devices: list[DeviceConfig]
     notify: bool
     influx: bool
     mqtt: bool
@@ -51,24 +206,57 @@ class Config:
     co2_red: int
     ntfy_priority_yellow: str
     ntfy_priority_red: str
+    alert_rules: list[AlertRuleConfig]
+    trend_lead_min: int  # 0 disables trend notifications
+    trend_window_min: int
     mute_short_h: int
     mute_long_h: int
+    web: bool
     web_external_base_url: str | None
     web_port: int
     web_bind_to: str
     poll_interval: int
+    poll_concurrency: int
+    poll_stagger_s: float
+    poll_align_refresh: bool
+    poll_adaptive: bool
+    poll_interval_min: float  # minutes; the floor when polling adaptively
+    poll_interval_max: float  # minutes; the ceiling when polling adaptively
+    poll_fast_ppm_per_min: float
+    poll_low_battery_pct: int
+    ble_read_mode: str
+    ble_keep_connected: bool
+    ble_discovery_ttl_s: float
+    influx_api_version: int
     influx_bucket: str | None
     influx_host: str | None
     influx_port: int
     influx_username: str | None
     influx_password: str | None
+    influx_token: str | None
+    influx_org: str | None
     influx_measurement_name: str | None
-    device_name: str
+    influx_batch_size: int
+    influx_flush_interval_s: float
+    backfill: bool
+    backfill_state_file: str | None
+    backfill_max_records: int
+    store: bool
+    store_file: str | None
+    store_retention_days: int
+    spool_dir: str | None
+    spool_max_mb: int
     mqtt_broker: str | None
     mqtt_port: int
     mqtt_username: str | None
     mqtt_password: str | None
     mqtt_topic: str | None
+    mqtt_qos: int
+    mqtt_retain: bool
+    mqtt_client_id: str | None
+    rollup_windows_min: list[int]  # empty disables rollups
+    rollup_influx_bucket: str | None
+    rollup_influx_measurement_name: str | None
 
     @staticmethod
     def from_file(file_path: str) -> "Config":
@@ -78,7 +266,7 @@ class Config:
     @staticmethod
     def from_dict(data: dict) -> "Config":
         result = Config(
-            aranet_device_address=data.get("aranet_device_address"),
+            devices=_devices_from_dict(data),
             notify=data.get("notify", False),
             influx=data.get("influx", False),
             mqtt=data.get("mqtt", False),
@@ -92,45 +280,163 @@ class Config:
             co2_red=data.get("co2_red", 1400),
             ntfy_priority_yellow=data.get("ntfy_priority_yellow", "3"),
             ntfy_priority_red=data.get("ntfy_priority_red", "5"),
+            alert_rules=_alert_rules_from_dict(data),
+            trend_lead_min=data.get("trend_lead_min", 0),
+            trend_window_min=data.get("trend_window_min", 15),
             mute_short_h=data.get("mute_short_h", 2),
             mute_long_h=data.get("mute_long_h", 6),
+            web=data.get("web", False),
             web_external_base_url=data.get("web_external_base_url"),
             web_port=data.get("web_port", 5560),
             web_bind_to=data.get("web_bind_to", "127.0.0.1"),
             notify_room_name=data.get("notify_room_name"),
             poll_interval=data.get("poll_interval", 2),
+            poll_concurrency=data.get("poll_concurrency", 4),
+            poll_stagger_s=data.get("poll_stagger_s", 2),
+            poll_align_refresh=data.get("poll_align_refresh", True),
+            poll_adaptive=data.get("poll_adaptive", False),
+            poll_interval_min=data.get("poll_interval_min", 1),
+            poll_interval_max=data.get("poll_interval_max", 10),
+            poll_fast_ppm_per_min=data.get("poll_fast_ppm_per_min", 20),
+            poll_low_battery_pct=data.get("poll_low_battery_pct", 15),
+            ble_read_mode=data.get("ble_read_mode", "connect"),
+            ble_keep_connected=data.get("ble_keep_connected", True),
+            ble_discovery_ttl_s=data.get("ble_discovery_ttl_s", 3600),
+            influx_api_version=data.get("influx_api_version", 1),
             influx_bucket=data.get("influx_bucket"),
             influx_host=data.get("influx_host"),
             influx_port=data.get("influx_port", 8086),
             influx_username=data.get("influx_username"),
             influx_password=data.get("influx_password"),
+            influx_token=data.get("influx_token"),
+            influx_org=data.get("influx_org"),
             influx_measurement_name=data.get("influx_measurement_name"),
-            device_name=data.get("device_name") or data.get("influx_nametag", ""),
+            influx_batch_size=data.get("influx_batch_size", 5000),
+            influx_flush_interval_s=data.get("influx_flush_interval_s", 0),
+            backfill=data.get("backfill", False),
+            backfill_state_file=data.get("backfill_state_file"),
+            backfill_max_records=data.get("backfill_max_records", 500),
+            store=data.get("store", False),
+            store_file=data.get("store_file"),
+            store_retention_days=data.get("store_retention_days", 90),
+            spool_dir=data.get("spool_dir"),
+            spool_max_mb=data.get("spool_max_mb", 64),
             mqtt_broker=data.get("mqtt_broker"),
             mqtt_port=data.get("mqtt_port", 1883),
             mqtt_username=data.get("mqtt_username"),
             mqtt_password=data.get("mqtt_password"),
             mqtt_topic=data.get("mqtt_topic"),
+            mqtt_qos=data.get("mqtt_qos", 0),
+            mqtt_retain=data.get("mqtt_retain", False),
+            mqtt_client_id=data.get("mqtt_client_id"),
+            rollup_windows_min=data.get("rollup_windows_min", []),
+            rollup_influx_bucket=data.get("rollup_influx_bucket"),
+            rollup_influx_measurement_name=data.get("rollup_influx_measurement_name"),
         )
         result.validate()
+        if result.rollup_influx_bucket is None:
+            result.rollup_influx_bucket = result.influx_bucket
+        if result.rollup_influx_measurement_name is None and (
+            result.influx_measurement_name
+        ):
+            result.rollup_influx_measurement_name = (
+                f"{result.influx_measurement_name}_rollup"
+            )
         result.ntfy_server = result.ntfy_server.removesuffix("/")
         if result.web_external_base_url and result.web_external_base_url.endswith("/"):
             result.web_external_base_url = result.web_external_base_url[:-1]
         return result
 
     def validate(self):
-        if not self.aranet_device_address or not isinstance(
-            self.aranet_device_address, str
-        ):
-            raise ConfigValidationError("aranet_device_address is required")
-        if not self.device_name or not isinstance(self.device_name, str):
-            raise ConfigValidationError("device_name is required")
+        self._validate_devices()
         if not _is_int(self.poll_interval) or self.poll_interval < 1:
             raise ConfigValidationError("poll_interval must be a positive integer")
+        if not _is_int(self.poll_concurrency) or self.poll_concurrency < 1:
+            raise ConfigValidationError("poll_concurrency must be a positive integer")
+        if not _is_number(self.poll_stagger_s) or self.poll_stagger_s < 0:
+            raise ConfigValidationError("poll_stagger_s must be a non-negative number")
+        if not isinstance(self.poll_align_refresh, bool):
+            raise ConfigValidationError("poll_align_refresh must be a boolean")
+        self._validate_poll_adaptive()
+        if self.ble_read_mode not in BLE_READ_MODES:
+            raise ConfigValidationError(
+                f"ble_read_mode must be one of {sorted(BLE_READ_MODES)}"
+            )
+        if not isinstance(self.ble_keep_connected, bool):
+            raise ConfigValidationError("ble_keep_connected must be a boolean")
+        if not _is_number(self.ble_discovery_ttl_s) or self.ble_discovery_ttl_s < 0:
+            raise ConfigValidationError(
+                "ble_discovery_ttl_s must be a non-negative number"
+            )
         self._validate_ntfy()
+        self._validate_alert_rules()
         self._validate_web()
         self._validate_influx()
+        self._validate_backfill()
         self._validate_mqtt()
+        self._validate_store()
+        self._validate_spool()
+        self._validate_rollup()
+
+    def _validate_poll_adaptive(self):
+        if not isinstance(self.poll_adaptive, bool):
+            raise ConfigValidationError("poll_adaptive must be a boolean")
+        if not self.poll_adaptive:
+            return
+        if (
+            not _is_number(self.poll_interval_min)
+            or not 0 < self.poll_interval_min <= self.poll_interval
+        ):
+            raise ConfigValidationError(
+                "poll_interval_min must be a positive number, at most poll_interval"
+            )
+        if (
+            not _is_number(self.poll_interval_max)
+            or self.poll_interval_max < self.poll_interval
+        ):
+            raise ConfigValidationError(
+                "poll_interval_max must be a number, at least poll_interval"
+            )
+        if (
+            not _is_number(self.poll_fast_ppm_per_min)
+            or self.poll_fast_ppm_per_min <= 0
+        ):
+            raise ConfigValidationError(
+                "poll_fast_ppm_per_min must be a positive number"
+            )
+        if (
+            not _is_int(self.poll_low_battery_pct)
+            or not 0 <= self.poll_low_battery_pct <= 100
+        ):
+            raise ConfigValidationError(
+                "poll_low_battery_pct must be an integer from 0 to 100"
+            )
+
+    def poll_aligned(self) -> bool:
+        """Whether each device is polled just after it takes a measurement"""
+        return self.poll_align_refresh and self.ble_read_mode == "connect"
+
+    def poll_interval_ceiling(self) -> float:
+        """The longest time, in minutes, a device's polls can be apart"""
+        ceiling = self.poll_interval_max if self.poll_adaptive else self.poll_interval
+        if self.poll_aligned():
+            # waiting for the device's next measurement adds up to an interval:
+            ceiling += ARANET_MAX_REFRESH_MIN
+        return ceiling
+
+    def _validate_devices(self):
+        if not self.devices:
+            raise ConfigValidationError("aranet_device_address or devices is required")
+        if len(self.devices) == 1 and not self.devices[0].address:
+            raise ConfigValidationError("aranet_device_address is required")
+        for d in self.devices:
+            d.validate()
+        addresses = [d.address.lower() for d in self.devices]
+        if len(set(addresses)) != len(addresses):
+            raise ConfigValidationError("device addresses must be unique")
+        names = [d.name for d in self.devices]
+        if len(set(names)) != len(names):
+            raise ConfigValidationError("device names must be unique")
 
     def _validate_ntfy(self):
         if not self.notify:
@@ -151,8 +457,9 @@ class Config:
             raise ConfigValidationError(
                 f"ntfy_priority_yellow must be one of {NtfyPriority.all_values()}"
             )
-        if not self.notify_room_name or not isinstance(self.notify_room_name, str):
-            raise ConfigValidationError("notify_room_name is required")
+        for d in self.devices:
+            if not d.room_name:
+                raise ConfigValidationError("notify_room_name is required")
         if not isinstance(self.ntfy_server, str):
             raise ConfigValidationError("ntfy_server must be a string")
         if not (
@@ -163,9 +470,40 @@ class Config:
                 "ntfy_server must start with http:// or https://"
             )
 
+    def _validate_alert_rules(self):
+        for r in self.alert_rules:
+            r.validate()
+        names = [r.name for r in self.alert_rules]
+        if len(set(names)) != len(names):
+            raise ConfigValidationError("alert rule names must be unique")
+        if not _is_int(self.trend_lead_min) or self.trend_lead_min < 0:
+            raise ConfigValidationError("trend_lead_min must be a non-negative integer")
+        if not _is_int(self.trend_window_min) or self.trend_window_min < 1:
+            raise ConfigValidationError("trend_window_min must be a positive integer")
+
+    def mute_enabled(self) -> bool:
+        """Whether notifications can be muted, via the web server's /mute"""
+        return self.notify and self.web_external_base_url is not None
+
+    def web_server_enabled(self) -> bool:
+        """Whether the embedded web server runs, for mute buttons or for its own sake"""
+        return self.web or self.mute_enabled()
+
     def _validate_web(self):
-        if not self.notify or self.web_external_base_url is None:
+        if not isinstance(self.web, bool):
+            raise ConfigValidationError("web must be a boolean")
+        if self.mute_enabled():
+            self._validate_mute()
+        if not self.web_server_enabled():
             return
+        if not _is_int(self.web_port):
+            raise ConfigValidationError("web_port must be an integer")
+        if self.web_port <= 0 or self.web_port > 65535:
+            raise ConfigValidationError("web_port must be between 1 and 65535")
+        if not self.web_bind_to or not isinstance(self.web_bind_to, str):
+            raise ConfigValidationError("web_bind_to must be a string")
+
+    def _validate_mute(self):
         if not isinstance(self.web_external_base_url, str):
             raise ConfigValidationError("web_external_base_url must be a string")
         if not (
@@ -185,16 +523,14 @@ class Config:
             raise ConfigValidationError("mute_short_h must be a positive integer")
         if not _is_int(self.mute_long_h) or self.mute_long_h < 1:
             raise ConfigValidationError("mute_long_h must be a positive integer")
-        if not _is_int(self.web_port):
-            raise ConfigValidationError("web_port must be an integer")
-        if self.web_port <= 0 or self.web_port > 65535:
-            raise ConfigValidationError("web_port must be between 1 and 65535")
-        if not self.web_bind_to or not isinstance(self.web_bind_to, str):
-            raise ConfigValidationError("web_bind_to must be a string")
 
     def _validate_influx(self):
         if not self.influx:
             return
+        if self.influx_api_version not in INFLUX_API_VERSIONS:
+            raise ConfigValidationError(
+                f"influx_api_version must be one of {sorted(INFLUX_API_VERSIONS)}"
+            )
         if not self.influx_bucket or not isinstance(self.influx_bucket, str):
             raise ConfigValidationError("influx_bucket is required")
         if not self.influx_host or not isinstance(self.influx_host, str):
@@ -219,6 +555,62 @@ class Config:
             self.influx_measurement_name, str
         ):
             raise ConfigValidationError("influx_measurement_name must be a string")
+        if self.influx_api_version == 1 and len(self.influx_bucket.split("/")) > 2:
+            raise ConfigValidationError(
+                "influx_bucket must be a database, or database/retention_policy"
+            )
+        if self.influx_api_version == 2:
+            if not self.influx_token or not isinstance(self.influx_token, str):
+                raise ConfigValidationError(
+                    "influx_token is required for influx_api_version 2"
+                )
+            if self.influx_org is not None and not isinstance(self.influx_org, str):
+                raise ConfigValidationError("influx_org must be a string")
+        if not _is_int(self.influx_batch_size) or self.influx_batch_size < 1:
+            raise ConfigValidationError("influx_batch_size must be a positive integer")
+        if (
+            not _is_number(self.influx_flush_interval_s)
+            or self.influx_flush_interval_s < 0
+        ):
+            raise ConfigValidationError(
+                "influx_flush_interval_s must be a non-negative number"
+            )
+
+    def _validate_backfill(self):
+        if not isinstance(self.backfill, bool):
+            raise ConfigValidationError("backfill must be a boolean")
+        if not self.backfill:
+            return
+        if not self.influx:
+            raise ConfigValidationError("backfill requires influx")
+        if not self.backfill_state_file or not isinstance(
+            self.backfill_state_file, str
+        ):
+            raise ConfigValidationError("backfill_state_file is required")
+        if not _is_int(self.backfill_max_records) or self.backfill_max_records < 1:
+            raise ConfigValidationError(
+                "backfill_max_records must be a positive integer"
+            )
+
+    def _validate_store(self):
+        if not isinstance(self.store, bool):
+            raise ConfigValidationError("store must be a boolean")
+        if not self.store:
+            return
+        if not self.store_file or not isinstance(self.store_file, str):
+            raise ConfigValidationError("store_file is required")
+        if not _is_int(self.store_retention_days) or self.store_retention_days < 1:
+            raise ConfigValidationError(
+                "store_retention_days must be a positive integer"
+            )
+
+    def _validate_spool(self):
+        if self.spool_dir is None:
+            return
+        if not self.spool_dir or not isinstance(self.spool_dir, str):
+            raise ConfigValidationError("spool_dir must be a string")
+        if not _is_int(self.spool_max_mb) or self.spool_max_mb < 1:
+            raise ConfigValidationError("spool_max_mb must be a positive integer")
 
     def _validate_mqtt(self):
         if not self.mqtt:
@@ -229,8 +621,9 @@ class Config:
             raise ConfigValidationError("mqtt_port must be an integer")
         if self.mqtt_port <= 0 or self.mqtt_port > 65535:
             raise ConfigValidationError("mqtt_port must be between 1 and 65535")
-        if not self.mqtt_topic or not isinstance(self.mqtt_topic, str):
-            raise ConfigValidationError("mqtt_topic is required")
+        for d in self.devices:
+            if not d.mqtt_topic or not isinstance(d.mqtt_topic, str):
+                raise ConfigValidationError("mqtt_topic is required")
         if (self.mqtt_username is None) != (self.mqtt_password is None):
             raise ConfigValidationError(
                 "mqtt_username and mqtt_password must be both set or both missing"
@@ -239,3 +632,43 @@ class Config:
             raise ConfigValidationError("mqtt_username must be a string")
         if self.mqtt_password is not None and not isinstance(self.mqtt_password, str):
             raise ConfigValidationError("mqtt_password must be a string")
+        if not _is_int(self.mqtt_qos) or self.mqtt_qos not in (0, 1, 2):
+            raise ConfigValidationError("mqtt_qos must be 0, 1, or 2")
+        if not isinstance(self.mqtt_retain, bool):
+            raise ConfigValidationError("mqtt_retain must be a boolean")
+        if self.mqtt_client_id is not None and not isinstance(self.mqtt_client_id, str):
+            raise ConfigValidationError("mqtt_client_id must be a string")
+
+    def _validate_rollup(self):
+        if not isinstance(self.rollup_windows_min, list) or not all(
+            _is_int(w) and w > 0 for w in self.rollup_windows_min
+        ):
+            raise ConfigValidationError(
+                "rollup_windows_min must be a list of positive integers"
+            )
+        if len(set(self.rollup_windows_min)) != len(self.rollup_windows_min):
+            raise ConfigValidationError("rollup_windows_min must not repeat a window")
+        if not self.rollup_windows_min:
+            return
+        if not self.influx and not self.mqtt:
+            raise ConfigValidationError("rollup_windows_min requires influx or mqtt")
+        if self.rollup_influx_bucket is not None:
+            if not self.rollup_influx_bucket or not isinstance(
+                self.rollup_influx_bucket, str
+            ):
+                raise ConfigValidationError("rollup_influx_bucket must be a string")
+            if (
+                self.influx_api_version == 1
+                and len(self.rollup_influx_bucket.split("/")) > 2
+            ):
+                raise ConfigValidationError(
+                    "rollup_influx_bucket must be a database, "
+                    "or database/retention_policy"
+                )
+        if self.rollup_influx_measurement_name is not None and (
+            not self.rollup_influx_measurement_name
+            or not isinstance(self.rollup_influx_measurement_name, str)
+        ):
+            raise ConfigValidationError(
+                "rollup_influx_measurement_name must be a string"
+            )
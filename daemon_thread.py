@@ -0,0 +1,48 @@
+import asyncio
+import threading
+from collections.abc import Callable
+
+
+async def run_in_daemon_thread(fn: Callable[[], None], name: str):
+    """Run fn on a new daemon thread; returns when it returns, or raises what it does.
+
+    Unlike with asyncio.to_thread, the thread can't hold up the event loop's or
+    the interpreter's shutdown. If fn raises a BaseException that isn't an
+    Exception, like SystemExit, this raises a RuntimeError caused by it.
+    Cancelling this leaves fn running until the process exits, so fn must be
+    safe to abandon, like a server's loop.
+    """
+    loop = asyncio.get_running_loop()
+    done: asyncio.Future = loop.create_future()
+
+    def settle(exc: Exception | None):
+        try:
+            loop.call_soon_threadsafe(_settle, done, exc)
+        except RuntimeError:
+            pass  # the loop closed after abandoning fn
+
+    def run():
+        try:
+            fn()
+        except Exception as e:  # noqa: BLE001 - raised by the awaiting task
+            settle(e)
+        except BaseException as e:  # noqa: BLE001 - as above, e.g. SystemExit
+            # raising SystemExit or KeyboardInterrupt from a task would escape
+            # the event loop, rather than fail the task:
+            error = RuntimeError(f"{name} exited: {e!r}")
+            error.__cause__ = e
+            settle(error)
+        else:
+            settle(None)
+
+    threading.Thread(target=run, name=name, daemon=True).start()
+    await done
+
+
+def _settle(future: asyncio.Future, exc: Exception | None):
+    if future.done():
+        return
+    if exc is not None:
+        future.set_exception(exc)
+    else:
+        future.set_result(None)
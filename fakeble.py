@@ -0,0 +1,179 @@
+"""Scripted stand-ins for Aranet4 devices, for running an4mon without Bluetooth.
+
+FakeBackend plugs into Ara4Connection in place of bleak. Each FakeDevice
+measures on its own schedule, like a real Aranet4, taking its values from a
+script of the time; values depend only on the measurement's time and the seed,
+so a run can be repeated exactly. Only current measurements can be read; history
+(for backfill) and advertisements (for ble_read_mode "passive") aren't faked.
+"""
+
+import datetime
+import math
+import random
+import struct
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import Final
+
+from bleak.backends.device import BLEDevice
+
+from clock import Clock
+from libclaranet4 import UUID_CURRENT_MEASUREMENTS_DETAILED, BleBackend, BTIOError
+
+# the layout of UUID_CURRENT_MEASUREMENTS_DETAILED: CO2, temperature, pressure,
+# humidity, battery, status, measurement interval, and seconds since measuring:
+_DETAILED: Final = struct.Struct("<HHHBBBHH")
+
+
+@dataclass(frozen=True)
+class FakeValues:
+    co2: int  # ppm
+    temp_c: float
+    humidity_pct: float
+    pressure_mbar: float
+
+
+# given a measurement's time, and a random.Random seeded for that measurement:
+Script = Callable[[datetime.datetime, random.Random], FakeValues]
+
+
+def office_script(
+    base_ppm: int = 450, peak_ppm: int = 1600, rise_min: float = 90.0
+) -> Script:
+    """An office occupied 9:00 to 17:00 (UTC) on weekdays.
+
+    While it's occupied, CO2 climbs from base_ppm toward peak_ppm, reaching 63%
+    of the way in rise_min; overnight and at weekends it decays back, as fast.
+    Temperature is 2 °C higher while occupied, and pressure drifts over days.
+    """
+
+    def script(t: datetime.datetime, rng: random.Random) -> FakeValues:
+        day_start = t.replace(hour=0, minute=0, second=0, microsecond=0)
+        minutes = (t - day_start).total_seconds() / 60
+        workday = t.weekday() < 5
+        occupied_min = min(max(0.0, minutes - 9 * 60), 8 * 60) if workday else 0.0
+        level = 1 - math.exp(-occupied_min / rise_min)
+        if not workday or minutes < 9 * 60:
+            level = 0.0
+        elif minutes > 17 * 60:
+            level *= math.exp(-(minutes - 17 * 60) / rise_min)
+        occupied = workday and 9 * 60 <= minutes < 17 * 60
+        days = t.timestamp() / 86400
+        return FakeValues(
+            co2=round(base_ppm + (peak_ppm - base_ppm) * level + rng.gauss(0, 15)),
+            temp_c=round(20.5 + (2.0 if occupied else 0.0) + rng.gauss(0, 0.2), 1),
+            humidity_pct=round(min(100.0, max(0.0, 40 + 5 * level + rng.gauss(0, 1)))),
+            pressure_mbar=round(1013 + 8 * math.sin(2 * math.pi * days / 5), 1),
+        )
+
+    return script
+
+
+@dataclass
+class FakeDevice:
+    address: str
+    name: str = "Aranet4 FAKE"
+    script: Script = field(default_factory=office_script)
+    interval_s: int = 60  # how often it measures
+    rssi: int = -60
+    battery: int = 90
+    # chance that a connection attempt, or a read, fails:
+    failure_rate: float = 0.0
+
+    def measurement(self, now: datetime.datetime, seed: int) -> bytes:
+        """Return the device's latest measurement at now, as the device sends it"""
+        # each device measures at its own offset into the interval:
+        offset_s = random.Random(f"{seed}:{self.address}").uniform(0, self.interval_s)
+        ts = now.timestamp()
+        n = math.floor((ts - offset_s) / self.interval_s)
+        sampled_ts = n * self.interval_s + offset_s
+        values = self.script(
+            datetime.datetime.fromtimestamp(sampled_ts, datetime.UTC),
+            random.Random(f"{seed}:{self.address}:{n}"),
+        )
+        return _DETAILED.pack(
+            values.co2,
+            round(values.temp_c * 20),
+            round(values.pressure_mbar * 10),
+            round(values.humidity_pct),
+            self.battery,
+            0,
+            self.interval_s,
+            round(ts - sampled_ts),
+        )
+
+
+class FakeClient:
+    """Stands in for a BleakClient connected to a FakeDevice"""
+
+    def __init__(
+        self,
+        backend: "FakeBackend",
+        device: FakeDevice,
+        disconnected_callback: Callable,
+    ):
+        self._backend = backend
+        self._device = device
+        self._disconnected_callback = disconnected_callback
+        self._connected = False
+
+    @property
+    def is_connected(self) -> bool:
+        return self._connected
+
+    async def connect(self):
+        if self._backend.fails(self._device):
+            raise BTIOError(f"{self._device.address}: fake connection failure")
+        self._connected = True
+
+    async def disconnect(self):
+        self._connected = False
+
+    async def read_gatt_char(self, uuid: str) -> bytearray:
+        if not self._connected:
+            raise BTIOError(f"{self._device.address}: not connected")
+        if self._backend.fails(self._device):
+            # as a dropped link does:
+            self._connected = False
+            self._disconnected_callback(self)
+            raise BTIOError(f"{self._device.address}: fake read failure")
+        if uuid != UUID_CURRENT_MEASUREMENTS_DETAILED:
+            raise BTIOError(f"fake devices can't read characteristic {uuid}")
+        self._backend.reads += 1
+        return bytearray(
+            self._device.measurement(self._backend.clock.now(), self._backend.seed)
+        )
+
+    async def write_gatt_char(self, uuid: str, data: bytes, response: bool = False):
+        raise BTIOError(f"fake devices can't write characteristic {uuid}")
+
+
+class FakeBackend(BleBackend):
+    """Reaches FakeDevices instead of Bluetooth ones, on clock's time"""
+
+    def __init__(self, devices: list[FakeDevice], clock: Clock, seed: int = 0):
+        self.clock = clock
+        self.seed = seed
+        self.reads = 0  # successful measurement reads
+        self.failures = 0  # injected failures
+        self._devices = {d.address.lower(): d for d in devices}
+        self._rng = random.Random(seed)
+
+    def fails(self, device: FakeDevice) -> bool:
+        """Whether to inject a failure into the next operation on device"""
+        failed = device.failure_rate > 0 and self._rng.random() < device.failure_rate
+        self.failures += failed
+        return failed
+
+    async def scan_for(self, address: str) -> tuple[BLEDevice, int] | None:
+        device = self._devices.get(address.lower())
+        if device is None:
+            return None
+        return BLEDevice(device.address, device.name, None), device.rssi
+
+    def client(
+        self, ble_device: BLEDevice, disconnected_callback: Callable
+    ) -> FakeClient:
+        return FakeClient(
+            self, self._devices[ble_device.address.lower()], disconnected_callback
+        )
@@ -0,0 +1,87 @@
+import concurrent.futures
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class SinkResult:
+    sink: str
+    ok: bool
+    latency_s: float
+    error: str | None = None
+
+    def __str__(self) -> str:
+        outcome = "ok" if self.ok else (self.error or "failed")
+        return f"{self.sink} {outcome} ({self.latency_s * 1000:.0f} ms)"
+
+
+@dataclass(frozen=True)
+class SinkJob:
+    run: Callable[[], bool]  # returns whether the write succeeded
+    timeout_s: float
+
+
+class SinkFanout:
+    """Runs writes to several sinks at once, each with its own deadline.
+
+    Each sink gets a worker thread of its own, so a slow sink delays neither the
+    others nor the caller past that sink's deadline. A sink still busy with a
+    write that overran its deadline is skipped (and reported failed) until that
+    write finishes, so a hung sink can't pile up work.
+    """
+
+    def __init__(self, sinks: list[str]):
+        self._pools = {
+            name: concurrent.futures.ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix=f"sink-{name}"
+            )
+            for name in sinks
+        }
+        self._overrunning: dict[str, concurrent.futures.Future] = {}
+
+    def run(self, jobs: dict[str, SinkJob]) -> dict[str, SinkResult]:
+        """Run jobs, by sink name, concurrently; returns their results by sink name"""
+        started_at = time.monotonic()
+        results: dict[str, SinkResult] = {}
+        futures: dict[str, concurrent.futures.Future] = {}
+        for name, job in jobs.items():
+            overrunning = self._overrunning.get(name)
+            if overrunning is not None and not overrunning.done():
+                results[name] = SinkResult(
+                    name, False, 0.0, "still busy with a previous write"
+                )
+                continue
+            self._overrunning.pop(name, None)
+            futures[name] = self._pools[name].submit(_timed, job.run)
+
+        for name, future in futures.items():
+            deadline = started_at + jobs[name].timeout_s
+            try:
+                ok, latency_s = future.result(
+                    timeout=max(0.0, deadline - time.monotonic())
+                )
+                results[name] = SinkResult(name, ok, latency_s)
+            except concurrent.futures.TimeoutError:
+                self._overrunning[name] = future
+                results[name] = SinkResult(
+                    name,
+                    False,
+                    time.monotonic() - started_at,
+                    f"timed out after {jobs[name].timeout_s:g}s",
+                )
+            except Exception as e:  # noqa: BLE001 - a sink failure shouldn't kill the poller
+                results[name] = SinkResult(
+                    name, False, time.monotonic() - started_at, str(e)
+                )
+        return results
+
+    def shutdown(self):
+        for pool in self._pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _timed(fn: Callable[[], bool]) -> tuple[bool, float]:
+    started_at = time.monotonic()
+    ok = fn()
+    return ok, time.monotonic() - started_at
@@ -1,65 +1,321 @@
 import datetime
+import gzip
+import logging
+import threading
+from collections.abc import Callable
+from typing import TYPE_CHECKING, Final
 
-from influxdb import InfluxDBClient
+from clock import SYSTEM_CLOCK, Clock
+from config import Config, DeviceConfig
+from measurement import Encoder, Measurement, encoder_for, register_encoder
+from spool import Spool
 
-import conv
-from co2 import Co2WarningLevel
-from config import Config
-from libclaranet4 import Reading
+if TYPE_CHECKING:
+    from rollup import Rollup
 
+# most buffered points kept while writes are failing; older points are dropped:
+INFLUX_MAX_BUFFERED_POINTS: Final = 50_000
+INFLUX_TIMEOUT_S: Final = 10.0
+# line protocol compresses ~10x even at low levels; higher ones just cost CPU:
+INFLUX_GZIP_LEVEL: Final = 5
 
-def write_influx(cfg: Config, reading: Reading, now: datetime.datetime) -> bool:
-    if cfg.influx_username:
-        client = InfluxDBClient(
-            host=cfg.influx_host,
-            port=cfg.influx_port,
-            username=cfg.influx_username,
-            password=cfg.influx_password,
-        )
-    else:
-        client = InfluxDBClient(
-            host=cfg.influx_host,
-            port=cfg.influx_port,
-        )
 
-    ret_pol = None
-    parts = cfg.influx_bucket.split("/")
+def split_bucket(bucket: str) -> tuple[str, str | None]:
+    """Split an influx_bucket into its database and (optional) retention policy"""
+    parts = bucket.split("/")
     if len(parts) == 1:
-        db = parts[0]
+        return parts[0], None
     elif len(parts) == 2:
-        db = parts[0]
-        ret_pol = parts[1]
+        return parts[0], parts[1]
     else:
-        raise ValueError(f"could not split into db/rp: {cfg.influx_bucket}")
+        raise ValueError(f"could not split into db/rp: {bucket}")
 
-    return client.write_points(
-        [
-            {
-                "measurement": cfg.influx_measurement_name,
-                "tags": {
-                    "aranet_name": cfg.device_name,
-                    "aranet_addr": cfg.aranet_device_address,
-                },
-                "time": now.isoformat(),
-                "fields": {
-                    "rssi": int(reading.rssi),
-                    "temp_c": float(reading.temperature),
-                    "temp_f": float(conv.celsius_to_fahrenheit(reading.temperature)),
-                    "humidity_pct": float(reading.humidity),
-                    "humidity_abs": float(
-                        conv.absolute_humidity_g_m3(
-                            reading.temperature, reading.humidity
-                        )
-                    ),
-                    "pressure_mbar": float(reading.pressure),
-                    "pressure_inHg": float(conv.mbar_to_inhg(reading.pressure)),
-                    "co2_ppm": int(reading.co2),
-                    "co2_warning_level": Co2WarningLevel.from_ppm(
-                        cfg, reading.co2
-                    ).value,
-                },
-            },
-        ],
-        database=db,
-        retention_policy=ret_pol,
+
+@register_encoder("influx")
+class InfluxEncoder(Encoder):
+    """Encodes Measurements as InfluxDB points"""
+
+    def device_parts(self, device: DeviceConfig) -> dict:
+        # shared by all of the device's points:
+        return {
+            "aranet_name": device.name,
+            "aranet_addr": device.address,
+        }
+
+    def encode_with(self, m: Measurement, tags: dict) -> dict:
+        return {
+            "measurement": self._cfg.influx_measurement_name,
+            "tags": tags,
+            "time": m.t.isoformat(),
+            "fields": m.fields(),
+        }
+
+
+def _lp_escape(s: str, chars: str) -> str:
+    for c in "\\" + chars:
+        s = s.replace(c, "\\" + c)
+    return s
+
+
+def _lp_field_value(v) -> str:
+    if isinstance(v, bool):
+        return "true" if v else "false"
+    if isinstance(v, int):
+        return f"{v}i"
+    if isinstance(v, float):
+        return repr(v)
+    return '"' + str(v).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+@register_encoder("influx_line")
+class LineProtocolEncoder(Encoder):
+    """Encodes Measurements as InfluxDB line protocol, with second precision"""
+
+    def device_parts(self, device: DeviceConfig) -> str:
+        # the measurement and tag set are the same for all of the device's lines:
+        return ",".join(
+            [
+                _lp_escape(self._cfg.influx_measurement_name, ", "),
+                f"aranet_addr={_lp_escape(device.address, ',= ')}",
+                f"aranet_name={_lp_escape(device.name, ',= ')}",
+            ]
+        )
+
+    def encode_with(self, m: Measurement, prefix: str) -> str:
+        fields = ",".join(
+            f"{_lp_escape(k, ',= ')}={_lp_field_value(v)}"
+            for k, v in m.fields().items()
+        )
+        return f"{prefix} {fields} {int(m.t.timestamp())}"
+
+
+def rollup_point(cfg: Config, r: "Rollup") -> dict:
+    """Encode a Rollup as an InfluxDB point, timestamped at its window's start"""
+    return {
+        "measurement": cfg.rollup_influx_measurement_name,
+        "tags": r.tags(),
+        "time": r.start.isoformat(),
+        "fields": r.all_fields(),
+    }
+
+
+def rollup_line(cfg: Config, r: "Rollup") -> str:
+    """Encode a Rollup as line protocol, timestamped at its window's start"""
+    tags = ",".join(f"{k}={_lp_escape(v, ',= ')}" for k, v in sorted(r.tags().items()))
+    fields = ",".join(
+        f"{_lp_escape(k, ',= ')}={_lp_field_value(v)}"
+        for k, v in r.all_fields().items()
     )
+    name = _lp_escape(cfg.rollup_influx_measurement_name, ", ")
+    return f"{name},{tags} {fields} {int(r.start.timestamp())}"
+
+
+class InfluxV2Client:
+    """Writes line protocol to the /api/v2/write endpoint of InfluxDB 2.x and 3.x.
+
+    Request bodies are gzipped, and the requests.Session's keep-alive connection
+    is reused across writes.
+    """
+
+    def __init__(self, cfg: Config):
+        host = cfg.influx_host.removesuffix("/")
+        if "://" not in host:
+            host = f"http://{host}"
+        self._url = f"{host}:{cfg.influx_port}/api/v2/write"
+        self._params = {"bucket": cfg.influx_bucket, "precision": "s"}
+        if cfg.influx_org:
+            self._params["org"] = cfg.influx_org
+        import requests
+
+        self._session = requests.Session()
+        self._session.headers.update(
+            {
+                "Authorization": f"Token {cfg.influx_token}",
+                "Content-Encoding": "gzip",
+                "Content-Type": "text/plain; charset=utf-8",
+            }
+        )
+
+    def write_lines(self, lines: list[str], batch_size: int, bucket: str | None = None):
+        """Write lines, batch_size per request; raises on failure.
+
+        bucket overrides influx_bucket.
+        """
+        params = self._params if bucket is None else self._params | {"bucket": bucket}
+        for i in range(0, len(lines), batch_size):
+            body = gzip.compress(
+                "\n".join(lines[i : i + batch_size]).encode("utf-8"),
+                compresslevel=INFLUX_GZIP_LEVEL,
+            )
+            resp = self._session.post(
+                self._url, params=params, data=body, timeout=INFLUX_TIMEOUT_S
+            )
+            if not resp.ok:
+                raise RuntimeError(f"HTTP {resp.status_code}: {resp.text.strip()}")
+
+    def close(self):
+        self._session.close()
+
+
+class InfluxWriter:
+    """A single InfluxDB client for the life of the process, which buffers points.
+
+    Buffered points are written in one request once there are batch_size of them
+    or the oldest is flush_interval_s old (0 writes them on every flush() call).
+    The client's HTTP session, and its keep-alive connection, is reused across
+    writes. Points that fail to write are moved to spool, when one is given, for
+    replay via write_spooled; otherwise, they stay buffered, up to
+    INFLUX_MAX_BUFFERED_POINTS, and are retried on the next flush.
+
+    Points are dicts for the 1.x API (via the influxdb package), and line
+    protocol strings for the 2.x API (via InfluxV2Client).
+
+    on_flushed is called, once per flush, with the (device name, time) of every
+    point in it, once they have been written or spooled. clock times the
+    buffered points' age.
+    """
+
+    def __init__(
+        self,
+        cfg: Config,
+        on_flushed: Callable[[list[tuple[str, datetime.datetime]]], None] | None = None,
+        spool: Spool | None = None,
+        clock: Clock = SYSTEM_CLOCK,
+    ):
+        self._cfg = cfg
+        self._clock = clock
+        self._on_flushed = on_flushed
+        self._spool = spool
+        # the client and buffer are shared by the poller, its sink worker, and
+        # the spool replayer threads:
+        self._lock = threading.Lock()
+        self._buffer_lock = threading.Lock()
+        self._logger = logging.getLogger(__name__)
+        # of (device name, point time, point):
+        self._buffer: list[tuple[str, datetime.datetime, dict | str]] = []
+        self._oldest_at: float | None = None  # clock.monotonic() of oldest buffered
+        self._v2 = cfg.influx_api_version == 2
+        if self._v2:
+            self._encoder = encoder_for(cfg, "influx_line")
+            self._client = InfluxV2Client(cfg)
+            return
+        from influxdb import InfluxDBClient
+
+        self._encoder = encoder_for(cfg, "influx")
+        self._db, self._retention_policy = split_bucket(cfg.influx_bucket)
+        if cfg.influx_username:
+            self._client = InfluxDBClient(
+                host=cfg.influx_host,
+                port=cfg.influx_port,
+                username=cfg.influx_username,
+                password=cfg.influx_password,
+                timeout=INFLUX_TIMEOUT_S,
+            )
+        else:
+            self._client = InfluxDBClient(
+                host=cfg.influx_host,
+                port=cfg.influx_port,
+                timeout=INFLUX_TIMEOUT_S,
+            )
+
+    @staticmethod
+    def spool_name(cfg: Config) -> str:
+        # the two APIs' points are spooled differently, so keep them apart:
+        return "influx" if cfg.influx_api_version == 1 else "influx-v2"
+
+    def add(self, m: Measurement):
+        point = self._encoder.encode(m)
+        with self._buffer_lock:
+            self._buffer.append((m.device.name, m.t, point))
+            if self._oldest_at is None:
+                self._oldest_at = self._clock.monotonic()
+            self._trim_buffer()
+
+    def flush_due(self) -> bool:
+        with self._buffer_lock:
+            if not self._buffer:
+                return False
+            return (
+                len(self._buffer) >= self._cfg.influx_batch_size
+                or self._clock.monotonic() - self._oldest_at
+                >= self._cfg.influx_flush_interval_s
+            )
+
+    def flush(self) -> bool:
+        """Write all buffered points; returns whether that succeeded"""
+        with self._buffer_lock:
+            batch, self._buffer = self._buffer, []
+            oldest_at, self._oldest_at = self._oldest_at, None
+        if not batch:
+            return True
+        ok = self.write_points([p for _, _, p in batch])
+        if not ok:
+            if self._spool is None:
+                # put the batch back, ahead of anything added during the write:
+                with self._buffer_lock:
+                    self._buffer = batch + self._buffer
+                    self._oldest_at = oldest_at
+                    self._trim_buffer()
+                return False
+            self._spool.append([self._spool_record(p) for _, _, p in batch])
+        if self._on_flushed is not None:
+            self._on_flushed([(device_name, t) for device_name, t, _ in batch])
+        return ok
+
+    def write(self, measurements: list[Measurement]) -> bool:
+        """Write measurements right away, bypassing the buffer"""
+        return self.write_points([self._encoder.encode(m) for m in measurements])
+
+    def _trim_buffer(self):
+        overflow = len(self._buffer) - INFLUX_MAX_BUFFERED_POINTS
+        if overflow > 0:
+            self._logger.warning(f"influx buffer full; dropping {overflow} points")
+            del self._buffer[:overflow]
+
+    def close(self):
+        self._client.close()
+
+    def write_spooled(self, records: list[dict]) -> bool:
+        """Write records from the spool"""
+        if self._v2:
+            return self.write_points([r["line"] for r in records])
+        return self.write_points(records)
+
+    def _spool_record(self, point: dict | str) -> dict:
+        return {"line": point} if self._v2 else point
+
+    def write_rollups(self, rollups: list["Rollup"]) -> bool:
+        """Write rollups right away, to rollup_influx_bucket"""
+        if self._v2:
+            lines = [rollup_line(self._cfg, r) for r in rollups]
+            return self.write_points(lines, bucket=self._cfg.rollup_influx_bucket)
+        points = [rollup_point(self._cfg, r) for r in rollups]
+        return self.write_points(points, bucket=self._cfg.rollup_influx_bucket)
+
+    def write_points(
+        self, points: list[dict] | list[str], bucket: str | None = None
+    ) -> bool:
+        """Write points; bucket overrides influx_bucket"""
+        try:
+            with self._lock:
+                if self._v2:
+                    self._client.write_lines(
+                        points, self._cfg.influx_batch_size, bucket=bucket
+                    )
+                    ok = True
+                else:
+                    db, retention_policy = self._db, self._retention_policy
+                    if bucket is not None:
+                        db, retention_policy = split_bucket(bucket)
+                    ok = self._client.write_points(
+                        points,
+                        database=db,
+                        retention_policy=retention_policy,
+                        batch_size=self._cfg.influx_batch_size,
+                    )
+            if ok:
+                return True
+            self._logger.error("influx write failed")
+        except Exception as e:  # noqa: BLE001 - an influx failure shouldn't kill the poller
+            self._logger.error(f"influx write failed: {e}")
+        return False
@@ -0,0 +1,79 @@
+import datetime
+import hashlib
+import json
+import struct
+from dataclasses import dataclass
+from typing import Final
+
+from measurement import Measurement
+
+# etag, then last_modified as a Unix time, then the body:
+_PACKED_HEADER: Final = struct.Struct("<16sd")
+
+
+@dataclass(frozen=True)
+class LatestReadings:
+    """The latest reading from every device, serialized once for all requests"""
+
+    body: bytes  # JSON
+    etag: str
+    last_modified: datetime.datetime  # time of the newest reading
+
+    def pack(self) -> bytes:
+        """Serialize for a SharedBuffer; unpack() reverses this"""
+        return (
+            _PACKED_HEADER.pack(
+                self.etag.encode("ascii"), self.last_modified.timestamp()
+            )
+            + self.body
+        )
+
+    @staticmethod
+    def unpack(data: bytes) -> "LatestReadings | None":
+        """Deserialize pack()'s output; returns None for an empty buffer"""
+        if not data:
+            return None
+        etag, ts = _PACKED_HEADER.unpack_from(data)
+        return LatestReadings(
+            body=data[_PACKED_HEADER.size :],
+            etag=etag.decode("ascii"),
+            last_modified=datetime.datetime.fromtimestamp(ts, datetime.UTC),
+        )
+
+
+class LatestTracker:
+    """Keeps each device's latest Measurement, and snapshots them as LatestReadings"""
+
+    def __init__(self):
+        self._latest: dict[str, Measurement] = {}  # by device name
+
+    def update(self, measurements: list[Measurement]) -> LatestReadings | None:
+        """Record new measurements; returns a new snapshot, or None if there were none"""
+        if not measurements:
+            return None
+        for m in measurements:
+            self._latest[m.device.name] = m
+        body = json.dumps(
+            {
+                "devices": {
+                    name: {
+                        "time": m.t.isoformat(),
+                        "co2_ppm": m.co2_ppm,
+                        "co2_warning_level": m.co2_level.value,
+                        "temp_c": m.temp_c,
+                        "temp_f": m.temp_f,
+                        "humidity_pct": m.humidity_pct,
+                        "humidity_abs": m.humidity_abs,
+                        "pressure_mbar": m.pressure_mbar,
+                        "pressure_inHg": m.pressure_inhg,
+                        "rssi": m.rssi,
+                    }
+                    for name, m in self._latest.items()
+                }
+            }
+        ).encode("utf-8")
+        return LatestReadings(
+            body=body,
+            etag=hashlib.blake2b(body, digest_size=8).hexdigest(),
+            last_modified=max(m.t for m in self._latest.values()),
+        )
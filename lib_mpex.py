@@ -38,6 +38,20 @@ def reset_signal_handlers():
     signal.signal(signal.SIGTERM, signal.SIG_DFL)
 
 
+def exit_on_sigterm():
+    """Make SIGTERM raise SystemExit in a child process, so its finally blocks run.
+
+    For children with cleanup to do on the way out, like flushing buffered
+    writes. The parent kills a child that's still alive after a grace period,
+    so a non-daemon thread can only delay its exit by that long.
+    """
+    signal.signal(signal.SIGTERM, _exit)
+
+
+def _exit(signum, frame):
+    sys.exit(0)
+
+
 class ChildProcess(ABC):
     @abstractmethod
     def _run(self):
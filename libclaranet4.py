@@ -1,7 +1,17 @@
 import asyncio
+import datetime
+import logging
+import math
+import struct
+import time
+from collections.abc import Callable
 from dataclasses import dataclass
+from typing import Final
 
 from bleak import BleakClient, BleakScanner
+from bleak.backends.device import BLEDevice
+
+from clock import SYSTEM_CLOCK, Clock
 
 #
 # This file taken from https://github.com/bede/claranet4 at commit
@@ -10,10 +20,54 @@ from bleak import BleakClient, BleakScanner
 #
 
 
+UUID_CURRENT_MEASUREMENTS_SIMPLE: Final = "f0cd1503-95da-4f4b-9ac8-aa55d312af0c"
+# the simple measurements, then the measurement interval and seconds since the
+# last measurement:
+UUID_CURRENT_MEASUREMENTS_DETAILED: Final = "f0cd3001-95da-4f4b-9ac8-aa55d312af0c"
+UUID_COMMAND: Final = "f0cd1402-95da-4f4b-9ac8-aa55d312af0c"
+UUID_TOTAL_READINGS: Final = "f0cd2001-95da-4f4b-9ac8-aa55d312af0c"
+UUID_INTERVAL: Final = "f0cd2002-95da-4f4b-9ac8-aa55d312af0c"
+UUID_SECONDS_SINCE_UPDATE: Final = "f0cd2004-95da-4f4b-9ac8-aa55d312af0c"
+UUID_HISTORY_V2: Final = "f0cd2005-95da-4f4b-9ac8-aa55d312af0c"
+_CMD_HISTORY_V2: Final = 0x61
+# history parameter ids:
+_HISTORY_TEMPERATURE: Final = 1
+_HISTORY_HUMIDITY: Final = 2
+_HISTORY_PRESSURE: Final = 3
+_HISTORY_CO2: Final = 4
+# param, interval, total readings, seconds since update, start index, count:
+_HISTORY_HEADER: Final = struct.Struct("<BHHHHB")
+RECONNECT_MIN_BACKOFF_S: Final = 5.0
+RECONNECT_MAX_BACKOFF_S: Final = 300.0
+DISCOVERY_TTL_S: Final = 3600.0
+ARANET_MANUFACTURER_ID: Final = 0x0702
+# bit set in the first manufacturer data byte when "Smart Home integration" is
+# enabled, and the advertisement carries current measurements:
+_ADV_FLAG_INTEGRATIONS: Final = 0b00100000
+_ADV_MEASUREMENTS_OFFSET: Final = 7
+_ADV_MEASUREMENTS_LEN: Final = 14
+# offsets in the current-readings characteristics, and in advertised measurements,
+# of the battery level (in percent), then of the measurement interval and the
+# seconds since the last measurement (in the detailed characteristic only):
+_BATTERY_OFFSET: Final = 7
+_INTERVAL_OFFSET: Final = 9
+_AGO_OFFSET: Final = 11
+
+
 class BTIOError(RuntimeError):
     pass
 
 
+# called with the name of a stage of a read (e.g. "ble.scan") and its duration:
+StageCallback = Callable[[str, float], None]
+
+
+def _report(on_stage: StageCallback | None, stage: str, started_at: float):
+    """Report the time since started_at (from time.monotonic()) to on_stage"""
+    if on_stage is not None:
+        on_stage(stage, time.monotonic() - started_at)
+
+
 @dataclass
 class Device:
     address: str
@@ -22,7 +76,12 @@ class Device:
 
 
 class Reading:
-    def __init__(self, device: Device, response: bytearray):
+    def __init__(
+        self,
+        device: Device,
+        response: bytearray,
+        received_at: datetime.datetime | None = None,
+    ):
         self.name: str = device.name
         self.address: str = device.address
         self.rssi: int = device.rssi
@@ -31,6 +90,123 @@ class Reading:
         self.pressure: float = round(_le16(response, 4) / 10, 1)  # millibar
         # relative humidity in percent (range 0-100)
         self.humidity: float = round(_le16(response, 5) / 255, 1)
+        # percent; None if the response doesn't include it:
+        self.battery: int | None = (
+            response[_BATTERY_OFFSET] if len(response) > _BATTERY_OFFSET else None
+        )
+        # how often the device measures, and how long ago it last did, in
+        # seconds; None if the response doesn't include them:
+        self.interval_s: int | None = None
+        self.ago_s: int | None = None
+        if len(response) >= _AGO_OFFSET + 2:
+            self.interval_s = _le16(response, _INTERVAL_OFFSET)
+            self.ago_s = _le16(response, _AGO_OFFSET)
+        self.received_at = received_at or datetime.datetime.now(datetime.UTC)
+
+    @property
+    def sampled_at(self) -> datetime.datetime:
+        """When the device took the measurement, if it said; else when it arrived"""
+        if self.ago_s is None:
+            return self.received_at
+        return self.received_at - datetime.timedelta(seconds=self.ago_s)
+
+    @staticmethod
+    def from_values(
+        device: Device,
+        co2: int,
+        temperature: float,
+        pressure: float,
+        humidity: float,
+        battery: int | None = None,
+    ) -> "Reading":
+        result = Reading(
+            device,
+            bytearray(
+                struct.pack(
+                    "<HHHB", co2, round(temperature * 20), round(pressure * 10), 0
+                )
+            ),
+        )
+        result.humidity = float(humidity)
+        result.battery = battery
+        return result
+
+    @staticmethod
+    def from_advertisement(
+        device: Device, manufacturer_data: bytes
+    ) -> "Reading | None":
+        """Decode the Aranet4 manufacturer data from a BLE advertisement.
+
+        Returns None if the advertisement carries no measurements, which is
+        the case unless "Smart Home integration" is enabled on the device. The
+        layout is the one decoded by https://github.com/Anrijs/Aranet4-Python :
+        a flags byte, firmware version and status bytes, then the same
+        measurements as the current-readings characteristic.
+        """
+        data = bytes(manufacturer_data)
+        end = _ADV_MEASUREMENTS_OFFSET + _ADV_MEASUREMENTS_LEN
+        if len(data) < end or not data[0] & _ADV_FLAG_INTEGRATIONS:
+            return None
+        measurements = data[_ADV_MEASUREMENTS_OFFSET:end]
+        result = Reading(device, bytearray(measurements))
+        result.humidity = float(measurements[6])
+        return result
+
+
+@dataclass
+class _Discovered:
+    ble_device: BLEDevice
+    rssi: int
+    seen_at: float  # Clock.monotonic()
+
+
+class DiscoveryCache:
+    """Remembers the BLEDevice, and latest advertised RSSI, for each address seen.
+
+    Connecting to a cached BLEDevice skips the scan that resolving an address
+    otherwise takes. Entries older than ttl_s aren't used for connecting (ttl_s=0
+    disables that), but their RSSI is still the freshest known, updated by any
+    scan that sees the device; age_s() tells how old it is.
+    """
+
+    def __init__(self, ttl_s: float = DISCOVERY_TTL_S, clock: Clock = SYSTEM_CLOCK):
+        self.ttl_s = ttl_s
+        self._clock = clock
+        self._entries: dict[str, _Discovered] = {}
+
+    def record(self, ble_device: BLEDevice, rssi: int):
+        self._entries[ble_device.address.lower()] = _Discovered(
+            ble_device=ble_device, rssi=rssi, seen_at=self._clock.monotonic()
+        )
+
+    def lookup(self, address: str) -> BLEDevice | None:
+        """Return the cached BLEDevice for address, if it's fresh enough to use"""
+        entry = self._entries.get(address.lower())
+        if entry is None or self._clock.monotonic() - entry.seen_at >= self.ttl_s:
+            return None
+        return entry.ble_device
+
+    def age_s(self, address: str) -> float | None:
+        """Return how long ago a scan last saw address, if one has"""
+        entry = self._entries.get(address.lower())
+        if entry is None:
+            return None
+        return self._clock.monotonic() - entry.seen_at
+
+    def device(self, address: str) -> Device | None:
+        """Return the Device for address with its latest known RSSI, at any age"""
+        entry = self._entries.get(address.lower())
+        if entry is None:
+            return None
+        return Device(
+            address=entry.ble_device.address,
+            name=str(entry.ble_device.name),
+            rssi=entry.rssi,
+        )
+
+    def invalidate(self, address: str):
+        """Forget the BLEDevice for address, e.g. after connecting to it failed"""
+        self._entries.pop(address.lower(), None)
 
 
 def _le16(data: bytearray, start: int = 0) -> int:
@@ -39,9 +215,44 @@ def _le16(data: bytearray, start: int = 0) -> int:
     return raw[start] + (raw[start + 1] << 8)
 
 
-async def _discover() -> list[Device]:
+def _parse_history_chunk(param: int, data: bytes) -> tuple[int, list[int]]:
+    """Parse a history characteristic read into (first index, raw values)"""
+    data = bytes(data)
+    got_param, _, _, _, start, count = _HISTORY_HEADER.unpack_from(data)
+    if got_param != param:
+        raise BTIOError(f"expected history for parameter {param}, got {got_param}")
+    fmt = "<B" if param == _HISTORY_HUMIDITY else "<H"
+    size = struct.calcsize(fmt)
+    body = data[_HISTORY_HEADER.size :]
+    count = min(count, len(body) // size)
+    return start, [struct.unpack_from(fmt, body, i * size)[0] for i in range(count)]
+
+
+def history_indexes(
+    since: datetime.datetime,
+    newest_t: datetime.datetime,
+    total: int,
+    interval_s: int,
+) -> range:
+    """Indexes (1-based, oldest first) of the history records taken after since.
+
+    Record i of total was taken (total - i) intervals before the newest, which
+    was taken at newest_t.
+    """
+    if total < 1 or interval_s < 1:
+        return range(1, 1)
+    newer = math.ceil((newest_t - since).total_seconds() / interval_s)
+    if newer < 1:
+        return range(1, 1)
+    return range(max(1, total - newer + 1), total + 1)
+
+
+async def _discover(cache: DiscoveryCache | None = None) -> list[Device]:
     """Return list of Devices sorted by descending RSSI dBm"""
     found = await BleakScanner.discover(return_adv=True)
+    if cache is not None:
+        for d, adv in found.values():
+            cache.record(d, adv.rssi)
     devices = [
         Device(address=d.address, name=str(d.name), rssi=adv.rssi)
         for d, adv in found.values()
@@ -51,9 +262,8 @@ async def _discover() -> list[Device]:
 
 async def _request_measurements(address: str) -> bytearray:
     """Request measurements bytearray for target address"""
-    UUID_CURRENT_MEASUREMENTS_SIMPLE = "f0cd1503-95da-4f4b-9ac8-aa55d312af0c"
     async with BleakClient(address) as client:
-        return await client.read_gatt_char(UUID_CURRENT_MEASUREMENTS_SIMPLE)
+        return await client.read_gatt_char(UUID_CURRENT_MEASUREMENTS_DETAILED)
 
 
 def scan(runner: asyncio.Runner) -> list[Device]:
@@ -66,8 +276,8 @@ def scan_ara4s(runner: asyncio.Runner) -> list[Device]:
     return [d for d in scan(runner) if "Aranet4" in d.name]
 
 
-async def _find_device(address: str) -> Device | None:
-    """Find Device by address, including its RSSI from advertisement data"""
+async def _scan_for(address: str) -> tuple[BLEDevice, int] | None:
+    """Scan for the BLEDevice with address; return it and its advertised RSSI"""
     address = address.lower()
     rssi_by_address: dict[str, int] = {}
 
@@ -80,10 +290,19 @@ async def _find_device(address: str) -> Device | None:
     ble_device = await BleakScanner.find_device_by_filter(_matches)
     if not ble_device:
         return None
+    return ble_device, rssi_by_address[ble_device.address]
+
+
+async def _find_device(address: str) -> Device | None:
+    """Find Device by address, including its RSSI from advertisement data"""
+    found = await _scan_for(address)
+    if not found:
+        return None
+    ble_device, rssi = found
     return Device(
         address=ble_device.address,
         name=str(ble_device.name),
-        rssi=rssi_by_address[ble_device.address],
+        rssi=rssi,
     )
 
 
@@ -96,9 +315,24 @@ def find_device(runner: asyncio.Runner, address) -> Device:
         raise BTIOError(f"could not find device {address}")
 
 
+async def read_ara4_async(
+    address: str, on_stage: StageCallback | None = None
+) -> Reading:
+    """Read from the device at address; safe to run concurrently for many devices"""
+    started_at = time.monotonic()
+    device = await _find_device(address)
+    _report(on_stage, "ble.scan", started_at)
+    if not device:
+        raise BTIOError(f"could not find device {address}")
+    started_at = time.monotonic()
+    measurements = await _request_measurements(device.address)
+    _report(on_stage, "ble.connect_read", started_at)
+    return Reading(device, measurements)
+
+
 def read_ara4(runner: asyncio.Runner, address: str = "") -> Reading:
     if address:
-        device = find_device(runner, address)
+        return runner.run(read_ara4_async(address))
     else:
         ara4_devices = scan_ara4s(runner)
         if not ara4_devices:
@@ -107,3 +341,311 @@ def read_ara4(runner: asyncio.Runner, address: str = "") -> Reading:
             device = ara4_devices[0]
     measurements = runner.run(_request_measurements(device.address))
     return Reading(device, measurements)
+
+
+class BleBackend:
+    """How Ara4Connection reaches devices: over Bluetooth, via bleak.
+
+    A subclass can stand in for the radio, as fakeble.FakeBackend does for
+    simulations. Clients only need BleakClient's connect(), disconnect(),
+    is_connected, read_gatt_char(), and write_gatt_char().
+    """
+
+    async def scan_for(self, address: str) -> tuple[BLEDevice, int] | None:
+        """Scan for the BLEDevice with address; return it and its advertised RSSI"""
+        return await _scan_for(address)
+
+    def client(
+        self,
+        ble_device: BLEDevice,
+        disconnected_callback: Callable[[BleakClient], None],
+    ) -> BleakClient:
+        return BleakClient(ble_device, disconnected_callback=disconnected_callback)
+
+
+class Ara4Connection:
+    """A long-lived connection to one Aranet4, reused across reads.
+
+    The connection is opened lazily on the first read and kept open between
+    reads, so a read is usually a single GATT characteristic read. When the
+    link drops, the next read reconnects; consecutive failed connection attempts
+    back off exponentially, from min_backoff_s up to max_backoff_s. With
+    keep_connected=False, the connection is closed after every read instead
+    (useful with more devices than the adapter can hold connections to).
+
+    Connections are opened to the device's BLEDevice from cache, when it's
+    there, skipping the scan; a failed connection to a cached BLEDevice falls
+    back to a fresh scan. Readings carry the latest RSSI in the cache. A
+    connected device doesn't advertise, so its RSSI can't be refreshed by a
+    scan; a connection kept open for longer than the cache's ttl_s is closed and
+    reopened after a fresh scan, so readings' RSSI is never older than that.
+
+    on_stage, if given, is called with the duration of every scan ("ble.scan"),
+    connection attempt ("ble.connect"), and measurement read ("ble.read").
+
+    backend reaches the device (BleBackend, by default), and clock times the
+    backoff and timestamps readings.
+    """
+
+    def __init__(
+        self,
+        address: str,
+        cache: DiscoveryCache | None = None,
+        keep_connected: bool = True,
+        min_backoff_s: float = RECONNECT_MIN_BACKOFF_S,
+        max_backoff_s: float = RECONNECT_MAX_BACKOFF_S,
+        on_stage: StageCallback | None = None,
+        backend: BleBackend | None = None,
+        clock: Clock = SYSTEM_CLOCK,
+    ):
+        self.address = address
+        self.cache = cache if cache is not None else DiscoveryCache()
+        self.keep_connected = keep_connected
+        self.min_backoff_s = min_backoff_s
+        self.max_backoff_s = max_backoff_s
+        self.connects = 0  # successful connections opened
+        self.last_lifetime_s: float | None = None  # of the last closed connection
+        self._logger = logging.getLogger(__name__)
+        self._client: BleakClient | None = None
+        self._device: Device | None = None
+        self._connected_at: float | None = None
+        self._failures = 0
+        self._retry_at = 0.0
+        self._on_stage = on_stage
+        self._backend = backend if backend is not None else BleBackend()
+        self._clock = clock
+
+    @property
+    def is_connected(self) -> bool:
+        return self._client is not None and self._client.is_connected
+
+    async def read(self) -> Reading:
+        client = await self._ensure_connected()
+        started_at = time.monotonic()
+        try:
+            measurements = await client.read_gatt_char(
+                UUID_CURRENT_MEASUREMENTS_DETAILED
+            )
+        except Exception:
+            await self.close("read failed")
+            raise
+        finally:
+            _report(self._on_stage, "ble.read", started_at)
+        if not self.keep_connected:
+            await self.close("keep_connected is off")
+        return Reading(
+            self.cache.device(self.address) or self._device,
+            measurements,
+            received_at=self._clock.now(),
+        )
+
+    async def read_history(
+        self, since: datetime.datetime, limit: int
+    ) -> list[tuple[datetime.datetime, Reading]]:
+        """Download up to limit of the oldest history records taken after since.
+
+        Returns (time taken, Reading) pairs, oldest first. Readings carry the
+        current RSSI, since the device doesn't record it.
+        """
+        client = await self._ensure_connected()
+        try:
+            interval_s = _le16(await client.read_gatt_char(UUID_INTERVAL))
+            total = _le16(await client.read_gatt_char(UUID_TOTAL_READINGS))
+            ago_s = _le16(await client.read_gatt_char(UUID_SECONDS_SINCE_UPDATE))
+            newest_t = self._clock.now() - datetime.timedelta(seconds=ago_s)
+            indexes = history_indexes(since, newest_t, total, interval_s)[:limit]
+            if not indexes:
+                return []
+            values = {
+                param: await self._read_history_param(
+                    client, param, indexes.start, indexes.stop - 1
+                )
+                for param in (
+                    _HISTORY_CO2,
+                    _HISTORY_TEMPERATURE,
+                    _HISTORY_PRESSURE,
+                    _HISTORY_HUMIDITY,
+                )
+            }
+        except Exception:
+            await self.close("history read failed")
+            raise
+        if not self.keep_connected:
+            await self.close("keep_connected is off")
+
+        device = self.cache.device(self.address) or self._device
+        return [
+            (
+                newest_t - datetime.timedelta(seconds=(total - i) * interval_s),
+                Reading.from_values(
+                    device,
+                    co2=values[_HISTORY_CO2][n],
+                    temperature=values[_HISTORY_TEMPERATURE][n] / 20,
+                    pressure=values[_HISTORY_PRESSURE][n] / 10,
+                    humidity=values[_HISTORY_HUMIDITY][n],
+                ),
+            )
+            for n, i in enumerate(indexes)
+            if all(n < len(v) for v in values.values())
+        ]
+
+    async def _read_history_param(
+        self, client: BleakClient, param: int, start: int, end: int
+    ) -> list[int]:
+        """Read raw history values for param, indexes start through end"""
+        result: list[int] = []
+        while start + len(result) <= end:
+            await client.write_gatt_char(
+                UUID_COMMAND,
+                struct.pack("<BBH", _CMD_HISTORY_V2, param, start + len(result)),
+                response=True,
+            )
+            _, chunk = _parse_history_chunk(
+                param, await client.read_gatt_char(UUID_HISTORY_V2)
+            )
+            if not chunk:
+                break
+            result.extend(chunk)
+        return result[: end - start + 1]
+
+    async def close(self, reason: str = "closed"):
+        client, self._client = self._client, None
+        if client is None:
+            return
+        self._record_lifetime(reason)
+        try:
+            await client.disconnect()
+        except Exception as e:  # noqa: BLE001 - the link may already be gone
+            self._logger.debug(f"{self.address}: error disconnecting: {e}")
+
+    async def _ensure_connected(self) -> BleakClient:
+        if self.is_connected:
+            if not self._rssi_expired():
+                return self._client
+            await self.close("refreshing RSSI")
+        if self._client is not None:
+            # the link dropped since the last read:
+            await self.close("link dropped")
+
+        wait_s = self._retry_at - self._clock.monotonic()
+        if wait_s > 0:
+            raise BTIOError(
+                f"not reconnecting to {self.address} for another {wait_s:.0f}s "
+                f"after {self._failures} failed attempts"
+            )
+
+        try:
+            client = await self._connect()
+        except Exception:
+            self._failures += 1
+            backoff_s = min(
+                self.max_backoff_s, self.min_backoff_s * 2 ** (self._failures - 1)
+            )
+            self._retry_at = self._clock.monotonic() + backoff_s
+            raise
+
+        self._failures = 0
+        self._retry_at = 0.0
+        self._client = client
+        self._device = self.cache.device(self.address)
+        self._connected_at = self._clock.monotonic()
+        self.connects += 1
+        self._logger.debug(f"{self.address}: connected (connection #{self.connects})")
+        return client
+
+    async def _connect(self) -> BleakClient:
+        ble_device = self.cache.lookup(self.address)
+        if ble_device is not None:
+            client = self._backend.client(ble_device, self._on_disconnect)
+            started_at = time.monotonic()
+            try:
+                await client.connect()
+                return client
+            except Exception as e:  # noqa: BLE001 - retried below after a scan
+                self._logger.debug(
+                    f"{self.address}: connecting to cached device failed ({e}); "
+                    f"rescanning"
+                )
+                self.cache.invalidate(self.address)
+            finally:
+                _report(self._on_stage, "ble.connect", started_at)
+
+        started_at = time.monotonic()
+        found = await self._backend.scan_for(self.address)
+        _report(self._on_stage, "ble.scan", started_at)
+        if not found:
+            raise BTIOError(f"could not find device {self.address}")
+        self.cache.record(*found)
+        client = self._backend.client(found[0], self._on_disconnect)
+        started_at = time.monotonic()
+        try:
+            await client.connect()
+        finally:
+            _report(self._on_stage, "ble.connect", started_at)
+        return client
+
+    def _rssi_expired(self) -> bool:
+        if self.cache.ttl_s <= 0:
+            return False
+        age_s = self.cache.age_s(self.address)
+        return age_s is None or age_s >= self.cache.ttl_s
+
+    def _on_disconnect(self, client: BleakClient):
+        if client is self._client:
+            self._record_lifetime("disconnected by device or adapter")
+
+    def _record_lifetime(self, reason: str):
+        if self._connected_at is None:
+            return
+        self.last_lifetime_s = self._clock.monotonic() - self._connected_at
+        self._connected_at = None
+        log = self._logger.debug if not self.keep_connected else self._logger.info
+        log(
+            f"{self.address}: connection closed after {self.last_lifetime_s:.0f}s "
+            f"({reason})"
+        )
+
+
+class AdvertisementListener:
+    """Collects Readings from Aranet4 advertisements, without connecting.
+
+    A single continuous scan hears every device in range, so this scales to any
+    number of devices with "Smart Home integration" enabled. If addresses is
+    given, only those devices' advertisements are decoded. Every advertisement
+    seen also refreshes the discovery cache, when one is given.
+    """
+
+    def __init__(
+        self,
+        addresses: list[str] | None = None,
+        cache: DiscoveryCache | None = None,
+    ):
+        self._addresses = {a.lower() for a in addresses} if addresses else None
+        self._cache = cache
+        self._latest: dict[str, Reading] = {}  # by lowercased address
+        self._scanner = BleakScanner(detection_callback=self._on_advertisement)
+
+    async def start(self):
+        await self._scanner.start()
+
+    async def stop(self):
+        await self._scanner.stop()
+
+    def pop_readings(self) -> dict[str, Reading]:
+        """Return the latest Reading per (lowercased) address since the last call"""
+        result, self._latest = self._latest, {}
+        return result
+
+    def _on_advertisement(self, d: BLEDevice, adv):
+        address = d.address.lower()
+        if self._addresses is not None and address not in self._addresses:
+            return
+        if self._cache is not None:
+            self._cache.record(d, adv.rssi)
+        manufacturer_data = adv.manufacturer_data.get(ARANET_MANUFACTURER_ID)
+        if manufacturer_data is None:
+            return
+        device = Device(address=d.address, name=str(d.name), rssi=adv.rssi)
+        reading = Reading.from_advertisement(device, manufacturer_data)
+        if reading is not None:
+            self._latest[address] = reading
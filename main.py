@@ -1,26 +1,33 @@
+from __future__ import annotations
+
 import argparse
 import asyncio
 import logging
 import multiprocessing
+import os
 import queue
 import signal
 import sys
+import tempfile
 import time
 import traceback
-from typing import Final
+from typing import TYPE_CHECKING, Final
 
 import lib_mpex
-from aranet import ara_scan
 from config import Config
 from log import LOG_DEFAULT_FMT
-from ntfy import Notifier
-from poller import Poller
-from web import WebServer
+from shared import LATEST_CAPACITY_B, METRICS_CAPACITY_B, SharedBuffer, SharedState
+
+if TYPE_CHECKING:
+    from ntfy import Notifier, NotifyInbox
+    from poller import Poller
+    from web import WebServer
 
 CHILD_CHECK_INTERVAL_S: Final = 5.0
 # bounds shutdown so a wedged child doesn't outlive the supervisor's own
 # grace period under launchd or systemd:
 CHILD_SHUTDOWN_TIMEOUT_S: Final = 5.0
+DEFAULT_TRACE_FILE: Final = os.path.join(tempfile.gettempdir(), "an4mon-trace.jsonl")
 
 
 def main():
@@ -47,16 +54,35 @@ def main():
         required=False,
         action="store_true",
     )
+    parser.add_argument(
+        "--single-process",
+        help=(
+            "Run the poller, notifier, and web server in one process, on one "
+            "event loop, using less memory"
+        ),
+        required=False,
+        action="store_true",
+    )
     parser.add_argument(
         "--debug",
-        help="Print debug-level logs (to stderr)",
+        help="Print debug-level logs (to stderr), and trace stage timings",
         required=False,
         action="store_true",
     )
+    parser.add_argument(
+        "--trace-file",
+        help=(
+            "JSON lines file to trace stage timings to, with --debug "
+            f"(default: {DEFAULT_TRACE_FILE})"
+        ),
+        required=False,
+        default=DEFAULT_TRACE_FILE,
+    )
     args = parser.parse_args()
 
     logger = logging.getLogger("main")
     ll = logging.DEBUG if args.debug else logging.INFO
+    trace_path = args.trace_file if args.debug else None
     logging.basicConfig(level=ll, format=LOG_DEFAULT_FMT)
 
     if sys.version_info < (3, 12):
@@ -71,55 +97,62 @@ def main():
         sys.exit(1)
 
     if args.scan:
+        from aranet import ara_scan
+
         with asyncio.Runner() as scan_runner:
             ara_scan(scan_runner)
             sys.exit(0)
 
     cfg = Config.from_file(args.config)
-    if not cfg.influx and not cfg.notify and not cfg.mqtt and not args.print:
+    if (
+        not cfg.influx
+        and not cfg.notify
+        and not cfg.mqtt
+        and not cfg.store
+        and not args.print
+    ):
         print(
-            "config's 'influx', 'notify', and 'mqtt' keys are all False, "
+            "config's 'influx', 'notify', 'mqtt', and 'store' keys are all False, "
             "and --print was not given; nothing to do!"
         )
         sys.exit(1)
 
+    def handle_sigterm(signum, frame):
+        logger.info("received SIGTERM; exiting ...")
+        sys.exit(0)
+
+    if args.single_process:
+        signal.signal(signal.SIGTERM, handle_sigterm)
+        try:
+            sys.exit(
+                asyncio.run(run_single_process(logger, cfg, ll, args.print, trace_path))
+            )
+        except KeyboardInterrupt:
+            logger.info("interrupted; exiting ...")
+            sys.exit(130)
+
     exit_queue = multiprocessing.Queue()
+    ntfy_queue = multiprocessing.Queue() if cfg.notify else None
+    web_server, notifier, poller = build_children(
+        cfg, ntfy_queue, ll, args.print, trace_path
+    )
     procs = []
-
-    ntfy_queue = None
-    health_ns = None
-    if cfg.notify:
-        ntfy_queue = multiprocessing.Queue()
-        mute_ns = None
-        if cfg.web_external_base_url:
-            web_manager = multiprocessing.Manager()
-            mute_ns = web_manager.Namespace()
-            mute_ns.mute_until = None
-            health_ns = web_manager.Namespace()
-            health_ns.last_poll_at = None
-            web_server = WebServer(cfg, mute_ns, health_ns, ntfy_queue, log_level=ll)
-            procs.append(
-                multiprocessing.Process(
-                    target=web_server.run, args=(exit_queue,), name="WebServer"
-                )
+    if web_server is not None:
+        procs.append(
+            multiprocessing.Process(
+                target=web_server.run, args=(exit_queue,), name="WebServer"
             )
-        notifier = Notifier(cfg, ntfy_queue, log_level=ll, mute_ns=mute_ns)
+        )
+    if notifier is not None:
         procs.append(
             multiprocessing.Process(
                 target=notifier.run, args=(exit_queue,), name="Notifier"
             )
         )
-    poller = Poller(
-        cfg, ntfy_queue, log_level=ll, print_readings=args.print, health_ns=health_ns
-    )
     procs.append(
         multiprocessing.Process(target=poller.run, args=(exit_queue,), name="Poller")
     )
 
-    def handle_sigterm(signum, frame):
-        logger.info("received SIGTERM; exiting ...")
-        sys.exit(0)
-
     # registered before starting children, so a signal arriving mid-startup
     # doesn't kill this process and orphan them:
     signal.signal(signal.SIGTERM, handle_sigterm)
@@ -154,6 +187,108 @@ def main():
                 p.join()
 
 
+def build_children(
+    cfg: Config,
+    ntfy_queue: multiprocessing.Queue | NotifyInbox | None,
+    log_level: int,
+    print_readings: bool,
+    trace_path: str | None,
+) -> tuple[WebServer | None, Notifier | None, Poller]:
+    """Build the web server and notifier (if configured), and the poller.
+
+    Each is imported only if it's configured, so the dependencies of what isn't
+    (Flask and waitress, for the web server) are never loaded.
+    """
+    from poller import Poller
+
+    state = None
+    latest_buf = None
+    poller_metrics_buf = None
+    notifier_metrics_buf = None
+    web_server = None
+    notifier = None
+    if cfg.web_server_enabled():
+        # shared memory, inherited by child processes:
+        state = SharedState()
+        latest_buf = SharedBuffer(LATEST_CAPACITY_B)
+        poller_metrics_buf = SharedBuffer(METRICS_CAPACITY_B)
+        notifier_metrics_buf = SharedBuffer(METRICS_CAPACITY_B)
+        from web import WebServer
+
+        web_server = WebServer(
+            cfg,
+            state,
+            latest_buf,
+            [poller_metrics_buf, notifier_metrics_buf],
+            ntfy_queue,
+            log_level=log_level,
+        )
+    if cfg.notify:
+        from ntfy import Notifier
+
+        notifier = Notifier(
+            cfg,
+            ntfy_queue,
+            log_level=log_level,
+            state=state,
+            metrics_buf=notifier_metrics_buf,
+            trace_path=trace_path,
+        )
+    poller = Poller(
+        cfg,
+        ntfy_queue,
+        log_level=log_level,
+        print_readings=print_readings,
+        state=state,
+        latest_buf=latest_buf,
+        metrics_buf=poller_metrics_buf,
+        trace_path=trace_path,
+    )
+    return web_server, notifier, poller
+
+
+async def run_single_process(
+    logger: logging.Logger,
+    cfg: Config,
+    log_level: int,
+    print_readings: bool,
+    trace_path: str | None,
+) -> int:
+    """Run the poller, notifier, and web server as tasks on this event loop.
+
+    Like the child processes, if any task stops, everything stops: this returns
+    1 if it raised, or 0 if it exited cleanly.
+    """
+    from ntfy import NotifyInbox
+
+    # the notifier's inbox, put to directly by the poller's and web server's threads:
+    ntfy_queue = NotifyInbox() if cfg.notify else None
+    web_server, notifier, poller = build_children(
+        cfg, ntfy_queue, log_level, print_readings, trace_path
+    )
+    tasks = [asyncio.create_task(poller.run_async(), name="Poller")]
+    if notifier is not None:
+        tasks.append(asyncio.create_task(notifier.run_async(), name="Notifier"))
+    if web_server is not None:
+        tasks.append(asyncio.create_task(web_server.run_async(), name="WebServer"))
+
+    logger.info("starting tasks ...")
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    for t in done:
+        e = t.exception()
+        if e is not None:
+            logger.error(f"Error in {t.get_name()}: {e}")
+            traceback.print_exception(e)
+            return 1
+    logger.info(f"{', '.join(t.get_name() for t in done)} exited")
+    return 0
+
+
 def supervise(
     logger: logging.Logger,
     procs: list[multiprocessing.Process],
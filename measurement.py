@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import datetime
+from abc import ABC, abstractmethod
+from collections.abc import Callable
+from typing import TYPE_CHECKING, Any
+
+import conv
+from co2 import Co2WarningLevel
+from config import Config, DeviceConfig
+
+if TYPE_CHECKING:
+    # only annotates; importing it would load bleak, which the web server and
+    # sinks don't need:
+    from libclaranet4 import Reading
+
+
+class Measurement:
+    """A reading plus everything derived from it, computed once for all sinks.
+
+    Sinks serialize this, via their Encoder, rather than converting the Reading
+    themselves.
+    """
+
+    __slots__ = (
+        "_fields",
+        "battery_pct",
+        "ble_name",
+        "co2_level",
+        "co2_ppm",
+        "device",
+        "humidity_abs",
+        "humidity_pct",
+        "pressure_inhg",
+        "pressure_mbar",
+        "refresh_s",
+        "rssi",
+        "t",
+        "temp_c",
+        "temp_f",
+    )
+
+    def __init__(
+        self,
+        device: DeviceConfig,
+        t: datetime.datetime,
+        ble_name: str,
+        rssi: int,
+        co2_ppm: int,
+        co2_level: Co2WarningLevel,
+        temp_c: float,
+        temp_f: float,
+        humidity_pct: float,
+        humidity_abs: float,
+        pressure_mbar: float,
+        pressure_inhg: float,
+        battery_pct: int | None = None,
+        refresh_s: int | None = None,
+    ):
+        self.device = device
+        self.t = t
+        self.ble_name = ble_name
+        self.rssi = rssi
+        self.co2_ppm = co2_ppm
+        self.co2_level = co2_level
+        self.temp_c = temp_c
+        self.temp_f = temp_f
+        self.humidity_pct = humidity_pct
+        self.humidity_abs = humidity_abs
+        self.pressure_mbar = pressure_mbar
+        self.pressure_inhg = pressure_inhg
+        # not written to sinks; None when the device didn't report them:
+        self.battery_pct = battery_pct
+        self.refresh_s = refresh_s  # the device's measurement interval
+        self._fields: dict | None = None
+
+    @staticmethod
+    def from_reading(
+        cfg: Config, device: DeviceConfig, reading: Reading, t: datetime.datetime
+    ) -> Measurement:
+        return Measurement(
+            device=device,
+            t=t,
+            ble_name=reading.name,
+            rssi=int(reading.rssi),
+            co2_ppm=int(reading.co2),
+            co2_level=Co2WarningLevel.from_ppm(cfg, reading.co2),
+            temp_c=float(reading.temperature),
+            temp_f=float(conv.celsius_to_fahrenheit(reading.temperature)),
+            humidity_pct=float(reading.humidity),
+            humidity_abs=float(
+                conv.absolute_humidity_g_m3(reading.temperature, reading.humidity)
+            ),
+            pressure_mbar=float(reading.pressure),
+            pressure_inhg=float(conv.mbar_to_inhg(reading.pressure)),
+            battery_pct=reading.battery,
+            refresh_s=reading.interval_s,
+        )
+
+    def fields(self) -> dict:
+        """The measurement's fields, as written to InfluxDB and MQTT.
+
+        The dict is built on first use and shared by every caller; don't modify it.
+        """
+        if self._fields is None:
+            self._fields = {
+                "rssi": self.rssi,
+                "temp_c": self.temp_c,
+                "temp_f": self.temp_f,
+                "humidity_pct": self.humidity_pct,
+                "humidity_abs": self.humidity_abs,
+                "pressure_mbar": self.pressure_mbar,
+                "pressure_inHg": self.pressure_inhg,
+                "co2_ppm": self.co2_ppm,
+                "co2_warning_level": self.co2_level.value,
+            }
+        return self._fields
+
+
+class Encoder(ABC):
+    """Serializes Measurements for one sink.
+
+    Subclasses implement device_parts, for whatever part of the output is the
+    same for every measurement from a device (tags, topic, ...), and encode_with;
+    the device parts are built once per device and cached.
+    """
+
+    def __init__(self, cfg: Config):
+        self._cfg = cfg
+        self._device_parts: dict[str, Any] = {}  # by device address
+
+    def encode(self, m: Measurement) -> Any:
+        parts = self._device_parts.get(m.device.address)
+        if parts is None:
+            parts = self._device_parts[m.device.address] = self.device_parts(m.device)
+        return self.encode_with(m, parts)
+
+    @abstractmethod
+    def device_parts(self, device: DeviceConfig) -> Any:
+        raise NotImplementedError
+
+    @abstractmethod
+    def encode_with(self, m: Measurement, parts: Any) -> Any:
+        raise NotImplementedError
+
+
+_ENCODERS: dict[str, type[Encoder]] = {}  # by sink name
+
+
+def register_encoder(sink: str) -> Callable[[type[Encoder]], type[Encoder]]:
+    """Class decorator registering a sink's Encoder"""
+
+    def register(cls: type[Encoder]) -> type[Encoder]:
+        if sink in _ENCODERS:
+            raise ValueError(f"an encoder is already registered for {sink}")
+        _ENCODERS[sink] = cls
+        return cls
+
+    return register
+
+
+def encoder_for(cfg: Config, sink: str) -> Encoder:
+    try:
+        return _ENCODERS[sink](cfg)
+    except KeyError:
+        raise ValueError(f"no encoder is registered for {sink}") from None
@@ -0,0 +1,164 @@
+import math
+from typing import Final, TypeVar
+
+# Prometheus' default buckets, in seconds; they suit BLE reads and sink writes:
+DEFAULT_BUCKETS_S: Final = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+METRICS_CONTENT_TYPE: Final = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _fmt_value(v: float) -> str:
+    if math.isinf(v):
+        return "+Inf" if v > 0 else "-Inf"
+    if isinstance(v, int) or v.is_integer():
+        return str(int(v))
+    return repr(v)
+
+
+def _escape_label_value(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = (f'{n}="{_escape_label_value(v)}"' for n, v in zip(names, values))
+    return "{" + ",".join(pairs) + "}"
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, help_text: str, label_names: tuple[str, ...]):
+        self.name = name
+        self._help = help_text
+        self._label_names = label_names
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        if labels.keys() != set(self._label_names):
+            raise ValueError(f"{self.name} takes labels {self._label_names}")
+        return tuple(str(labels[n]) for n in self._label_names)
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self._help}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        for key, value in self._values.items():
+            lines.append(
+                f"{self.name}{_fmt_labels(self._label_names, key)} {_fmt_value(value)}"
+            )
+        return lines
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def set(self, value: float, **labels: str):
+        self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        label_names: tuple[str, ...],
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS_S,
+    ):
+        super().__init__(name, help_text, label_names)
+        self._buckets = (*buckets, math.inf)
+        # of (per-bucket counts, sum):
+        self._observations: dict[tuple[str, ...], tuple[list[int], float]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        counts, total = self._observations.get(key, ([0] * len(self._buckets), 0.0))
+        for i, upper in enumerate(self._buckets):
+            if value <= upper:
+                counts[i] += 1
+                break
+        self._observations[key] = counts, total + value
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self._help}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        names = (*self._label_names, "le")
+        for key, (counts, total) in self._observations.items():
+            cumulative = 0
+            for upper, count in zip(self._buckets, counts):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket{_fmt_labels(names, (*key, _fmt_value(upper)))} "
+                    f"{cumulative}"
+                )
+            labels = _fmt_labels(self._label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_fmt_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+_M = TypeVar("_M", bound=_Metric)
+
+
+class MetricsRegistry:
+    """A minimal registry of metrics, rendered in the Prometheus text format.
+
+    Metrics are updated as things happen, and render() is called once per poll;
+    the web server serves that text as is, so a scrape costs the same however
+    often it happens. Metrics aren't locked; update and render them from a
+    single thread.
+    """
+
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+
+    def counter(
+        self, name: str, help_text: str, labels: tuple[str, ...] = ()
+    ) -> Counter:
+        return self._add(Counter(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, labels: tuple[str, ...] = ()) -> Gauge:
+        return self._add(Gauge(name, help_text, labels))
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS_S,
+    ) -> Histogram:
+        return self._add(Histogram(name, help_text, labels, buckets))
+
+    def _add(self, metric: _M) -> _M:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "".join(
+            line + "\n" for metric in self._metrics for line in metric.render()
+        )
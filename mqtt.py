@@ -1,61 +1,167 @@
-import datetime
+import collections
 import json
 import logging
+import threading
+from collections.abc import Callable
+from typing import TYPE_CHECKING, Final
 
-from paho.mqtt import publish
+from paho.mqtt import client as mqtt
 
-import conv
-from co2 import Co2WarningLevel
-from config import Config
-from libclaranet4 import Reading
+from config import Config, DeviceConfig
+from measurement import Encoder, Measurement, encoder_for, register_encoder
+from spool import Spool
 
+if TYPE_CHECKING:
+    from rollup import Rollup
 
-def write_mqtt(cfg: Config, reading: Reading, now: datetime.datetime) -> bool:
-    try:
-        auth = None
-        if cfg.mqtt_username:
-            auth = {
-                "username": cfg.mqtt_username,
-                "password": cfg.mqtt_password,
+MQTT_KEEPALIVE_S: Final = 60
+# publishing only hands messages to paho's network thread, so this is generous:
+MQTT_PUBLISH_TIMEOUT_S: Final = 5.0
+MQTT_RECONNECT_MIN_DELAY_S: Final = 1
+MQTT_RECONNECT_MAX_DELAY_S: Final = 120
+# most messages held in memory while disconnected, without a spool:
+MQTT_MAX_BUFFERED: Final = 1000
+# rollups are published under each device's mqtt_topic, at this subtopic:
+MQTT_ROLLUP_SUBTOPIC: Final = "rollup"
+
+
+@register_encoder("mqtt")
+class MqttEncoder(Encoder):
+    """Encodes Measurements as MQTT (topic, payload) messages"""
+
+    def device_parts(self, device: DeviceConfig) -> tuple[str, str]:
+        # the topic, and the payload's "tags" JSON, are the same for every message:
+        return device.mqtt_topic, json.dumps(
+            {
+                "aranet_name": device.name,
+                "aranet_addr": device.address,
             }
+        )
+
+    def encode_with(self, m: Measurement, parts: tuple[str, str]) -> tuple[str, str]:
+        topic, tags_json = parts
+        payload = (
+            f'{{"tags": {tags_json}, "time": {json.dumps(m.t.isoformat())}, '
+            f'"fields": {json.dumps(m.fields())}}}'
+        )
+        return topic, payload
 
-        publish.single(
-            cfg.mqtt_topic,
-            payload=json.dumps(
-                {
-                    "tags": {
-                        "aranet_name": cfg.device_name,
-                        "aranet_addr": cfg.aranet_device_address,
-                    },
-                    "time": now.isoformat(),
-                    "fields": {
-                        "rssi": int(reading.rssi),
-                        "temp_c": float(reading.temperature),
-                        "temp_f": float(
-                            conv.celsius_to_fahrenheit(reading.temperature)
-                        ),
-                        "humidity_pct": float(reading.humidity),
-                        "humidity_abs": float(
-                            conv.absolute_humidity_g_m3(
-                                reading.temperature, reading.humidity
-                            )
-                        ),
-                        "pressure_mbar": float(reading.pressure),
-                        "pressure_inHg": float(conv.mbar_to_inhg(reading.pressure)),
-                        "co2_ppm": int(reading.co2),
-                        "co2_warning_level": Co2WarningLevel.from_ppm(
-                            cfg, reading.co2
-                        ).value,
-                    },
-                }
-            ),
-            hostname=cfg.mqtt_broker,
-            port=cfg.mqtt_port,
-            auth=auth,
+
+def rollup_message(r: "Rollup") -> tuple[str, str]:
+    """Encode a Rollup as an MQTT (topic, payload) message"""
+    payload = json.dumps(
+        {"tags": r.tags(), "time": r.start.isoformat(), "fields": r.all_fields()}
+    )
+    return f"{r.device.mqtt_topic}/{MQTT_ROLLUP_SUBTOPIC}", payload
+
+
+class MqttPublisher:
+    """One persistent MQTT session for the life of the process.
+
+    paho's network loop runs in its own thread, and reconnects (with backoff)
+    whenever the connection drops. Messages published while disconnected go to
+    spool, when one is given, or else to an in-memory buffer of up to
+    MQTT_MAX_BUFFERED messages (dropping the oldest), which is sent once the
+    connection is back. on_connect is called after every (re)connection.
+    """
+
+    def __init__(
+        self,
+        cfg: Config,
+        spool: Spool | None = None,
+        on_connect: Callable[[], None] | None = None,
+    ):
+        self._cfg = cfg
+        self._spool = spool
+        self._on_connect_cb = on_connect
+        self._encoder = encoder_for(cfg, "mqtt")
+        self._logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._buffer: collections.deque[tuple[str, str]] = collections.deque(
+            maxlen=MQTT_MAX_BUFFERED
+        )
+        self._client = mqtt.Client(
+            callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
+            client_id=cfg.mqtt_client_id or "",
         )
+        if cfg.mqtt_username:
+            self._client.username_pw_set(cfg.mqtt_username, cfg.mqtt_password)
+        self._client.reconnect_delay_set(
+            min_delay=MQTT_RECONNECT_MIN_DELAY_S, max_delay=MQTT_RECONNECT_MAX_DELAY_S
+        )
+        self._client.on_connect = self._on_connect
+        self._client.on_disconnect = self._on_disconnect
+
+    def start(self):
+        self._client.connect_async(
+            self._cfg.mqtt_broker, self._cfg.mqtt_port, keepalive=MQTT_KEEPALIVE_S
+        )
+        self._client.loop_start()
+
+    def stop(self):
+        self._client.disconnect()
+        self._client.loop_stop()
+
+    @property
+    def connected(self) -> bool:
+        return self._client.is_connected()
+
+    def publish(self, topic: str, payload: str) -> bool:
+        """Publish a message; returns whether it was sent, rather than held back"""
+        with self._lock:
+            if self.connected and self._send(topic, payload):
+                return True
+            if self._spool is not None:
+                self._spool.append([{"topic": topic, "payload": payload}])
+            else:
+                if len(self._buffer) == self._buffer.maxlen:
+                    self._logger.warning("MQTT buffer full; dropping oldest message")
+                self._buffer.append((topic, payload))
+            return False
+
+    def publish_measurement(self, m: Measurement) -> bool:
+        return self.publish(*self._encoder.encode(m))
+
+    def publish_rollup(self, r: "Rollup") -> bool:
+        return self.publish(*rollup_message(r))
+
+    def publish_batch(self, messages: list[tuple[str, str]]) -> bool:
+        """Publish messages if connected; returns whether they were all sent"""
+        with self._lock:
+            if not self.connected:
+                return False
+            return all(self._send(topic, payload) for topic, payload in messages)
+
+    def _send(self, topic: str, payload: str) -> bool:
+        info = self._client.publish(
+            topic, payload, qos=self._cfg.mqtt_qos, retain=self._cfg.mqtt_retain
+        )
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            self._logger.error(
+                f"failed publishing to MQTT '{self._cfg.mqtt_broker}': "
+                f"{mqtt.error_string(info.rc)}"
+            )
+            return False
         return True
-    except Exception as e:  # noqa: BLE001 - report any publish failure, keep poller alive
-        logging.getLogger(__name__).error(
-            f"failed publishing to MQTT '{cfg.mqtt_broker}': {e}"
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        if reason_code.is_failure:
+            self._logger.error(
+                f"MQTT connection to '{self._cfg.mqtt_broker}' refused: {reason_code}"
+            )
+            return
+        self._logger.info(f"connected to MQTT broker '{self._cfg.mqtt_broker}'")
+        # paho holds its own locks while calling back, so send without ours:
+        with self._lock:
+            buffered = list(self._buffer)
+            self._buffer.clear()
+        for topic, payload in buffered:
+            self._send(topic, payload)
+        if self._on_connect_cb is not None:
+            self._on_connect_cb()
+
+    def _on_disconnect(self, client, userdata, flags, reason_code, properties):
+        self._logger.warning(
+            f"disconnected from MQTT broker '{self._cfg.mqtt_broker}': {reason_code}; "
+            f"reconnecting"
         )
-        return False
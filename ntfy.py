@@ -1,26 +1,62 @@
+from __future__ import annotations
+
+import collections
 import datetime
 import logging
 import multiprocessing
+import random
+import threading
+import time
+from collections.abc import Callable
 from dataclasses import dataclass
-from multiprocessing.managers import Namespace
 from typing import Final
 
-import requests
-
 import lib_mpex
+from clock import SYSTEM_CLOCK, Clock
 from co2 import Co2WarningLevel
 from config import Config
+from daemon_thread import run_in_daemon_thread
 from log import LOG_DEFAULT_FMT
+from metrics import MetricsRegistry
+from rules import MetricAlert, RuleEngine
+from shared import SharedBuffer, SharedState
+from timing import StageTimer
+from trend import SlidingFit
 
 NTFY_TIMEOUT_S: Final = 10.0
+NTFY_ATTEMPTS: Final = 4  # tries per notification, when ntfy is unreachable
+# backoff before the first retry, doubled before each later one, up to the max;
+# the actual delay is a random fraction of that, so retries don't synchronize:
+NTFY_BACKOFF_S: Final = 1.0
+NTFY_BACKOFF_MAX_S: Final = 30.0
+# MuteEvents come from people pressing buttons, so more than this queued is abuse;
+# beyond it, the oldest are dropped:
+NTFY_MAX_QUEUED_MUTES: Final = 64
 NTFY_PRIORITY_MUTED: Final = "min"
 NTFY_PRIORITY_UNMUTED: Final = "default"
+NTFY_TAG_TREND: Final = "chart_with_upwards_trend"
+# the key trend notifications are rate limited by, alongside alert rule metrics:
+TREND_ALERT: Final = "co2_trend"
 
 
 @dataclass(frozen=True)
 class ReadingEvent:
+    device: str  # DeviceConfig.name
     co2: int
     t: datetime.datetime
+    # None when the reading lacks them:
+    temp_c: float | None = None
+    humidity_pct: float | None = None
+    pressure_mbar: float | None = None
+
+    def metrics(self) -> dict[str, float | None]:
+        """Return the event's values by alert rule metric name"""
+        return {
+            "co2_ppm": self.co2,
+            "temp_c": self.temp_c,
+            "humidity_pct": self.humidity_pct,
+            "pressure_mbar": self.pressure_mbar,
+        }
 
 
 @dataclass(frozen=True)
@@ -28,6 +64,69 @@ class MuteEvent:
     mute_seconds: int  # 0 = unmuted
 
 
+class NotifyInbox:
+    """The Notifier's queue of events, bounded by coalescing stale ones.
+
+    A ReadingEvent replaces any queued one for the same device, and moves to the
+    back of the queue, since only a device's current CO2 level matters. Every
+    MuteEvent is kept, in order, up to NTFY_MAX_QUEUED_MUTES. put() never
+    blocks, and is safe to call from any thread.
+    """
+
+    def __init__(self, max_mutes: int = NTFY_MAX_QUEUED_MUTES):
+        self._cond = threading.Condition()
+        # by ("reading", device name) or ("mute", sequence number), oldest first:
+        self._events: collections.OrderedDict[
+            tuple[str, str | int], ReadingEvent | MuteEvent
+        ] = collections.OrderedDict()
+        self._max_mutes = max_mutes
+        self._mutes = 0
+        self._mute_seq = 0
+
+    def put(self, ev: ReadingEvent | MuteEvent):
+        with self._cond:
+            if isinstance(ev, ReadingEvent):
+                key = ("reading", ev.device)
+                self._events.pop(key, None)
+            else:
+                key = ("mute", self._mute_seq)
+                self._mute_seq += 1
+                self._mutes += 1
+                if self._mutes > self._max_mutes:
+                    oldest = next(k for k in self._events if k[0] == "mute")
+                    del self._events[oldest]
+                    self._mutes -= 1
+            self._events[key] = ev
+            self._cond.notify()
+
+    def put_nowait(self, ev: ReadingEvent | MuteEvent):
+        self.put(ev)
+
+    def get(self) -> ReadingEvent | MuteEvent:
+        """Remove and return the oldest event, waiting for one if there are none"""
+        with self._cond:
+            while not self._events:
+                self._cond.wait()
+            key, ev = self._events.popitem(last=False)
+            if key[0] == "mute":
+                self._mutes -= 1
+            return ev
+
+    def has_reading(self, device: str) -> bool:
+        """Whether a ReadingEvent for device is queued"""
+        with self._cond:
+            return ("reading", device) in self._events
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._events)
+
+
+def backoff_s(retry: int) -> float:
+    """Return the delay before the given retry (1 is the first), with full jitter"""
+    return random.uniform(0, min(NTFY_BACKOFF_MAX_S, NTFY_BACKOFF_S * 2 ** (retry - 1)))
+
+
 def fmt_duration(seconds: int) -> str:
     if seconds < 3600:
         return f"{seconds // 60}m"
@@ -54,18 +153,33 @@ def should_notify(
     now: datetime.datetime,
     mute_until: datetime.datetime | None = None,
 ) -> bool:
+    every = (
+        cfg.notify_red_every
+        if level == Co2WarningLevel.RED
+        else cfg.notify_yellow_every
+    )
+    return should_notify_level(last_level, last_time, level, every, now, mute_until)
+
+
+def should_notify_level(
+    last_level: Co2WarningLevel,
+    last_time: datetime.datetime,
+    level: Co2WarningLevel,
+    every_min: int,
+    now: datetime.datetime,
+    mute_until: datetime.datetime | None = None,
+) -> bool:
+    """Whether an alert at level notifies, repeating at most every every_min"""
     if level == Co2WarningLevel.RED:
         if last_level != Co2WarningLevel.RED:
             # escalation to red always notifies, even while muted:
             return True
-        notify = last_time + datetime.timedelta(minutes=cfg.notify_red_every) < now
+        notify = last_time + datetime.timedelta(minutes=every_min) < now
     elif level == Co2WarningLevel.YELLOW:
         if last_level == Co2WarningLevel.GREEN:
             notify = True
         else:
-            notify = (
-                last_time + datetime.timedelta(minutes=cfg.notify_yellow_every) < now
-            )
+            notify = last_time + datetime.timedelta(minutes=every_min) < now
     else:
         return False
 
@@ -78,58 +192,195 @@ class Notifier(lib_mpex.ChildProcess):
     def __init__(
         self,
         config: Config,
-        input_queue: multiprocessing.Queue,  # of ReadingEvent | MuteEvent
+        # of ReadingEvent | MuteEvent:
+        input_queue: multiprocessing.Queue | NotifyInbox,
         log_level: int,
-        mute_ns: Namespace | None = None,
+        state: SharedState | None = None,
+        metrics_buf: SharedBuffer | None = None,
+        trace_path: str | None = None,
+        clock: Clock = SYSTEM_CLOCK,
     ):
         self._config = config
+        self._clock = clock
         self._input_queue = input_queue
         self._log_level = log_level
-        self._mute_ns = mute_ns
-        self._last_level = Co2WarningLevel.GREEN
-        self._last_time = datetime.datetime.min.replace(tzinfo=datetime.UTC)
+        self._state = state
+        self._metrics_buf = metrics_buf
+        self._timer = StageTimer("notifier", trace_path)
+        self._metrics = MetricsRegistry()
+        self._m_sends = self._metrics.counter(
+            "an4mon_ntfy_sends_total", "Notifications sent, by outcome.", ("result",)
+        )
+        self._m_send_duration = self._metrics.histogram(
+            "an4mon_ntfy_send_duration_seconds", "Time taken sending a notification."
+        )
+        self._m_retries = self._metrics.counter(
+            "an4mon_ntfy_retries_total", "Notification sends retried after a failure."
+        )
+        self._room_names = {d.name: d.room_name for d in config.devices}
+        self._session = None  # a requests.Session, reused by every send
+        self._inbox: NotifyInbox | None = None  # created by the running notifier
+        self._rules = RuleEngine(config)
+        # per device name, of (minutes since the epoch, ppm):
+        self._trends: dict[str, SlidingFit] = {}
+        # per (device name, metric), as of the last notification:
+        self._last_level: dict[tuple[str, str], Co2WarningLevel] = {}
+        self._last_time: dict[tuple[str, str], datetime.datetime] = {}
 
     def _run(self):
         logger = logging.getLogger(__name__)
         logging.basicConfig(level=self._log_level, format=LOG_DEFAULT_FMT)
         logger.info("starting notifier")
 
+        inbox = NotifyInbox()
+        # drain the queue from the poller and web server as events arrive, even
+        # while a send is waiting to retry, so that queue can't grow; the inbox
+        # coalesces them instead:
+        threading.Thread(
+            target=lambda: self._pump(inbox), name="ntfy-pump", daemon=True
+        ).start()
+        # unwind through the finally below when the parent terminates this:
+        lib_mpex.exit_on_sigterm()
+        try:
+            self._deliver(logger, inbox)
+        finally:
+            self._timer.close()
+
+    async def run_async(self):
+        """Notify until cancelled, on a thread; input_queue must be a NotifyInbox"""
+        logger = logging.getLogger(__name__)
+        logger.info("starting notifier")
+        try:
+            await run_in_daemon_thread(
+                lambda: self._deliver(logger, self._input_queue), "notifier"
+            )
+        finally:
+            self._timer.close()
+
+    def drain(self, logger: logging.Logger) -> int:
+        """Handle every queued event, without waiting; input_queue must be a NotifyInbox.
+
+        For driving the notifier a step at a time, as simulate.py does. Returns
+        the number of events handled.
+        """
+        inbox = self._input_queue
+        self._inbox = inbox
+        handled = 0
+        while len(inbox):
+            self._handle(logger, inbox.get())
+            handled += 1
+        return handled
+
+    def _pump(self, inbox: NotifyInbox):
         while True:
-            ev: ReadingEvent | MuteEvent = self._input_queue.get()
-            if isinstance(ev, MuteEvent):
-                self._handle_mute(logger, ev)
-            else:
-                self._handle_reading(logger, ev)
+            inbox.put(self._input_queue.get())
+
+    def _deliver(self, logger: logging.Logger, inbox: NotifyInbox):
+        self._inbox = inbox
+        while True:
+            self._handle(logger, inbox.get())
+
+    def _handle(self, logger: logging.Logger, ev: ReadingEvent | MuteEvent):
+        if isinstance(ev, MuteEvent):
+            self._handle_mute(logger, ev)
+        else:
+            self._handle_reading(logger, ev)
+        if self._metrics_buf is not None:
+            self._publish_metrics(logger)
+        self._timer.maybe_log_summary(logger)
+
+    def _mute_until(self) -> datetime.datetime | None:
+        return self._state.mute_until if self._state is not None else None
+
+    def _publish_metrics(self, logger: logging.Logger):
+        # readings arrive every poll, so this is rendered about once per poll:
+        try:
+            self._metrics_buf.value = self._metrics.render().encode("utf-8")
+        except ValueError as e:
+            logger.error(f"not sharing metrics: {e}")
 
     def _handle_reading(self, logger: logging.Logger, ev: ReadingEvent):
-        level = Co2WarningLevel.from_ppm(self._config, ev.co2)
-        logger.debug(f"received reading: {ev.co2} ppm ({level.value})")
+        logger.debug(f"received reading from {ev.device}: {ev.co2} ppm")
+        alerts = self._rules.evaluate(ev.device, ev.t, ev.metrics())
+        for alert in alerts:
+            self._handle_alert(logger, ev, alert)
+        if self._config.trend_lead_min:
+            self._handle_trend(logger, ev)
+
+    def _handle_alert(
+        self, logger: logging.Logger, ev: ReadingEvent, alert: MetricAlert
+    ):
+        if alert.rule is None:
+            return
+        room_name = self._room_names.get(ev.device) or ev.device
+        self._notify(
+            logger,
+            ev,
+            alert.metric,
+            alert.level,
+            alert.rule.every,
+            f"{room_name}: {alert.rule.describe(alert.value)}",
+            {"Tags": alert.level.ntfy_tag(), "Priority": alert.rule.priority},
+            name=alert.rule.name,
+        )
+
+    def _handle_trend(self, logger: logging.Logger, ev: ReadingEvent):
+        """Warn when CO2's recent trend will take it to red within the lead time"""
+        fit = self._trends.get(ev.device)
+        if fit is None:
+            fit = self._trends[ev.device] = SlidingFit(self._config.trend_window_min)
+        fit.add(ev.t.timestamp() / 60, ev.co2)
+        if ev.co2 >= self._config.co2_red:
+            return
+        eta_min = fit.time_to(self._config.co2_red)
+        if eta_min is None or eta_min > self._config.trend_lead_min:
+            return
+        slope, _ = fit.line()
+        room_name = self._room_names.get(ev.device) or ev.device
+        self._notify(
+            logger,
+            ev,
+            TREND_ALERT,
+            Co2WarningLevel.YELLOW,
+            self._config.notify_yellow_every,
+            f"{room_name}: CO2 will reach red in ~{max(1, round(eta_min))} minutes "
+            f"({ev.co2} ppm, rising {slope:.0f} ppm/min)",
+            {"Tags": NTFY_TAG_TREND, "Priority": self._config.ntfy_priority_yellow},
+            name="CO2 trend",
+        )
 
-        mute_until = self._mute_ns.mute_until if self._mute_ns is not None else None
-        if not should_notify(
-            self._config, self._last_level, self._last_time, level, ev.t, mute_until
+    def _notify(
+        self,
+        logger: logging.Logger,
+        ev: ReadingEvent,
+        metric: str,
+        level: Co2WarningLevel,
+        every: int,
+        message: str,
+        headers: dict[str, str],
+        name: str,
+    ):
+        """Send an alert about ev's device, if should_notify_level() allows it"""
+        key = (ev.device, metric)
+        last_level = self._last_level.get(key, Co2WarningLevel.GREEN)
+        last_time = self._last_time.get(
+            key, datetime.datetime.min.replace(tzinfo=datetime.UTC)
+        )
+        mute_until = self._mute_until()
+        if not should_notify_level(
+            last_level, last_time, level, every, ev.t, mute_until
         ):
             if (
                 mute_until is not None
                 and ev.t < mute_until
-                and should_notify(
-                    self._config, self._last_level, self._last_time, level, ev.t
-                )
+                and should_notify_level(last_level, last_time, level, every, ev.t)
             ):
                 logger.info(
-                    f"CO2 {level.value} notification suppressed; "
+                    f"{ev.device}: {name} {level.value} notification suppressed; "
                     f"muted until {mute_until}"
                 )
             return
 
-        headers = {
-            "Tags": level.ntfy_tag(),
-            "Priority": (
-                self._config.ntfy_priority_red
-                if level == Co2WarningLevel.RED
-                else self._config.ntfy_priority_yellow
-            ),
-        }
         if self._config.web_external_base_url:
             headers["Actions"] = "; ".join(
                 mute_action(
@@ -137,13 +388,18 @@ class Notifier(lib_mpex.ChildProcess):
                 )
                 for hours in (self._config.mute_short_h, self._config.mute_long_h)
             )
-
-        message = f"{self._config.notify_room_name}: CO2 {ev.co2} ppm"
-        if not self._send(logger, message, headers):
+        if not self._send(
+            logger,
+            message,
+            headers,
+            superseded=lambda: (
+                self._inbox is not None and self._inbox.has_reading(ev.device)
+            ),
+        ):
             return
 
-        self._last_level = level
-        self._last_time = ev.t
+        self._last_level[key] = level
+        self._last_time[key] = ev.t
 
     def _handle_mute(self, logger: logging.Logger, ev: MuteEvent):
         if ev.mute_seconds > 0:
@@ -159,20 +415,68 @@ class Notifier(lib_mpex.ChildProcess):
         self._send(logger, message, headers)
 
     def _send(
-        self, logger: logging.Logger, message: str, headers: dict[str, str]
+        self,
+        logger: logging.Logger,
+        message: str,
+        headers: dict[str, str],
+        superseded: Callable[[], bool] = lambda: False,
     ) -> bool:
+        """Send a notification, retrying with backoff while ntfy is unreachable.
+
+        Between tries, gives up if superseded() is true, e.g. because a newer
+        reading is waiting to be handled.
+        """
         if self._config.ntfy_token:
             headers["Authorization"] = "Bearer " + self._config.ntfy_token
+        for attempt in range(1, NTFY_ATTEMPTS + 1):
+            error, retryable = self._try_send(message, headers)
+            if error is None:
+                logger.info(f"notification '{message}' sent")
+                self._m_sends.inc(result="ok")
+                return True
+            if not retryable or attempt == NTFY_ATTEMPTS:
+                break
+            delay_s = backoff_s(attempt)
+            logger.warning(
+                f"error sending notification (try {attempt} of {NTFY_ATTEMPTS}): "
+                f"{error}; retrying in {delay_s:.1f}s"
+            )
+            self._clock.sleep_blocking(delay_s)
+            if superseded():
+                logger.info(f"notification '{message}' superseded; not retrying")
+                self._m_sends.inc(result="superseded")
+                return False
+            self._m_retries.inc()
+        logger.error(f"error sending notification: {error}")
+        self._m_sends.inc(result="error")
+        return False
+
+    def _try_send(
+        self, message: str, headers: dict[str, str]
+    ) -> tuple[str | None, bool]:
+        """Try sending once; returns the error (None if sent), and whether to retry"""
+        # not imported at the top, because the poller and web server import
+        # this module for its events, and don't otherwise need requests:
+        import requests
+
+        if self._session is None:
+            self._session = requests.Session()
+        started_at = time.monotonic()
         try:
-            resp = requests.post(
+            resp = self._session.post(
                 f"{self._config.ntfy_server}/{self._config.ntfy_topic}",
                 data=message.encode("utf-8"),
                 headers=headers,
                 timeout=NTFY_TIMEOUT_S,
             )
-            resp.raise_for_status()
-            logger.info(f"notification '{message}' sent")
-            return True
         except requests.RequestException as e:
-            logger.error(f"error sending notification: {e}")
-            return False
+            return str(e), True
+        finally:
+            send_s = time.monotonic() - started_at
+            self._m_send_duration.observe(send_s)
+            self._timer.record("ntfy.send", send_s)
+        if resp.ok:
+            return None, False
+        # other 4xx errors (a bad topic or token) won't go away by retrying:
+        retryable = resp.status_code == 429 or resp.status_code >= 500
+        return f"HTTP {resp.status_code}: {resp.text.strip()}", retryable
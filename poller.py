@@ -5,90 +5,618 @@ import datetime
 import logging
 import multiprocessing
 import time
-from multiprocessing.managers import Namespace
-from typing import Final
-
-import requests
+from typing import TYPE_CHECKING, Final
 
 import lib_mpex
 from aranet import ara_print, ara_read
-from config import Config
-from influx import write_influx
+from backfill import BackfillState
+from clock import SYSTEM_CLOCK, Clock
+from config import Config, DeviceConfig
+from fanout import SinkFanout, SinkJob
+from latest import LatestTracker
+from libclaranet4 import (
+    AdvertisementListener,
+    Ara4Connection,
+    BleBackend,
+    BTIOError,
+    DiscoveryCache,
+    Reading,
+)
 from log import LOG_DEFAULT_FMT
-from mqtt import write_mqtt
-from ntfy import ReadingEvent
+from measurement import Measurement
+from metrics import MetricsRegistry
+from ntfy import NotifyInbox, ReadingEvent
+from schedule import PollSchedule
+from shared import SharedBuffer, SharedState
+from spool import Spool, SpoolReplayer
+from timing import StageTimer
+
+if TYPE_CHECKING:
+    from influx import InfluxWriter
+    from mqtt import MqttPublisher
+    from rollup import RollupAggregator, RollupWriter
+    from store import ReadingStore
 
 HEALTHCHECK_TIMEOUT_S: Final = 10.0
+# how long stopping waits for buffered writes to be flushed; main.py kills a
+# child that takes longer than CHILD_SHUTDOWN_TIMEOUT_S to exit:
+STOP_FLUSH_TIMEOUT_S: Final = 3.0
+NTFY_QUEUE_TIMEOUT_S: Final = 1.0
+# a gap of this many of a device's intervals between reads, or more, between
+# successful writes is backfilled from the device's history; a single missed
+# poll makes a gap of 2:
+BACKFILL_GAP_INTERVALS: Final = 1.5
+# a reading's time in the device's history can be a second or two off from the
+# time it was written live with; history records this close to a gap's ends are
+# taken to be the live writes there (Aranet4s measure at least a minute apart):
+BACKFILL_EDGE_SLACK: Final = datetime.timedelta(seconds=30)
+# BLE reads take seconds, and tens of seconds when they time out:
+POLL_BUCKETS_S: Final = (0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+
+class _PollerMetrics:
+    def __init__(self):
+        r = self.registry = MetricsRegistry()
+        self.polls = r.counter("an4mon_polls_total", "Polls started.")
+        self.poll_duration = r.histogram(
+            "an4mon_poll_duration_seconds",
+            "Time each poll took, from reading devices through writing to sinks.",
+            buckets=POLL_BUCKETS_S,
+        )
+        self.read_duration = r.histogram(
+            "an4mon_read_duration_seconds",
+            "Time each poll took to read all devices.",
+            buckets=POLL_BUCKETS_S,
+        )
+        self.read_failures = r.counter(
+            "an4mon_read_failures_total",
+            "Failed device reads (BLE errors, or nothing heard).",
+            ("device",),
+        )
+        self.repeat_reads = r.counter(
+            "an4mon_repeat_reads_total",
+            "Reads of a measurement already read, which aren't written to sinks.",
+            ("device",),
+        )
+        self.sink_duration = r.histogram(
+            "an4mon_sink_write_duration_seconds",
+            "Time each poll's write to a sink took.",
+            ("sink",),
+        )
+        self.sink_failures = r.counter(
+            "an4mon_sink_failures_total", "Failed or timed out sink writes.", ("sink",)
+        )
+        self.rollup_late = r.counter(
+            "an4mon_rollup_late_total",
+            "Readings left out of a rollup, for arriving after its window closed.",
+        )
+        labels = ("device",)
+        self.co2 = r.gauge("an4mon_co2_ppm", "Latest CO2 reading.", labels)
+        self.temperature = r.gauge(
+            "an4mon_temperature_celsius", "Latest temperature reading.", labels
+        )
+        self.humidity = r.gauge(
+            "an4mon_humidity_percent", "Latest relative humidity reading.", labels
+        )
+        self.pressure = r.gauge(
+            "an4mon_pressure_mbar", "Latest air pressure reading.", labels
+        )
+        self.rssi = r.gauge("an4mon_rssi_dbm", "Latest signal strength.", labels)
+        self.poll_interval = r.gauge(
+            "an4mon_poll_interval_seconds", "Current interval between polls."
+        )
+        self.reading_time = r.gauge(
+            "an4mon_last_reading_timestamp_seconds",
+            "Unix time of the latest reading.",
+            labels,
+        )
+
+    def observe_measurement(self, m: Measurement):
+        device = m.device.name
+        self.co2.set(m.co2_ppm, device=device)
+        self.temperature.set(m.temp_c, device=device)
+        self.humidity.set(m.humidity_pct, device=device)
+        self.pressure.set(m.pressure_mbar, device=device)
+        self.rssi.set(m.rssi, device=device)
+        self.reading_time.set(m.t.timestamp(), device=device)
 
 
 class Poller(lib_mpex.ChildProcess):
     def __init__(
         self,
         config: Config,
-        ntfy_queue: multiprocessing.Queue | None,  # of ReadingEvent
+        ntfy_queue: multiprocessing.Queue | NotifyInbox | None,  # of ReadingEvent
         log_level: int,
         print_readings: bool,
-        health_ns: Namespace | None = None,
+        state: SharedState | None = None,
+        latest_buf: SharedBuffer | None = None,  # of packed LatestReadings
+        metrics_buf: SharedBuffer | None = None,
+        trace_path: str | None = None,
+        clock: Clock = SYSTEM_CLOCK,
+        ble_backend: BleBackend | None = None,  # bleak, by default
     ):
         self._config = config
+        self._clock = clock
         self._ntfy_queue = ntfy_queue
         self._log_level = log_level
         self._print_readings = print_readings
-        self._health_ns = health_ns
+        self._state = state
+        self._latest_buf = latest_buf
+        self._latest = LatestTracker()
+        self._metrics_buf = metrics_buf
+        self._metrics = _PollerMetrics()
+        self._timer = StageTimer("poller", trace_path)
+        self._schedule = PollSchedule(config, clock)
+        self._discovery_cache = DiscoveryCache(
+            ttl_s=config.ble_discovery_ttl_s, clock=clock
+        )
+        self._listener: AdvertisementListener | None = None
+        self._backfill: BackfillState | None = None
+        self._influx: InfluxWriter | None = None
+        self._mqtt: MqttPublisher | None = None
+        self._store: ReadingStore | None = None
+        self._rollups: RollupAggregator | None = None
+        self._rollup_writer: RollupWriter | None = None
+        self._sink_timeouts_s: dict[str, float] = {}  # by sink name
+        self._replayers: dict[str, SpoolReplayer] = {}  # by sink name
+        self._fanout: SinkFanout | None = None
+        self._connections = {
+            d.address: Ara4Connection(
+                d.address,
+                cache=self._discovery_cache,
+                keep_connected=config.ble_keep_connected,
+                on_stage=self._stage_callback(d.name),
+                backend=ble_backend,
+                clock=clock,
+            )
+            for d in config.devices
+        }
+
+    def _stage_callback(self, device_name: str):
+        return lambda stage, duration_s: self._timer.record(
+            stage, duration_s, device=device_name
+        )
 
     def _run(self):
-        logger = logging.getLogger(__name__)
         logging.basicConfig(level=self._log_level, format=LOG_DEFAULT_FMT)
-        logger.info("starting poller")
+        # unwind through run_async(), which flushes buffered writes on the way
+        # out, rather than dying with them when the parent terminates this:
+        lib_mpex.exit_on_sigterm()
+        asyncio.run(self.run_async())
 
-        interval_s = self._config.poll_interval * 60
-        with asyncio.Runner() as runner:
-            while True:
-                started_at = time.monotonic()
-                self._poll_once(logger, runner)
-                # sleep to a fixed cadence, so the time a read takes (up to tens
-                # of seconds, and longer when it fails) doesn't drift polling:
-                time.sleep(max(0.0, interval_s - (time.monotonic() - started_at)))
-
-    def _poll_once(self, logger: logging.Logger, runner: asyncio.Runner):
-        now = datetime.datetime.now(datetime.UTC)
+    async def run_async(self):
+        """Poll forever, on the running event loop"""
+        logger = logging.getLogger(__name__)
+        self.start(logger)
         try:
-            reading = ara_read(runner, self._config.aranet_device_address)
-        except Exception as e:  # noqa: BLE001 - a bad read shouldn't kill the poller
-            logger.error(
-                f"failed reading from {self._config.aranet_device_address}: {e}"
+            if self._config.ble_read_mode == "passive":
+                self._listener = AdvertisementListener(
+                    [d.address for d in self._config.devices],
+                    cache=self._discovery_cache,
+                )
+                await self._listener.start()
+                # the first poll reports what was heard since the scan started:
+                await self._clock.sleep(self._schedule.interval_s)
+            while True:
+                await self.poll_due(logger)
+                # devices are due on a cadence measured from when their polls
+                # started, so the time a read takes (up to tens of seconds, and
+                # longer when it fails) doesn't drift polling. sleeping on the
+                # event loop lets open BLE connections keep servicing their
+                # callbacks between polls:
+                await self._clock.sleep(
+                    max(0.0, self.next_due_at() - self._clock.monotonic())
+                )
+        finally:
+            await self.stop(logger)
+
+    def start(self, logger: logging.Logger):
+        """Open the enabled sinks; run_async() does this before polling"""
+        logger.info("starting poller")
+
+        if self._state is not None:
+            self._state.poll_interval_s = self._schedule.interval_s
+        if self._config.backfill:
+            self._backfill = BackfillState(
+                self._config.backfill_state_file,
+                # until each device's is set from its first reading:
+                max_gap=datetime.timedelta(
+                    minutes=BACKFILL_GAP_INTERVALS * self._config.poll_interval
+                ),
             )
-            return
+        # each sink's module, and the dependencies it brings, is imported only
+        # when that sink is enabled, which keeps startup fast without it:
+        if self._config.influx:
+            from influx import INFLUX_TIMEOUT_S, InfluxWriter
 
+            self._sink_timeouts_s["influx"] = INFLUX_TIMEOUT_S
+            influx_spool = self._open_spool(InfluxWriter.spool_name(self._config))
+            self._influx = InfluxWriter(
+                self._config,
+                on_flushed=(
+                    self._backfill.record_live_writes
+                    if self._backfill is not None
+                    else None
+                ),
+                spool=influx_spool,
+                clock=self._clock,
+            )
+            if influx_spool is not None:
+                self._replayers["influx"] = SpoolReplayer(
+                    influx_spool, self._influx.write_spooled, name="influx"
+                )
+        if self._config.mqtt:
+            from mqtt import MQTT_PUBLISH_TIMEOUT_S, MqttPublisher
+
+            self._sink_timeouts_s["mqtt"] = MQTT_PUBLISH_TIMEOUT_S
+            mqtt_spool = self._open_spool("mqtt")
+            self._mqtt = MqttPublisher(
+                self._config,
+                spool=mqtt_spool,
+                on_connect=lambda: self._wake_replayer("mqtt"),
+            )
+            if mqtt_spool is not None:
+                self._replayers["mqtt"] = SpoolReplayer(
+                    mqtt_spool,
+                    lambda records: self._mqtt.publish_batch(
+                        [(r["topic"], r["payload"]) for r in records]
+                    ),
+                    name="mqtt",
+                )
+            self._mqtt.start()
+        if self._config.store:
+            from store import STORE_TIMEOUT_S, ReadingStore
+
+            self._sink_timeouts_s["store"] = STORE_TIMEOUT_S
+            self._store = ReadingStore(
+                self._config.store_file, self._config.store_retention_days
+            )
+        if self._config.rollup_windows_min:
+            from rollup import ROLLUP_TIMEOUT_S, RollupAggregator, RollupWriter
+
+            self._sink_timeouts_s["rollup"] = ROLLUP_TIMEOUT_S
+            # by then, every measurement taken in a window has been read:
+            self._rollups = RollupAggregator(
+                self._config.rollup_windows_min,
+                grace=datetime.timedelta(minutes=self._config.poll_interval_ceiling()),
+            )
+            self._rollup_writer = RollupWriter(influx=self._influx, mqtt=self._mqtt)
+        for replayer in self._replayers.values():
+            replayer.start()
+        self._fanout = SinkFanout(
+            ["ntfy", "influx", "mqtt", "store", "rollup", "healthcheck"]
+        )
+        adaptive = (
+            f" (adaptively, {self._config.poll_interval_min:g} to "
+            f"{self._config.poll_interval_max:g} min)"
+            if self._config.poll_adaptive
+            else ""
+        )
         logger.info(
-            f"read from {reading.name}: CO2 {reading.co2} ppm, "
-            f"{reading.temperature:.1f} °C, {reading.humidity:.0f}% RH, "
-            f"{reading.pressure} mbar"
+            f"polling {len(self._config.devices)} device(s) every "
+            f"{self._config.poll_interval} min{adaptive}"
         )
-        if self._health_ns is not None:
-            self._health_ns.last_poll_at = now
-        if self._print_readings:
-            ara_print(self._config, reading)
 
-        if self._ntfy_queue is not None:
-            self._ntfy_queue.put(ReadingEvent(co2=reading.co2, t=now))
+    async def poll_due(self, logger: logging.Logger):
+        """Poll the devices due now, then backfill, if that's enabled"""
+        await self._poll_once(logger, self._schedule.due(self._clock.monotonic()))
+        if self._backfill is not None:
+            with self._timer.stage("backfill"):
+                await self._backfill_once(logger)
+        self._timer.maybe_log_summary(logger)
+
+    def next_due_at(self) -> float:
+        """When the next device is due to be polled, by the clock's monotonic()"""
+        return self._schedule.next_due_at()
+
+    async def stop(self, logger: logging.Logger):
+        """Flush buffered writes, within STOP_FLUSH_TIMEOUT_S, then close everything"""
+        if self._fanout is not None:
+            jobs: dict[str, SinkJob] = {}
+            if self._influx is not None:
+                jobs["influx"] = SinkJob(self._influx.flush, STOP_FLUSH_TIMEOUT_S)
+            if self._store is not None:
+                jobs["store"] = SinkJob(self._store.flush, STOP_FLUSH_TIMEOUT_S)
+            if self._rollup_writer is not None and self._rollup_writer.pending():
+                jobs["rollup"] = SinkJob(
+                    self._rollup_writer.write, STOP_FLUSH_TIMEOUT_S
+                )
+            for r in (await asyncio.to_thread(self._fanout.run, jobs)).values():
+                if not r.ok:
+                    logger.error(f"final sink write failed: {r}")
+            self._fanout.shutdown()
+        if self._listener is not None:
+            await self._listener.stop()
+        for conn in self._connections.values():
+            await conn.close("stopping")
+        if self._mqtt is not None:
+            self._mqtt.stop()
+        if self._influx is not None:
+            self._influx.close()
+        if self._store is not None:
+            self._store.close()
+        self._timer.close()
+
+    async def _read_all(
+        self, devices: list[DeviceConfig]
+    ) -> list[Reading | BaseException]:
+        """Read the given devices concurrently, in order.
+
+        At most poll_concurrency reads are in flight at once, and each device's
+        read starts poll_stagger_s after the previous one's, so a large fleet
+        doesn't hit the Bluetooth adapter all at the same moment.
+        """
+        limit = asyncio.Semaphore(self._config.poll_concurrency)
+        # clock.monotonic() when the next read may start:
+        next_start_at = self._clock.monotonic()
 
+        async def read_one(device: DeviceConfig) -> Reading:
+            nonlocal next_start_at
+            # the semaphore admits reads in order; space them out once they're
+            # admitted, so reads held back by poll_concurrency don't all start
+            # at once when slots free up:
+            async with limit:
+                now = self._clock.monotonic()
+                start_at = max(now, next_start_at)
+                next_start_at = start_at + self._config.poll_stagger_s
+                await self._clock.sleep(start_at - now)
+                return await ara_read(self._connections[device.address])
+
+        return await asyncio.gather(
+            *(read_one(d) for d in devices),
+            return_exceptions=True,
+        )
+
+    def _heard_all(self, devices: list[DeviceConfig]) -> list[Reading | BaseException]:
+        """Return the latest advertised Reading for each of the given devices."""
+        heard = self._listener.pop_readings()
+        return [
+            heard.get(d.address.lower())
+            or BTIOError(
+                "no advertisement with measurements since the last poll "
+                "(is Smart Home integration enabled on the device?)"
+            )
+            for d in devices
+        ]
+
+    async def _poll_once(self, logger: logging.Logger, devices: list[DeviceConfig]):
+        # devices are scheduled on the clock, but work is timed in real time:
+        started_at = self._clock.monotonic()
+        timed_from = time.monotonic()
+        self._metrics.polls.inc()
+        if self._listener is not None:
+            results = self._heard_all(devices)
+        else:
+            results = await self._read_all(devices)
+        read_s = time.monotonic() - timed_from
+        self._metrics.read_duration.observe(read_s)
+        self._timer.record("read", read_s)
         healthy = True
-        if self._config.influx:
-            try:
-                if not write_influx(self._config, reading, now):
-                    logger.error("influx write failed")
-                    healthy = False
-            except Exception as e:  # noqa: BLE001 - an influx failure shouldn't kill the poller
-                logger.error(f"influx write failed: {e}")
+        measurements: list[Measurement] = []
+        # what each device's read got, if anything, for scheduling its next one:
+        polled: list[tuple[DeviceConfig, Measurement | None]] = []
+        for device, result in zip(devices, results):
+            if isinstance(result, Exception):
+                # a bad read shouldn't kill the poller, or skip the other devices:
+                logger.error(
+                    f"failed reading from {device.name} ({device.address}): {result}"
+                )
+                self._metrics.read_failures.inc(device=device.name)
+                if self._backfill is not None:
+                    self._backfill.record_missed(device.name, self._clock.now())
+                polled.append((device, None))
                 healthy = False
-        if self._config.mqtt and not write_mqtt(self._config, reading, now):
-            healthy = False
+                continue
+            if isinstance(result, BaseException):
+                raise result
+            m = self._accept_reading(logger, device, result)
+            polled.append((device, m))
+            if self._schedule.is_repeat(m):
+                # the device hasn't measured since the last poll; writing the
+                # same measurement again would only duplicate it in the sinks:
+                logger.info(f"{device.name} hasn't measured since it was last read")
+                self._metrics.repeat_reads.inc(device=device.name)
+                continue
+            self._metrics.observe_measurement(m)
+            measurements.append(m)
+            if self._backfill is not None:
+                # the interval this read followed, before update() changes it:
+                self._backfill.set_max_gap(
+                    device.name,
+                    datetime.timedelta(
+                        seconds=BACKFILL_GAP_INTERVALS * self._schedule.spacing_s(m)
+                    ),
+                )
 
+        if self._latest_buf is not None:
+            latest = self._latest.update(measurements)
+            if latest is not None:
+                try:
+                    self._latest_buf.value = latest.pack()
+                except ValueError as e:
+                    logger.error(f"not sharing the latest readings: {e}")
+        # sink writes block, so they wait off the event loop, which keeps
+        # servicing BLE connections (and, with --single-process, everything else):
+        sink_results = await asyncio.to_thread(
+            self._fanout.run, self._sink_jobs(measurements)
+        )
+        healthy = healthy and all(r.ok for r in sink_results.values())
         if healthy and self._config.healthcheck_ping_url:
+            sink_results |= await asyncio.to_thread(
+                self._fanout.run,
+                {"healthcheck": SinkJob(self._ping_healthcheck, HEALTHCHECK_TIMEOUT_S)},
+            )
+        for r in sink_results.values():
+            if not r.ok:
+                logger.error(f"sink write failed: {r}")
+        if self._state is not None and sink_results:
+            self._state.record_sinks(
+                self._clock.now(),
+                {r.sink: r.ok for r in sink_results.values()},
+            )
+        if sink_results:
+            logger.info("sinks: " + ", ".join(str(r) for r in sink_results.values()))
+        for r in sink_results.values():
+            self._metrics.sink_duration.observe(r.latency_s, sink=r.sink)
+            self._timer.record(f"sink.{r.sink}", r.latency_s)
+            if not r.ok:
+                self._metrics.sink_failures.inc(sink=r.sink)
+        if self._schedule.update(measurements):
+            logger.info(
+                f"polling every {self._schedule.interval_s / 60:g} min "
+                f"({self._schedule.reason})"
+            )
+        for device, m in polled:
+            self._schedule.schedule(device, started_at, m)
+        interval_s = self._schedule.effective_interval_s()
+        if self._state is not None:
+            self._state.poll_interval_s = interval_s
+        self._metrics.poll_interval.set(interval_s)
+        poll_s = time.monotonic() - timed_from
+        self._metrics.poll_duration.observe(poll_s)
+        self._timer.record("poll", poll_s)
+        if self._metrics_buf is not None:
+            try:
+                self._metrics_buf.value = self._metrics.registry.render().encode(
+                    "utf-8"
+                )
+            except ValueError as e:
+                logger.error(f"not sharing metrics: {e}")
+
+    def _accept_reading(
+        self, logger: logging.Logger, device: DeviceConfig, reading: Reading
+    ) -> Measurement:
+        """Log, record, and print a successful read"""
+        # timestamped when the device measured it, not when it was read:
+        m = Measurement.from_reading(self._config, device, reading, reading.sampled_at)
+        logger.info(
+            f"read from {device.name} ({reading.name}): CO2 {reading.co2} ppm, "
+            f"{reading.temperature:.1f} °C, {reading.humidity:.0f}% RH, "
+            f"{reading.pressure} mbar"
+        )
+        if self._state is not None:
+            self._state.last_poll_at = reading.received_at
+        if self._print_readings:
+            ara_print(m)
+        return m
+
+    def _sink_jobs(self, measurements: list[Measurement]) -> dict[str, SinkJob]:
+        jobs: dict[str, SinkJob] = {}
+        if self._ntfy_queue is not None and measurements:
+            jobs["ntfy"] = SinkJob(
+                lambda: self._queue_ntfy(measurements), NTFY_QUEUE_TIMEOUT_S
+            )
+        if self._influx is not None:
+            # buffering is cheap; only the flush goes to the sink's worker:
+            for m in measurements:
+                self._influx.add(m)
+            if self._influx.flush_due():
+                jobs["influx"] = SinkJob(
+                    self._flush_influx, self._sink_timeouts_s["influx"]
+                )
+        if self._store is not None and measurements:
+            for m in measurements:
+                self._store.add(m)
+            jobs["store"] = SinkJob(self._store.flush, self._sink_timeouts_s["store"])
+        if self._mqtt is not None and measurements:
+            jobs["mqtt"] = SinkJob(
+                lambda: self._publish_mqtt(measurements),
+                self._sink_timeouts_s["mqtt"],
+            )
+        if self._rollups is not None:
+            closed = []
+            late = self._rollups.late
+            for m in measurements:
+                closed.extend(self._rollups.add(m))
+            if self._rollups.late > late:
+                self._metrics.rollup_late.inc(self._rollups.late - late)
+            closed.extend(self._rollups.close_due(self._clock.now()))
+            self._rollup_writer.add(closed)
+            if self._rollup_writer.pending():
+                jobs["rollup"] = SinkJob(
+                    self._rollup_writer.write, self._sink_timeouts_s["rollup"]
+                )
+        return jobs
+
+    def _queue_ntfy(self, measurements: list[Measurement]) -> bool:
+        for m in measurements:
+            self._ntfy_queue.put(
+                ReadingEvent(
+                    device=m.device.name,
+                    co2=m.co2_ppm,
+                    t=m.t,
+                    temp_c=m.temp_c,
+                    humidity_pct=m.humidity_pct,
+                    pressure_mbar=m.pressure_mbar,
+                )
+            )
+        return True
+
+    def _flush_influx(self) -> bool:
+        if not self._influx.flush():
+            return False
+        self._wake_replayer("influx")
+        return True
+
+    def _publish_mqtt(self, measurements: list[Measurement]) -> bool:
+        sent = [self._mqtt.publish_measurement(m) for m in measurements]
+        return all(sent)
+
+    def _ping_healthcheck(self) -> bool:
+        import requests
+
+        requests.get(self._config.healthcheck_ping_url, timeout=HEALTHCHECK_TIMEOUT_S)
+        return True
+
+    def _open_spool(self, sink: str) -> Spool | None:
+        if not self._config.spool_dir:
+            return None
+        return Spool(
+            self._config.spool_dir,
+            sink,
+            max_bytes=self._config.spool_max_mb * 1024 * 1024,
+        )
+
+    def _wake_replayer(self, sink: str):
+        """A live write to sink succeeded, so replay anything spooled for it now"""
+        replayer = self._replayers.get(sink)
+        if replayer is not None:
+            replayer.wake()
+
+    async def _backfill_once(self, logger: logging.Logger):
+        """Backfill part of one device's gap in InfluxDB from its history.
+
+        At most backfill_max_records are downloaded, for one device per poll, so
+        catching up on a long gap doesn't starve live polling; the rest is
+        picked up by later polls.
+        """
+        for device in self._config.devices:
+            window = self._backfill.pending(device.name)
+            if window is None:
+                continue
+            since, until = window
+            limit = self._config.backfill_max_records
             try:
-                requests.get(
-                    self._config.healthcheck_ping_url, timeout=HEALTHCHECK_TIMEOUT_S
+                history = await self._connections[device.address].read_history(
+                    since, limit
                 )
-            except requests.RequestException as e:
-                logger.error(f"healthcheck ping failed: {e}")
+            except Exception as e:  # noqa: BLE001 - retried on the next poll
+                logger.error(f"failed reading history from {device.name}: {e}")
+                return
+            # the gap's ends were written live:
+            first, last = since + BACKFILL_EDGE_SLACK, until - BACKFILL_EDGE_SLACK
+            records = [
+                Measurement.from_reading(self._config, device, r, t)
+                for t, r in history
+                if first < t < last
+            ]
+            if records and not await asyncio.to_thread(self._influx.write, records):
+                logger.error(f"influx backfill write for {device.name} failed")
+                return
+            done = len(history) < limit or history[-1][0] >= last
+            self._backfill.advance(device.name, until if done else history[-1][0])
+            logger.info(
+                f"backfilled {len(records)} readings for {device.name} after {since}"
+                + ("" if done else "; more to go")
+            )
+            return
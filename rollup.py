@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import collections
+import datetime
+import logging
+import threading
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Final
+
+from config import DeviceConfig
+from measurement import Measurement
+
+if TYPE_CHECKING:
+    from influx import InfluxWriter
+    from mqtt import MqttPublisher
+
+# rollups kept while writing them to InfluxDB fails; beyond this, the oldest
+# are dropped:
+ROLLUP_MAX_PENDING: Final = 10_000
+ROLLUP_TIMEOUT_S: Final = 10.0
+ROLLUP_STATS: Final = ("min", "max", "mean", "last")
+
+
+@dataclass(frozen=True)
+class Rollup:
+    """Statistics of one device's measurements over one window"""
+
+    device: DeviceConfig
+    window_min: int
+    start: datetime.datetime
+    count: int
+    # per measurement field, {field}_{stat} for each of ROLLUP_STATS:
+    fields: dict[str, float]
+
+    def tags(self) -> dict[str, str]:
+        return {
+            "aranet_name": self.device.name,
+            "aranet_addr": self.device.address,
+            "window": f"{self.window_min}m",
+        }
+
+    def all_fields(self) -> dict[str, float]:
+        return self.fields | {"count": self.count}
+
+
+class _Window:
+    """Running statistics of a device's measurements in one window"""
+
+    __slots__ = ("count", "last", "max", "min", "start_s", "sum")
+
+    def __init__(self, start_s: float):
+        self.start_s = start_s
+        self.count = 0
+        self.min: dict[str, float] = {}
+        self.max: dict[str, float] = {}
+        self.sum: dict[str, float] = {}
+        self.last: dict[str, float] = {}
+
+    def add(self, m: Measurement):
+        self.count += 1
+        for k, v in m.fields().items():
+            if isinstance(v, bool) or not isinstance(v, (int, float)):
+                continue
+            if k in self.min:
+                self.min[k] = min(self.min[k], v)
+                self.max[k] = max(self.max[k], v)
+                self.sum[k] += v
+            else:
+                self.min[k] = self.max[k] = self.sum[k] = v
+            self.last[k] = v
+
+    def rollup(self, device: DeviceConfig, window_min: int) -> Rollup:
+        fields: dict[str, float] = {}
+        for k in self.min:
+            fields[f"{k}_min"] = self.min[k]
+            fields[f"{k}_max"] = self.max[k]
+            fields[f"{k}_mean"] = self.sum[k] / self.count
+            fields[f"{k}_last"] = self.last[k]
+        return Rollup(
+            device=device,
+            window_min=window_min,
+            start=datetime.datetime.fromtimestamp(self.start_s, datetime.UTC),
+            count=self.count,
+            fields=fields,
+        )
+
+
+class RollupAggregator:
+    """Rolls each device's measurements up over fixed windows, as they arrive.
+
+    Windows are aligned to multiples of their length since the Unix epoch (so a
+    15 minute window starts on the quarter hour). Each window keeps running
+    statistics, so memory and time per measurement don't depend on its length.
+    A window closes when a measurement from a later window arrives, or once
+    it's been over for grace, by when no measurement taken in it can still
+    arrive. A measurement for a window already closed is left out.
+    """
+
+    def __init__(self, windows_min: list[int], grace: datetime.timedelta):
+        self._windows_min = windows_min
+        self._grace_s = grace.total_seconds()
+        # the open window per (device name, window length in minutes):
+        self._open: dict[tuple[str, int], tuple[DeviceConfig, _Window]] = {}
+        self._closed_until: dict[tuple[str, int], float] = {}
+        self.late = 0  # measurements left out, for arriving after their window
+
+    def add(self, m: Measurement) -> list[Rollup]:
+        """Add m to each window length's window; returns the rollups it closed"""
+        closed = []
+        ts = m.t.timestamp()
+        for window_min in self._windows_min:
+            window_s = window_min * 60
+            start_s = ts - ts % window_s
+            key = (m.device.name, window_min)
+            if start_s < self._closed_until.get(key, float("-inf")):
+                self.late += 1
+                continue
+            current = self._open.get(key)
+            if current is not None and current[1].start_s != start_s:
+                if start_s < current[1].start_s:
+                    self.late += 1
+                    continue
+                closed.append(self._close(key))
+            if key not in self._open:
+                self._open[key] = m.device, _Window(start_s)
+            self._open[key][1].add(m)
+        return closed
+
+    def close_due(self, now: datetime.datetime) -> list[Rollup]:
+        """Close, and return the rollups of, windows that ended over grace ago"""
+        now_s = now.timestamp()
+        return [
+            self._close(key)
+            for key, (_, w) in list(self._open.items())
+            if w.start_s + key[1] * 60 + self._grace_s <= now_s
+        ]
+
+    def _close(self, key: tuple[str, int]) -> Rollup:
+        device, w = self._open.pop(key)
+        self._closed_until[key] = w.start_s + key[1] * 60
+        return w.rollup(device, key[1])
+
+
+class RollupWriter:
+    """Writes closed rollups to InfluxDB and MQTT.
+
+    Rollups InfluxDB doesn't accept stay pending, up to ROLLUP_MAX_PENDING, and
+    are retried on the next write(). MQTT buffers or spools messages itself
+    while disconnected, so rollups are handed to it once. Safe to use from
+    multiple threads.
+    """
+
+    def __init__(
+        self, influx: InfluxWriter | None = None, mqtt: MqttPublisher | None = None
+    ):
+        self._influx = influx
+        self._mqtt = mqtt
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger(__name__)
+        self._influx_pending: collections.deque[Rollup] = collections.deque()
+        # the oldest pending rollups dropped by add(), ever:
+        self._influx_dropped = 0
+        self._mqtt_pending: list[Rollup] = []
+
+    def add(self, rollups: list[Rollup]):
+        if not rollups:
+            return
+        with self._lock:
+            if self._influx is not None:
+                self._influx_pending.extend(rollups)
+                overflow = len(self._influx_pending) - ROLLUP_MAX_PENDING
+                if overflow > 0:
+                    self._logger.warning(
+                        f"too many rollups pending; dropping the oldest {overflow}"
+                    )
+                    for _ in range(overflow):
+                        self._influx_pending.popleft()
+                    self._influx_dropped += overflow
+            if self._mqtt is not None:
+                self._mqtt_pending.extend(rollups)
+
+    def pending(self) -> bool:
+        with self._lock:
+            return bool(self._influx_pending or self._mqtt_pending)
+
+    def write(self) -> bool:
+        """Write pending rollups; returns whether they were all written"""
+        with self._lock:
+            influx_batch = list(self._influx_pending)
+            dropped_before = self._influx_dropped
+            mqtt_batch, self._mqtt_pending = self._mqtt_pending, []
+        ok = True
+        if mqtt_batch:
+            sent = [self._mqtt.publish_rollup(r) for r in mqtt_batch]
+            ok = all(sent)
+        if influx_batch:
+            if self._influx.write_rollups(influx_batch):
+                with self._lock:
+                    # add() may have dropped some of the batch, from the front,
+                    # during the write; the rest are still at the front:
+                    dropped = self._influx_dropped - dropped_before
+                    for _ in range(max(0, len(influx_batch) - dropped)):
+                        self._influx_pending.popleft()
+            else:
+                ok = False
+        return ok
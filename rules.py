@@ -0,0 +1,260 @@
+import collections
+import datetime
+import operator
+from dataclasses import dataclass
+from typing import Final
+
+from co2 import Co2WarningLevel
+from config import AlertRuleConfig, Config
+
+# how each metric reads in a notification, given its value:
+METRIC_FORMATS: Final = {
+    "co2_ppm": "CO2 {:.0f} ppm",
+    "temp_c": "temperature {:.1f} °C",
+    "humidity_pct": "humidity {:.0f}%",
+    "pressure_mbar": "pressure {:.1f} mbar",
+}
+# names of the rules equivalent to co2_yellow and co2_red:
+BUILTIN_CO2_YELLOW: Final = "co2_yellow"
+BUILTIN_CO2_RED: Final = "co2_red"
+# a windowed rule only starts alerting once its readings span this much of the
+# window, so it doesn't alert on the first reading or two:
+WINDOW_MIN_COVERAGE: Final = 0.8
+
+
+class RollingWindow:
+    """The mean, max, or min of the values seen over the last window_s seconds.
+
+    add() is amortized O(1): mean keeps a running sum, and max and min keep a
+    monotonic deque, so each value is appended and evicted once.
+    """
+
+    def __init__(self, window_s: float, aggregate: str):
+        self._window_s = window_s
+        self._aggregate = aggregate
+        # of (Unix time, value), oldest first; for max and min, only the values
+        # that can still become the aggregate:
+        self._values: collections.deque[tuple[float, float]] = collections.deque()
+        self._sum = 0.0
+        # when the readings in the window start, ignoring gaps shorter than it:
+        self._since = 0.0
+        # for max and min, whether a new value makes an older one irrelevant:
+        self._beats = operator.ge if aggregate == "max" else operator.le
+
+    def add(self, t: float, value: float) -> float:
+        """Add the value seen at t, and return the aggregate over the window"""
+        values = self._values
+        if not values or values[-1][0] < t - self._window_s:
+            self._since = t
+        if self._aggregate == "mean":
+            values.append((t, value))
+            self._sum += value
+        else:
+            while values and self._beats(value, values[-1][1]):
+                values.pop()
+            values.append((t, value))
+
+        while values[0][0] < t - self._window_s:
+            _, old = values.popleft()
+            if self._aggregate == "mean":
+                self._sum -= old
+
+        if self._aggregate == "mean":
+            if len(values) == 1:
+                # start over, so float error in the running sum can't build up:
+                self._sum = values[0][1]
+            return self._sum / len(values)
+        return values[0][1]
+
+    @property
+    def covered_s(self) -> float:
+        """How long, up to window_s, the readings in the window span"""
+        return min(self._window_s, self._values[-1][0] - self._since)
+
+
+@dataclass(frozen=True)
+class AlertRule:
+    """An AlertRuleConfig, with the defaults it takes from Config filled in"""
+
+    name: str
+    metric: str
+    aggregate: str
+    window_min: float
+    above: float | None
+    below: float | None
+    clear_at: float
+    level: Co2WarningLevel
+    every: int
+    priority: str
+
+    @staticmethod
+    def from_config(cfg: Config, rc: AlertRuleConfig) -> "AlertRule":
+        level = Co2WarningLevel.from_str(rc.level)
+        red = level == Co2WarningLevel.RED
+        threshold = rc.above if rc.above is not None else rc.below
+        return AlertRule(
+            name=rc.name,
+            metric=rc.metric,
+            aggregate=rc.aggregate,
+            window_min=rc.window_min,
+            above=rc.above,
+            below=rc.below,
+            clear_at=rc.clear_at if rc.clear_at is not None else threshold,
+            level=level,
+            every=rc.every
+            if rc.every is not None
+            else (cfg.notify_red_every if red else cfg.notify_yellow_every),
+            priority=rc.priority
+            if rc.priority is not None
+            else (cfg.ntfy_priority_red if red else cfg.ntfy_priority_yellow),
+        )
+
+    def window_key(self) -> tuple[str, str, float]:
+        return self.metric, self.aggregate, self.window_min
+
+    def triggered(self, value: float, active: bool) -> bool:
+        """Whether the rule is active given value, and whether it was already"""
+        if self.above is not None:
+            return value >= self.clear_at if active else value >= self.above
+        return value <= self.clear_at if active else value <= self.below
+
+    def describe(self, value: float) -> str:
+        text = METRIC_FORMATS[self.metric].format(value)
+        if self.window_min:
+            text += f" ({self.aggregate} over {self.window_min:g} min)"
+        return text
+
+
+def rules_for(cfg: Config) -> list[AlertRule]:
+    """Return the built-in CO2 rules, unless overridden, then the configured ones"""
+    builtins = [
+        AlertRuleConfig(
+            name=BUILTIN_CO2_YELLOW,
+            metric="co2_ppm",
+            aggregate="mean",
+            window_min=0,
+            above=cfg.co2_yellow,
+            below=None,
+            clear_at=None,
+            level="yellow",
+            every=None,
+            priority=None,
+        ),
+        AlertRuleConfig(
+            name=BUILTIN_CO2_RED,
+            metric="co2_ppm",
+            aggregate="mean",
+            window_min=0,
+            above=cfg.co2_red,
+            below=None,
+            clear_at=None,
+            level="red",
+            every=None,
+            priority=None,
+        ),
+    ]
+    configured = {r.name for r in cfg.alert_rules}
+    return [
+        AlertRule.from_config(cfg, rc)
+        for rc in [b for b in builtins if b.name not in configured] + cfg.alert_rules
+    ]
+
+
+@dataclass(frozen=True)
+class MetricAlert:
+    """A metric's alert level after a reading, and the rule that set it"""
+
+    metric: str
+    level: Co2WarningLevel
+    rule: AlertRule | None  # None when level is GREEN
+    value: float | None  # the rule's aggregate; None when level is GREEN
+
+
+_LEVEL_ORDER: Final = {
+    Co2WarningLevel.GREEN: 0,
+    Co2WarningLevel.YELLOW: 1,
+    Co2WarningLevel.RED: 2,
+}
+
+
+class RuleEngine:
+    """Evaluates alert rules against each device's readings as they arrive.
+
+    Each device keeps one RollingWindow per distinct (metric, aggregate,
+    window_min) among the rules, so rules sharing a window share its cost, and
+    evaluating a reading takes time proportional to the number of rules, not to
+    the window length.
+    """
+
+    def __init__(self, cfg: Config):
+        self._rules = rules_for(cfg)
+        self._metrics = list(dict.fromkeys(r.metric for r in self._rules))
+        # per (device name, window key):
+        self._windows: dict[tuple[str, tuple[str, str, float]], RollingWindow] = {}
+        # names of the rules active per device name:
+        self._active: dict[str, set[str]] = {}
+
+    @property
+    def rules(self) -> list[AlertRule]:
+        return self._rules
+
+    def evaluate(
+        self,
+        device: str,
+        t: datetime.datetime,
+        values: dict[str, float | None],
+    ) -> list[MetricAlert]:
+        """Add a device's reading, and return the alert level of each metric ruled on.
+
+        Metrics whose value is missing (None) are skipped, and their rules keep
+        their state.
+        """
+        ts = t.timestamp()
+        # of (aggregate, whether the window is covered enough to alert):
+        aggregates: dict[tuple[str, str, float], tuple[float, bool]] = {}
+        active = self._active.setdefault(device, set())
+        best: dict[str, tuple[AlertRule, float]] = {}
+        for rule in self._rules:
+            value = values.get(rule.metric)
+            if value is None:
+                continue
+            key = rule.window_key()
+            if key not in aggregates:
+                if rule.window_min:
+                    window = self._windows.get((device, key))
+                    if window is None:
+                        window = self._windows[(device, key)] = RollingWindow(
+                            rule.window_min * 60, rule.aggregate
+                        )
+                    aggregate = window.add(ts, value)
+                    covered = (
+                        window.covered_s >= rule.window_min * 60 * WINDOW_MIN_COVERAGE
+                    )
+                    aggregates[key] = aggregate, covered
+                else:
+                    aggregates[key] = value, True
+            aggregate, covered = aggregates[key]
+            if not covered and rule.name not in active:
+                # too little of the window seen yet to start alerting:
+                continue
+            if not rule.triggered(aggregate, rule.name in active):
+                active.discard(rule.name)
+                continue
+            active.add(rule.name)
+            current = best.get(rule.metric)
+            if (
+                current is None
+                or _LEVEL_ORDER[rule.level] > _LEVEL_ORDER[current[0].level]
+            ):
+                best[rule.metric] = rule, aggregate
+
+        alerts = []
+        for metric in self._metrics:
+            if values.get(metric) is None:
+                continue
+            if metric in best:
+                rule, aggregate = best[metric]
+                alerts.append(MetricAlert(metric, rule.level, rule, aggregate))
+            else:
+                alerts.append(MetricAlert(metric, Co2WarningLevel.GREEN, None, None))
+        return alerts
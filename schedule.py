@@ -0,0 +1,183 @@
+import datetime
+import math
+from dataclasses import dataclass
+from typing import Final
+
+from clock import SYSTEM_CLOCK, Clock
+from co2 import Co2WarningLevel
+from config import Config, DeviceConfig
+from measurement import Measurement
+
+# each stable poll lengthens the interval by this factor, up to the ceiling:
+POLL_GROWTH: Final = 1.5
+# CO2 changing slower than this fraction of poll_fast_ppm_per_min is stable:
+POLL_STABLE_FRACTION: Final = 0.25
+# a low battery stretches the interval by this factor:
+POLL_LOW_BATTERY_FACTOR: Final = 2.0
+# with poll_align_refresh, how long after a device's measurement to read it:
+POLL_REFRESH_MARGIN_S: Final = 5.0
+# devices due within this long of each other are polled together:
+POLL_GROUP_S: Final = 5.0
+
+
+@dataclass
+class _DeviceState:
+    t: datetime.datetime  # when its latest reading was measured
+    co2: int
+    rate: float | None  # CO2 change, in ppm/min, since the reading before
+    alerting: bool
+    low_battery: bool
+    refresh_s: int | None  # its measurement interval, if known
+
+
+class PollSchedule:
+    """Chooses when to poll each device next, from what earlier polls read.
+
+    The interval between polls is poll_interval, without poll_adaptive. With
+    it, the interval drops to poll_interval_min while any device's CO2 is
+    yellow or red, or is changing by poll_fast_ppm_per_min or more; grows
+    toward poll_interval_max while every device is green and stable; and is
+    otherwise poll_interval. A device whose battery is at or below
+    poll_low_battery_pct stretches it, to at least poll_interval.
+
+    With Config.poll_aligned(), each device's next poll is instead moved to
+    just after the first measurement it takes once that interval has passed,
+    so polls don't read the same measurement twice.
+    """
+
+    def __init__(self, cfg: Config, clock: Clock = SYSTEM_CLOCK):
+        self._cfg = cfg
+        self._clock = clock
+        self._base_s = cfg.poll_interval * 60
+        self._interval_s = self._base_s
+        self._reason = "poll_interval"
+        self._devices: dict[str, _DeviceState] = {}  # by device name
+        # clock.monotonic() when each device is next due, by device name:
+        self._due_at = {d.name: 0.0 for d in cfg.devices}
+
+    @property
+    def interval_s(self) -> float:
+        return self._interval_s
+
+    @property
+    def reason(self) -> str:
+        """Why the interval is what it is, for logging"""
+        return self._reason
+
+    def effective_interval_s(self) -> float:
+        """The longest time polls of a device are apart, given its measurements"""
+        if not self._cfg.poll_aligned():
+            return self._interval_s
+        refreshes = [s.refresh_s for s in self._devices.values() if s.refresh_s]
+        return max([self._interval_s, *refreshes])
+
+    def spacing_s(self, m: Measurement) -> float:
+        """How far apart polls at the current interval read m's device's measurements"""
+        if not m.refresh_s:
+            return self._interval_s
+        # each poll reads the device's latest measurement, so reads of new ones
+        # are a whole number of its measurement intervals apart:
+        return m.refresh_s * max(1, math.ceil(self._interval_s / m.refresh_s))
+
+    def due(self, now: float) -> list[DeviceConfig]:
+        """Return the devices to poll at now (from clock.monotonic()), in config order"""
+        return [
+            d for d in self._cfg.devices if self._due_at[d.name] <= now + POLL_GROUP_S
+        ]
+
+    def next_due_at(self) -> float:
+        return min(self._due_at.values())
+
+    def is_repeat(self, m: Measurement) -> bool:
+        """Whether m is the same measurement as the device's previous reading"""
+        previous = self._devices.get(m.device.name)
+        if previous is None or not m.refresh_s:
+            return False
+        # the device reports its measurement's age in whole seconds, so the
+        # same one read twice can appear to have been taken a second apart:
+        return abs((m.t - previous.t).total_seconds()) < m.refresh_s / 2
+
+    def update(self, measurements: list[Measurement]) -> bool:
+        """Record new measurements, and choose the next interval.
+
+        Returns whether the interval changed. An empty list changes nothing.
+        """
+        for m in measurements:
+            self._record(m)
+        if not self._cfg.poll_adaptive or not measurements:
+            return False
+        interval_s, reason = self._choose()
+        changed = interval_s != self._interval_s
+        self._interval_s, self._reason = interval_s, reason
+        return changed
+
+    def schedule(self, device: DeviceConfig, polled_at: float, m: Measurement | None):
+        """Set when to next poll device, which was polled at polled_at.
+
+        polled_at is from clock.monotonic(); m is what the poll read, if anything.
+        """
+        due_at = polled_at + self._interval_s
+        if m is not None and m.refresh_s and self._cfg.poll_aligned():
+            age_s = (self._clock.now() - m.t).total_seconds()
+            sampled_at = self._clock.monotonic() - age_s
+            # the first measurement read at or after due_at, give or take the
+            # POLL_GROUP_S devices are polled early by, so polling just after
+            # each measurement doesn't skip every other one:
+            refreshes = max(
+                1,
+                math.ceil(
+                    (due_at - POLL_GROUP_S - POLL_REFRESH_MARGIN_S - sampled_at)
+                    / m.refresh_s
+                ),
+            )
+            due_at = sampled_at + refreshes * m.refresh_s + POLL_REFRESH_MARGIN_S
+        self._due_at[device.name] = due_at
+
+    def _record(self, m: Measurement):
+        previous = self._devices.get(m.device.name)
+        rate = None
+        if previous is not None:
+            minutes = (m.t - previous.t).total_seconds() / 60
+            if minutes > 0:
+                rate = abs(m.co2_ppm - previous.co2) / minutes
+        self._devices[m.device.name] = _DeviceState(
+            t=m.t,
+            co2=m.co2_ppm,
+            rate=rate,
+            alerting=m.co2_level != Co2WarningLevel.GREEN,
+            low_battery=(
+                m.battery_pct is not None
+                and m.battery_pct <= self._cfg.poll_low_battery_pct
+            ),
+            refresh_s=m.refresh_s,
+        )
+
+    def _choose(self) -> tuple[float, str]:
+        cfg = self._cfg
+        states = self._devices.values()
+        rates = [s.rate for s in states if s.rate is not None]
+        max_rate = max(rates, default=0.0)
+        # whether every device has a previous reading to compare:
+        rated = len(rates) == len(cfg.devices)
+
+        ceiling_s = cfg.poll_interval_max * 60
+        if any(s.alerting for s in states):
+            interval_s, reason = cfg.poll_interval_min * 60, "CO2 is yellow or red"
+        elif max_rate >= cfg.poll_fast_ppm_per_min:
+            interval_s, reason = (
+                cfg.poll_interval_min * 60,
+                f"CO2 changing {max_rate:.0f} ppm/min",
+            )
+        elif rated and max_rate < cfg.poll_fast_ppm_per_min * POLL_STABLE_FRACTION:
+            interval_s = min(
+                ceiling_s, max(self._base_s, self._interval_s * POLL_GROWTH)
+            )
+            reason = "CO2 stable"
+        else:
+            interval_s, reason = self._base_s, "poll_interval"
+        if any(s.low_battery for s in states):
+            interval_s = min(
+                ceiling_s, max(self._base_s, interval_s * POLL_LOW_BATTERY_FACTOR)
+            )
+            reason += "; low battery"
+        return interval_s, reason
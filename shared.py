@@ -0,0 +1,192 @@
+import ctypes
+import datetime
+import math
+import multiprocessing
+import platform
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from typing import Final, TypeVar
+
+# sinks whose latest outcome is kept in SharedState, in layout order:
+SHARED_SINKS: Final = (
+    "ntfy",
+    "influx",
+    "mqtt",
+    "store",
+    "rollup",
+    "healthcheck",
+)
+# room for the /latest JSON of several hundred devices:
+LATEST_CAPACITY_B: Final = 256 * 1024
+# room for the metrics of several hundred devices:
+METRICS_CAPACITY_B: Final = 1024 * 1024
+
+# optimistic reads of a _Seqlock before falling back to taking its lock:
+SEQLOCK_READ_TRIES: Final = 100
+# whether this CPU makes each process's stores to memory visible to others in
+# the order they were made, which optimistic _Seqlock reads rely on; x86 does,
+# but ARM (as on a Raspberry Pi) doesn't:
+_STORES_ORDERED: Final = platform.machine().lower() in (
+    "x86_64",
+    "amd64",
+    "i386",
+    "i686",
+)
+
+_T = TypeVar("_T")
+
+# SharedState's slots; each holds a Unix time (or, for _POLL_INTERVAL, seconds),
+# or NaN for None:
+_LAST_POLL_AT: Final = 0
+_MUTE_UNTIL: Final = 1
+_POLL_INTERVAL: Final = 2
+_SINKS_AT: Final = 3  # then each sink's (last ok, last failed), in SHARED_SINKS order
+
+
+class _Seqlock:
+    """A sequence lock over some shared memory.
+
+    Writers take a lock, and bump the sequence number before and after writing,
+    so it's odd while a write is in progress. Readers don't lock: they copy the
+    memory, and retry if the sequence number was odd or changed meanwhile. Writes
+    here are rare and take microseconds, so readers almost never retry; after
+    SEQLOCK_READ_TRIES tries, yielding the CPU between them, a reader takes the
+    lock instead.
+
+    Python has no memory fences, so a reader can only trust the sequence number
+    if stores become visible to other processes in order. On CPUs that don't
+    guarantee that (ordered=False, the default off x86), readers always take the
+    lock, whose semaphore operations are full memory barriers.
+    """
+
+    def __init__(self, ordered: bool = _STORES_ORDERED):
+        self._seq = multiprocessing.RawValue(ctypes.c_uint64, 0)
+        self._write_lock = multiprocessing.Lock()
+        self._ordered = ordered
+
+    @contextmanager
+    def writing(self) -> Iterator[None]:
+        with self._write_lock:
+            self._seq.value += 1
+            try:
+                yield
+            finally:
+                self._seq.value += 1
+
+    def read(self, copy: Callable[[], _T]) -> _T:
+        if self._ordered:
+            for _ in range(SEQLOCK_READ_TRIES):
+                seq = self._seq.value
+                if seq % 2 == 0:
+                    result = copy()
+                    if self._seq.value == seq:
+                        return result
+                # let the writer, if it's on this CPU, finish:
+                time.sleep(0)
+        with self._write_lock:
+            return copy()
+
+
+def _to_ts(t: datetime.datetime | None) -> float:
+    return math.nan if t is None else t.timestamp()
+
+
+def _from_ts(ts: float) -> datetime.datetime | None:
+    return None if math.isnan(ts) else datetime.datetime.fromtimestamp(ts, datetime.UTC)
+
+
+class SharedState:
+    """Timestamps shared by the poller, notifier, and web server.
+
+    This is a fixed-layout block of shared memory, so reading it costs a few
+    memory loads rather than an IPC round trip. Create it before starting the
+    child processes that use it.
+    """
+
+    def __init__(self):
+        self._lock = _Seqlock()
+        self._slots = multiprocessing.RawArray(
+            ctypes.c_double, [math.nan] * (_SINKS_AT + 2 * len(SHARED_SINKS))
+        )
+
+    def _get(self, slot: int) -> datetime.datetime | None:
+        return _from_ts(self._lock.read(lambda: self._slots[slot]))
+
+    def _set(self, slot: int, t: datetime.datetime | None):
+        with self._lock.writing():
+            self._slots[slot] = _to_ts(t)
+
+    @property
+    def last_poll_at(self) -> datetime.datetime | None:
+        """When a device was last read successfully"""
+        return self._get(_LAST_POLL_AT)
+
+    @last_poll_at.setter
+    def last_poll_at(self, t: datetime.datetime | None):
+        self._set(_LAST_POLL_AT, t)
+
+    @property
+    def mute_until(self) -> datetime.datetime | None:
+        return self._get(_MUTE_UNTIL)
+
+    @mute_until.setter
+    def mute_until(self, t: datetime.datetime | None):
+        self._set(_MUTE_UNTIL, t)
+
+    @property
+    def poll_interval_s(self) -> float | None:
+        """The poller's current interval between polls"""
+        value = self._lock.read(lambda: self._slots[_POLL_INTERVAL])
+        return None if math.isnan(value) else value
+
+    @poll_interval_s.setter
+    def poll_interval_s(self, value: float | None):
+        with self._lock.writing():
+            self._slots[_POLL_INTERVAL] = math.nan if value is None else value
+
+    def record_sinks(self, t: datetime.datetime, ok: dict[str, bool]):
+        """Record the outcome, at t, of a write to each of the given sinks"""
+        with self._lock.writing():
+            for sink, sink_ok in ok.items():
+                slot = _SINKS_AT + 2 * SHARED_SINKS.index(sink)
+                self._slots[slot if sink_ok else slot + 1] = t.timestamp()
+
+    def sinks(
+        self,
+    ) -> dict[str, tuple[datetime.datetime | None, datetime.datetime | None]]:
+        """Return when each sink last succeeded and failed"""
+        slots = self._lock.read(lambda: self._slots[_SINKS_AT:])
+        return {
+            sink: (_from_ts(slots[2 * i]), _from_ts(slots[2 * i + 1]))
+            for i, sink in enumerate(SHARED_SINKS)
+        }
+
+
+class SharedBuffer:
+    """Bytes in shared memory, replaced whole by one process and read by others.
+
+    Like SharedState, reads don't make IPC round trips. Setting a value
+    longer than capacity bytes raises ValueError.
+    """
+
+    def __init__(self, capacity: int):
+        self._lock = _Seqlock()
+        self._len = multiprocessing.RawValue(ctypes.c_size_t, 0)
+        self._buf = multiprocessing.RawArray(ctypes.c_char, capacity)
+
+    @property
+    def value(self) -> bytes:
+        return self._lock.read(
+            lambda: ctypes.string_at(ctypes.addressof(self._buf), self._len.value)
+        )
+
+    @value.setter
+    def value(self, data: bytes):
+        if len(data) > len(self._buf):
+            raise ValueError(
+                f"{len(data)} bytes don't fit in a {len(self._buf)} byte buffer"
+            )
+        with self._lock.writing():
+            ctypes.memmove(self._buf, data, len(data))
+            self._len.value = len(data)
@@ -0,0 +1,281 @@
+"""Run an4mon's pipeline over days of simulated readings, in seconds.
+
+Usage: ./venv/bin/python simulate.py [--days N] [--devices N] [--interval-s S]
+       [--failure-rate F] [--seed N] [--config FILE] [--trace-heap] [--verbose]
+
+The poller reads scripted fake Aranet4s (fakeble.FakeBackend) on a virtual
+clock, so each poll starts as soon as the one before it finishes. Everything
+after the read is real: readings go through the sink fanout to the notifier's
+alert rules, the local store, InfluxDB, and rollups. ntfy and InfluxDB are a
+local stand-in server that counts what it's sent. At the end, it queries the
+web server's /health at the simulated time, and reports throughput, the
+notifications sent, and memory use at the end of each simulated day, to spot
+growth: the process's peak RSS or, with --trace-heap, the Python heap (which is
+exact, but slows the simulation several times over). Runs with the same options
+send the same notifications.
+
+--config takes a config file whose alerting and polling keys (e.g. alert_rules,
+co2_red, poll_adaptive) override the simulation's defaults; its devices, sinks,
+and servers are replaced.
+"""
+
+import argparse
+import asyncio
+import collections
+import datetime
+import gzip
+import http.server
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Final
+
+from clock import VirtualClock
+from config import Config
+from fakeble import FakeBackend, FakeDevice
+from log import LOG_DEFAULT_FMT
+from ntfy import Notifier, NotifyInbox
+from poller import Poller
+from shared import LATEST_CAPACITY_B, METRICS_CAPACITY_B, SharedBuffer, SharedState
+from web import WebServer
+
+# a Monday, so the first simulated day is a workday:
+SIM_START: Final = datetime.datetime(2026, 1, 5, tzinfo=datetime.UTC)
+SIM_MEASUREMENT_NAME: Final = "aranet4"
+SIM_NTFY_TOPIC: Final = "an4mon-sim"
+# config keys the simulation sets, whatever --config says:
+_SIM_KEYS: Final = {
+    "notify": True,
+    "ntfy_topic": SIM_NTFY_TOPIC,
+    "ntfy_token": None,
+    "web": False,
+    "web_external_base_url": None,
+    "ble_read_mode": "connect",
+    "influx": True,
+    "influx_api_version": 2,
+    "influx_host": "127.0.0.1",
+    "influx_bucket": "an4mon-sim",
+    "influx_token": "an4mon-sim",
+    "influx_measurement_name": SIM_MEASUREMENT_NAME,
+    "influx_flush_interval_s": 1,
+    "rollup_influx_bucket": None,
+    "rollup_influx_measurement_name": None,
+    "mqtt": False,
+    "backfill": False,
+    "spool_dir": None,
+    "healthcheck_ping_url": None,
+    "store": True,
+}
+
+
+def _peak_rss_mib() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # in bytes on macOS, and KiB elsewhere:
+    return rss / 2**20 if sys.platform == "darwin" else rss / 2**10
+
+
+def _heap_mib() -> float:
+    return tracemalloc.get_traced_memory()[0] / 2**20
+
+
+class _StandIn(http.server.BaseHTTPRequestHandler):
+    """Accepts InfluxDB v2 writes and ntfy notifications, and counts them"""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        server: _StandInServer = self.server
+        with server.lock:
+            if self.path.startswith("/api/v2/write"):
+                for line in gzip.decompress(body).decode("utf-8").split("\n"):
+                    server.points[line.split(",", 1)[0]] += 1
+                self.send_response(204)
+            else:
+                server.notifications.append(
+                    (self.headers.get("Tags", ""), body.decode("utf-8"))
+                )
+                self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _StandInServer(http.server.ThreadingHTTPServer):
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _StandIn)
+        self.lock = threading.Lock()
+        self.points: collections.Counter[str] = collections.Counter()
+        self.notifications: list[tuple[str, str]] = []  # of (tags, message)
+
+
+def _config(args: argparse.Namespace, port: int, store_file: str) -> Config:
+    data = {"co2_yellow": 1000, "co2_red": 1400, "poll_interval": 1}
+    if args.config:
+        with open(args.config, "r") as f:
+            data |= json.load(f)
+    data |= _SIM_KEYS | {
+        "devices": [
+            {"address": f"FA:KE:00:00:00:{i:02X}", "name": f"sim{i}"}
+            for i in range(args.devices)
+        ],
+        "ntfy_server": f"http://127.0.0.1:{port}",
+        "influx_port": port,
+        "store_file": store_file,
+        "rollup_windows_min": data.get("rollup_windows_min") or [15, 60],
+    }
+    for key in [k for k in data if k.startswith(("device_", "aranet_"))]:
+        del data[key]
+    return Config.from_dict(data)
+
+
+async def simulate(args: argparse.Namespace, server: _StandInServer, store_dir: str):
+    logger = logging.getLogger("simulate")
+    cfg = _config(args, server.server_address[1], os.path.join(store_dir, "sim.db"))
+    clock = VirtualClock(SIM_START)
+    backend = FakeBackend(
+        [
+            FakeDevice(
+                d.address,
+                interval_s=args.interval_s,
+                failure_rate=args.failure_rate,
+            )
+            for d in cfg.devices
+        ],
+        clock,
+        seed=args.seed,
+    )
+    log_level = logging.getLogger().level
+    inbox = NotifyInbox()
+    state = SharedState()
+    latest_buf = SharedBuffer(LATEST_CAPACITY_B)
+    metrics_bufs = [SharedBuffer(METRICS_CAPACITY_B), SharedBuffer(METRICS_CAPACITY_B)]
+    poller = Poller(
+        cfg,
+        inbox,
+        log_level,
+        False,
+        state,
+        latest_buf,
+        metrics_bufs[0],
+        clock=clock,
+        ble_backend=backend,
+    )
+    notifier = Notifier(
+        cfg, inbox, log_level, state=state, metrics_buf=metrics_bufs[1], clock=clock
+    )
+    web = WebServer(cfg, state, latest_buf, metrics_bufs, inbox, log_level, clock=clock)
+
+    end = SIM_START + datetime.timedelta(days=args.days)
+    next_day = SIM_START + datetime.timedelta(days=1)
+    memory_mib: list[float] = []
+    measure_memory = _heap_mib if args.trace_heap else _peak_rss_mib
+    polls = 0
+    if args.trace_heap:
+        tracemalloc.start()
+    started_at = time.monotonic()
+    poller.start(logger)
+    try:
+        while clock.now() < end:
+            clock.advance_to(poller.next_due_at())
+            await poller.poll_due(logger)
+            notifier.drain(logger)
+            polls += 1
+            if clock.now() >= next_day:
+                memory_mib.append(measure_memory())
+                next_day += datetime.timedelta(days=1)
+    finally:
+        await poller.stop(logger)
+    elapsed_s = time.monotonic() - started_at
+    if args.trace_heap:
+        tracemalloc.stop()
+
+    health = web.app().test_client().get("/health")
+    simulated_s = (clock.now() - SIM_START).total_seconds()
+    points = server.points[SIM_MEASUREMENT_NAME]
+    rollups = server.points[cfg.rollup_influx_measurement_name]
+    by_tag = collections.Counter(tags for tags, _ in server.notifications)
+    print(
+        f"simulated {simulated_s / 86400:.1f} days of {len(cfg.devices)} device(s) "
+        f"in {elapsed_s:.1f}s ({simulated_s / elapsed_s:,.0f}x real time)"
+    )
+    print(
+        f"polls: {polls} ({polls / elapsed_s:,.0f}/s); device reads: {backend.reads}; "
+        f"injected failures: {backend.failures}"
+    )
+    print(f"influx: {points} points, {rollups} rollups")
+    print(
+        f"notifications: {len(server.notifications)}"
+        + "".join(f"; {tag or '(untagged)'}: {n}" for tag, n in sorted(by_tag.items()))
+    )
+    failed = [sink for sink, (_, failed_at) in state.sinks().items() if failed_at]
+    print(f"sinks that failed a write: {', '.join(failed) or 'none'}")
+    print(f"/health at the end: {health.status_code} {health.get_json()['status']}")
+    print(
+        ("Python heap" if args.trace_heap else "peak RSS")
+        + " by simulated day (MiB): "
+        + " ".join(f"{mib:.1f}" for mib in memory_mib)
+    )
+    if args.verbose:
+        for tags, message in server.notifications:
+            print(f"  [{tags}] {message}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run an4mon's pipeline over days of simulated readings"
+    )
+    parser.add_argument("--days", type=float, default=7, help="Days to simulate")
+    parser.add_argument("--devices", type=int, default=3, help="Fake devices")
+    parser.add_argument(
+        "--interval-s",
+        type=int,
+        default=60,
+        help="How often each fake device measures, in seconds",
+    )
+    parser.add_argument(
+        "--failure-rate",
+        type=float,
+        default=0.0,
+        help="Chance each fake connection or read fails",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Seed for fake values")
+    parser.add_argument(
+        "--config", help="JSON config whose alerting and polling keys to use"
+    )
+    parser.add_argument(
+        "--trace-heap",
+        action="store_true",
+        help="Report the Python heap, rather than peak RSS, each simulated day",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        help="Log at info level, and list every notification",
+    )
+    args = parser.parse_args()
+    # otherwise, injected failures would flood the log with expected errors:
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.CRITICAL,
+        format=LOG_DEFAULT_FMT,
+    )
+
+    server = _StandInServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with tempfile.TemporaryDirectory() as store_dir:
+            asyncio.run(simulate(args, server, store_dir))
+    finally:
+        server.shutdown()
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+import json
+import logging
+import os
+import threading
+from collections.abc import Callable
+from typing import Final
+
+# a full spool is split across about this many segment files, so eviction drops
+# the oldest ~1/SPOOL_SEGMENTS of it at a time:
+SPOOL_SEGMENTS: Final = 8
+SPOOL_REPLAY_INTERVAL_S: Final = 30.0
+SPOOL_REPLAY_BATCH: Final = 1000
+
+
+class Spool:
+    """An append-only, on-disk queue of records one sink failed to deliver.
+
+    Records are JSON lines in numbered segment files in directory, named after
+    the sink. Each append() is a single write and fsync, however many records it
+    carries. The read position is saved alongside the segments, so undelivered
+    records survive restarts. When the spool grows past max_bytes, its oldest
+    segments are dropped. Safe to use from multiple threads.
+    """
+
+    def __init__(self, directory: str, name: str, max_bytes: int):
+        self._dir = directory
+        self._name = name
+        self._max_bytes = max_bytes
+        self._segment_max_bytes = max(1, max_bytes // SPOOL_SEGMENTS)
+        self._logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        prefix = f"{name}."
+        self._segments: list[int] = sorted(
+            int(f.removeprefix(prefix).removesuffix(".jsonl"))
+            for f in os.listdir(directory)
+            if f.startswith(prefix) and f.endswith(".jsonl")
+        )
+        self._read_seq, self._read_offset = self._load_position()
+        # never append to a segment left over from a previous run; its last line
+        # may have been cut short by a crash:
+        self._write_seq = (self._segments[-1] + 1) if self._segments else 0
+
+    def append(self, records: list[dict]):
+        if not records:
+            return
+        data = "".join(
+            json.dumps(r, separators=(",", ":")) + "\n" for r in records
+        ).encode("utf-8")
+        with self._lock:
+            if (
+                self._segments
+                and self._segments[-1] == self._write_seq
+                and self._size(self._write_seq) + len(data) > self._segment_max_bytes
+            ):
+                self._write_seq += 1
+            if not self._segments or self._segments[-1] != self._write_seq:
+                self._segments.append(self._write_seq)
+            with open(self._path(self._write_seq), "ab") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            self._evict()
+
+    def pending(self) -> bool:
+        with self._lock:
+            self._skip_consumed()
+            return bool(self._segments) and self._read_offset < self._size(
+                self._read_seq
+            )
+
+    def peek(self, limit: int) -> tuple[list[dict], tuple[int, int]]:
+        """Return up to limit of the oldest records, and the read position after them.
+
+        Pass that position to commit() once the records are delivered.
+        """
+        with self._lock:
+            self._skip_consumed()
+            if not self._segments:
+                return [], (self._read_seq, self._read_offset)
+            seq, offset = self._read_seq, self._read_offset
+            records = []
+            with open(self._path(seq), "rb") as f:
+                f.seek(offset)
+                while len(records) < limit:
+                    line = f.readline()
+                    if not line:
+                        break
+                    offset += len(line)
+                    if not line.endswith(b"\n"):
+                        # appends hold the lock, so this is a record cut short by
+                        # a crash during a previous run:
+                        self._logger.warning(
+                            f"{self._name} spool: skipping truncated record"
+                        )
+                        break
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        self._logger.warning(
+                            f"{self._name} spool: skipping corrupt record"
+                        )
+            return records, (seq, offset)
+
+    def commit(self, position: tuple[int, int]):
+        with self._lock:
+            seq, offset = position
+            if seq != self._read_seq or seq not in self._segments:
+                return  # evicted while its records were being delivered
+            self._read_offset = max(self._read_offset, offset)
+            self._skip_consumed()
+            self._save_position()
+
+    def _skip_consumed(self):
+        """Delete fully read segments, other than the one being written"""
+        while self._segments:
+            seq = self._segments[0]
+            if seq != self._read_seq:
+                self._read_seq, self._read_offset = seq, 0
+            if seq == self._write_seq or self._read_offset < self._size(seq):
+                return
+            self._remove(seq)
+
+    def _evict(self):
+        total = sum(self._size(seq) for seq in self._segments)
+        evicted = False
+        while total > self._max_bytes and len(self._segments) > 1:
+            seq = self._segments[0]
+            total -= self._size(seq)
+            self._remove(seq)
+            evicted = True
+        if evicted:
+            self._logger.warning(
+                f"{self._name} spool is over {self._max_bytes} bytes; "
+                f"dropped its oldest records"
+            )
+            self._save_position()
+
+    def _remove(self, seq: int):
+        self._segments.remove(seq)
+        try:
+            os.remove(self._path(seq))
+        except FileNotFoundError:
+            pass
+        if self._segments and seq == self._read_seq:
+            self._read_seq, self._read_offset = self._segments[0], 0
+
+    def _size(self, seq: int) -> int:
+        try:
+            return os.path.getsize(self._path(seq))
+        except FileNotFoundError:
+            return 0
+
+    def _path(self, seq: int) -> str:
+        return os.path.join(self._dir, f"{self._name}.{seq:08d}.jsonl")
+
+    def _position_path(self) -> str:
+        return os.path.join(self._dir, f"{self._name}.position")
+
+    def _load_position(self) -> tuple[int, int]:
+        try:
+            with open(self._position_path(), "r") as f:
+                seq, offset = json.load(f)
+        except (FileNotFoundError, ValueError):
+            seq, offset = 0, 0
+        if seq not in self._segments:
+            return (self._segments[0] if self._segments else 0), 0
+        return seq, offset
+
+    def _save_position(self):
+        # write-then-rename, so a crash mid-write can't lose the position:
+        tmp_path = f"{self._position_path()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump([self._read_seq, self._read_offset], f)
+        os.replace(tmp_path, self._position_path())
+
+
+class SpoolReplayer(threading.Thread):
+    """Background thread that delivers a Spool's records, oldest first.
+
+    It tries every interval_s, or as soon as wake() is called (e.g. after a live
+    write to the sink succeeded), and drains the spool in batches until it's
+    empty or send fails.
+    """
+
+    def __init__(
+        self,
+        spool: Spool,
+        send: Callable[[list[dict]], bool],
+        name: str,
+        batch_size: int = SPOOL_REPLAY_BATCH,
+        interval_s: float = SPOOL_REPLAY_INTERVAL_S,
+    ):
+        super().__init__(name=f"{name}-spool-replayer", daemon=True)
+        self._spool = spool
+        self._send = send
+        self._batch_size = batch_size
+        self._interval_s = interval_s
+        self._wake = threading.Event()
+        self._logger = logging.getLogger(__name__)
+
+    def wake(self):
+        self._wake.set()
+
+    def run(self):
+        while True:
+            self._wake.wait(timeout=self._interval_s)
+            self._wake.clear()
+            try:
+                self._drain()
+            except Exception as e:  # noqa: BLE001 - keep replaying on the next wake
+                self._logger.error(f"{self.name}: {e}")
+
+    def _drain(self):
+        replayed = 0
+        while True:
+            records, position = self._spool.peek(self._batch_size)
+            if not records:
+                self._spool.commit(position)
+                break
+            if not self._send(records):
+                break
+            self._spool.commit(position)
+            replayed += len(records)
+        if replayed:
+            self._logger.info(f"{self.name}: replayed {replayed} spooled records")
@@ -0,0 +1,156 @@
+import datetime
+import logging
+import pathlib
+import sqlite3
+import threading
+import time
+from collections.abc import Iterator
+from typing import Final
+
+from measurement import Measurement
+
+STORE_TIMEOUT_S: Final = 5.0
+STORE_PRUNE_INTERVAL_S: Final = 60 * 60
+# rows fetched from SQLite at a time while streaming a query's results:
+STORE_FETCH_ROWS: Final = 500
+
+# columns of the rows query_readings yields, in order:
+STORE_COLUMNS: Final = (
+    "device",
+    "time",
+    "co2_ppm",
+    "temp_c",
+    "humidity_pct",
+    "pressure_mbar",
+    "rssi",
+)
+
+_SCHEMA: Final = """
+CREATE TABLE IF NOT EXISTS readings (
+    device TEXT NOT NULL,
+    t INTEGER NOT NULL,  -- Unix time, in seconds
+    co2_ppm INTEGER NOT NULL,
+    temp_c REAL NOT NULL,
+    humidity_pct REAL NOT NULL,
+    pressure_mbar REAL NOT NULL,
+    rssi INTEGER NOT NULL,
+    PRIMARY KEY (device, t)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS readings_t ON readings (t);
+"""
+
+
+class ReadingStore:
+    """Writes readings to a local SQLite database, kept for retention_days.
+
+    Readings are buffered by add() and inserted together, in one transaction, by
+    flush(). The database is in WAL mode, so the web server can query it (via
+    query_readings) while the poller writes.
+    """
+
+    def __init__(self, path: str, retention_days: int):
+        self._retention = datetime.timedelta(days=retention_days)
+        self._logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._buffer: list[tuple] = []
+        self._pruned_at: float | None = None  # time.monotonic()
+        # flushes run on a sink worker thread, not the thread that opened it:
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # in WAL mode, NORMAL can lose the last transactions on power loss, but
+        # never corrupts the database; that's a fine trade for fewer fsyncs:
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+    def add(self, m: Measurement):
+        row = (
+            m.device.name,
+            int(m.t.timestamp()),
+            m.co2_ppm,
+            m.temp_c,
+            m.humidity_pct,
+            m.pressure_mbar,
+            m.rssi,
+        )
+        with self._lock:
+            self._buffer.append(row)
+
+    def flush(self) -> bool:
+        """Insert all buffered readings; returns whether that succeeded"""
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+            try:
+                with self._db:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO readings VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        rows,
+                    )
+                    self._prune()
+            except sqlite3.Error as e:
+                self._logger.error(f"store write failed: {e}")
+                # keep them for the next flush; the database is local, so
+                # failures are rare and this can't grow for long:
+                self._buffer = rows + self._buffer
+                return False
+        return True
+
+    def _prune(self):
+        now = time.monotonic()
+        if (
+            self._pruned_at is not None
+            and now - self._pruned_at < STORE_PRUNE_INTERVAL_S
+        ):
+            return
+        self._pruned_at = now
+        cutoff = datetime.datetime.now(datetime.UTC) - self._retention
+        deleted = self._db.execute(
+            "DELETE FROM readings WHERE t < ?", (int(cutoff.timestamp()),)
+        ).rowcount
+        if deleted:
+            self._logger.info(f"pruned {deleted} readings older than {cutoff}")
+
+    def close(self):
+        self._db.close()
+
+
+def query_readings(
+    path: str,
+    since: datetime.datetime,
+    until: datetime.datetime,
+    device: str | None = None,
+) -> Iterator[tuple]:
+    """Return readings in [since, until], oldest first, as rows of STORE_COLUMNS.
+
+    The database is opened read-only and queried right away, so errors (like a
+    database that doesn't exist yet) are raised here, as sqlite3.Error. Rows are
+    then fetched STORE_FETCH_ROWS at a time as the iterator is consumed, so a
+    long query can be streamed without holding all of its results in memory.
+    """
+    db = sqlite3.connect(f"{pathlib.Path(path).absolute().as_uri()}?mode=ro", uri=True)
+    try:
+        sql = (
+            "SELECT device, t, co2_ppm, temp_c, humidity_pct, pressure_mbar, rssi "
+            "FROM readings WHERE t >= ? AND t <= ?"
+        )
+        params: list = [int(since.timestamp()), int(until.timestamp())]
+        if device is not None:
+            sql += " AND device = ?"
+            params.append(device)
+        cursor = db.execute(sql + " ORDER BY t, device", params)
+    except sqlite3.Error:
+        db.close()
+        raise
+    return _fetch(db, cursor)
+
+
+def _fetch(db: sqlite3.Connection, cursor: sqlite3.Cursor) -> Iterator[tuple]:
+    try:
+        while rows := cursor.fetchmany(STORE_FETCH_ROWS):
+            for row in rows:
+                yield (
+                    row[0],
+                    datetime.datetime.fromtimestamp(row[1], datetime.UTC),
+                    *row[2:],
+                )
+    finally:
+        db.close()
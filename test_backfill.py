@@ -0,0 +1,106 @@
+import datetime
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from backfill import BackfillState
+
+T0 = datetime.datetime(2026, 1, 1, 12, 0, tzinfo=datetime.UTC)
+MAX_GAP = datetime.timedelta(minutes=4)
+
+
+def _t(minutes: int) -> datetime.datetime:
+    return T0 + datetime.timedelta(minutes=minutes)
+
+
+class TestBackfillState(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "backfill.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_first_write_has_nothing_pending(self):
+        state = BackfillState(self.path, MAX_GAP)
+        state.record_live_writes([("office", _t(0))])
+        self.assertIsNone(state.pending("office"))
+        self.assertIsNone(state.pending("bedroom"))
+
+    def test_regular_writes_have_nothing_pending(self):
+        state = BackfillState(self.path, MAX_GAP)
+        for m in range(0, 20, 2):
+            state.record_live_writes([("office", _t(m))])
+        self.assertIsNone(state.pending("office"))
+
+    def test_saves_once_per_batch(self):
+        state = BackfillState(self.path, MAX_GAP)
+        with mock.patch.object(state, "save") as save:
+            state.record_live_writes([("office", _t(m)) for m in range(0, 20, 2)])
+        save.assert_called_once()
+
+    def test_gap_is_pending(self):
+        state = BackfillState(self.path, MAX_GAP)
+        state.record_live_writes([("office", _t(0))])
+        state.record_live_writes([("office", _t(30))])
+        state.record_live_writes([("office", _t(32))])
+        # ends at the first write after it, however many follow:
+        self.assertEqual(state.pending("office"), (_t(0), _t(30)))
+
+    def test_gaps_queue(self):
+        state = BackfillState(self.path, MAX_GAP)
+        for m in (0, 10, 12, 30):
+            state.record_live_writes([("office", _t(m))])
+        self.assertEqual(state.pending("office"), (_t(0), _t(10)))
+        state.advance("office", _t(10))
+        self.assertEqual(state.pending("office"), (_t(12), _t(30)))
+        state.advance("office", _t(30))
+        self.assertIsNone(state.pending("office"))
+
+    def test_gap_of_max_gap_is_pending(self):
+        state = BackfillState(self.path, MAX_GAP)
+        state.record_live_writes([("office", _t(0))])
+        state.record_live_writes([("office", _t(4))])
+        self.assertEqual(state.pending("office"), (_t(0), _t(4)))
+
+    def test_max_gap_per_device(self):
+        state = BackfillState(self.path, MAX_GAP)
+        state.set_max_gap("office", datetime.timedelta(minutes=15))
+        for m in range(0, 30, 10):
+            state.record_live_writes([("office", _t(m))])
+        self.assertIsNone(state.pending("office"))
+
+    def test_missed_poll_is_pending(self):
+        state = BackfillState(self.path, MAX_GAP)
+        state.record_live_writes([("office", _t(0))])
+        state.record_missed("office", _t(2))
+        # a write of a measurement taken before the missed poll isn't a gap:
+        state.record_live_writes([("office", _t(1))])
+        self.assertIsNone(state.pending("office"))
+        state.record_live_writes([("office", _t(3))])
+        self.assertEqual(state.pending("office"), (_t(1), _t(3)))
+
+    def test_advance(self):
+        state = BackfillState(self.path, MAX_GAP)
+        state.record_live_writes([("office", _t(0))])
+        state.record_live_writes([("office", _t(30))])
+        state.advance("office", _t(10))
+        self.assertEqual(state.pending("office"), (_t(10), _t(30)))
+        state.advance("office", _t(30))
+        self.assertIsNone(state.pending("office"))
+        state.record_live_writes([("office", _t(32))])
+        self.assertIsNone(state.pending("office"))
+
+    def test_resumes_after_restart(self):
+        state = BackfillState(self.path, MAX_GAP)
+        state.record_live_writes([("office", _t(0))])
+        state.record_live_writes([("office", _t(30))])
+        state.advance("office", _t(10))
+        self.assertEqual(
+            BackfillState(self.path, MAX_GAP).pending("office"), (_t(10), _t(30))
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import asyncio
+import datetime
+import unittest
+
+from clock import VirtualClock
+
+T0 = datetime.datetime(2026, 1, 5, tzinfo=datetime.UTC)
+
+
+class TestVirtualClock(unittest.TestCase):
+    def test_sleep_advances(self):
+        clock = VirtualClock(T0)
+        asyncio.run(clock.sleep(90))
+        self.assertEqual(90, clock.monotonic())
+        self.assertEqual(T0 + datetime.timedelta(seconds=90), clock.now())
+        clock.advance_to(30)
+        self.assertEqual(90, clock.monotonic())
+
+    def test_concurrent_sleepers_wake_in_order(self):
+        clock = VirtualClock(T0)
+        woke = []
+
+        async def sleeper(seconds: float):
+            await clock.sleep(seconds)
+            woke.append((seconds, clock.monotonic()))
+
+        async def run():
+            await asyncio.gather(sleeper(4), sleeper(0), sleeper(2))
+
+        asyncio.run(run())
+        # staggered like this, they overlap, rather than add up:
+        self.assertEqual([(0, 0), (2, 2), (4, 4)], woke)
+
+    def test_cancelled_sleeper_is_forgotten(self):
+        clock = VirtualClock(T0)
+
+        async def run():
+            task = asyncio.create_task(clock.sleep(10))
+            await asyncio.sleep(0)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            await clock.sleep(5)
+
+        asyncio.run(run())
+        self.assertEqual(5, clock.monotonic())
+
+
+if __name__ == "__main__":
+    unittest.main()
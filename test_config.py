@@ -23,6 +23,183 @@ class TestPollInterval(unittest.TestCase):
                 Config.from_dict(_base_dict() | {"poll_interval": bad})
 
 
+class TestDevices(unittest.TestCase):
+    def test_single_device_keys(self):
+        cfg = Config.from_dict(_base_dict())
+        self.assertEqual(len(cfg.devices), 1)
+        self.assertEqual(cfg.devices[0].address, "test-addr")
+        self.assertEqual(cfg.devices[0].name, "test")
+        self.assertEqual(cfg.devices[0].room_name, "Office")
+
+    def test_single_device_requires_address_and_name(self):
+        for key in ("aranet_device_address", "device_name"):
+            base = _base_dict()
+            del base[key]
+            with self.assertRaises(ConfigValidationError):
+                Config.from_dict(base)
+
+    def test_devices_list(self):
+        base = _base_dict()
+        del base["aranet_device_address"]
+        del base["device_name"]
+        cfg = Config.from_dict(
+            base
+            | {
+                "devices": [
+                    {"address": "addr-1", "name": "office"},
+                    {"address": "addr-2", "name": "bedroom", "room_name": "Bedroom"},
+                ]
+            }
+        )
+        self.assertEqual([d.name for d in cfg.devices], ["office", "bedroom"])
+        self.assertEqual([d.room_name for d in cfg.devices], ["Office", "Bedroom"])
+
+    def test_devices_room_name_defaults_to_name(self):
+        base = _base_dict()
+        del base["notify_room_name"]
+        cfg = Config.from_dict(
+            base | {"devices": [{"address": "addr-1", "name": "office"}]}
+        )
+        self.assertEqual(cfg.devices[0].room_name, "office")
+
+    def test_devices_must_be_unique(self):
+        for devices in (
+            [{"address": "a", "name": "x"}, {"address": "A", "name": "y"}],
+            [{"address": "a", "name": "x"}, {"address": "b", "name": "x"}],
+        ):
+            with self.assertRaises(ConfigValidationError):
+                Config.from_dict(_base_dict() | {"devices": devices})
+
+    def test_bad_devices(self):
+        for bad in ([], "addr", [{"name": "x"}], [{"address": "a"}], ["a"]):
+            with self.assertRaises(ConfigValidationError):
+                Config.from_dict(_base_dict() | {"devices": bad})
+
+    def test_poll_concurrency_and_stagger(self):
+        cfg = Config.from_dict(_base_dict())
+        self.assertEqual(cfg.poll_concurrency, 4)
+        self.assertEqual(cfg.poll_stagger_s, 2)
+        for bad in (0, -1, "4", 1.5, True):
+            with self.assertRaises(ConfigValidationError):
+                Config.from_dict(_base_dict() | {"poll_concurrency": bad})
+        for bad in (-1, "2", True):
+            with self.assertRaises(ConfigValidationError):
+                Config.from_dict(_base_dict() | {"poll_stagger_s": bad})
+
+
+class TestBle(unittest.TestCase):
+    def test_keep_connected(self):
+        self.assertTrue(Config.from_dict(_base_dict()).ble_keep_connected)
+        for bad in (0, 1, "true", None):
+            with self.assertRaises(ConfigValidationError):
+                Config.from_dict(_base_dict() | {"ble_keep_connected": bad})
+
+    def test_discovery_ttl(self):
+        self.assertEqual(Config.from_dict(_base_dict()).ble_discovery_ttl_s, 3600)
+        self.assertEqual(
+            Config.from_dict(
+                _base_dict() | {"ble_discovery_ttl_s": 0}
+            ).ble_discovery_ttl_s,
+            0,
+        )
+        for bad in (-1, "60", True):
+            with self.assertRaises(ConfigValidationError):
+                Config.from_dict(_base_dict() | {"ble_discovery_ttl_s": bad})
+
+
+class TestBackfill(unittest.TestCase):
+    def setUp(self):
+        self.base = _base_dict() | {
+            "influx": True,
+            "influx_bucket": "test-bucket",
+            "influx_host": "influx.example.com",
+            "influx_measurement_name": "air",
+        }
+
+    def test_defaults(self):
+        cfg = Config.from_dict(self.base)
+        self.assertFalse(cfg.backfill)
+        self.assertEqual(cfg.backfill_max_records, 500)
+
+    def test_requires_influx_and_state_file(self):
+        with self.assertRaises(ConfigValidationError):
+            Config.from_dict(self.base | {"backfill": True})
+        with self.assertRaises(ConfigValidationError):
+            Config.from_dict(
+                _base_dict() | {"backfill": True, "backfill_state_file": "/tmp/bf"}
+            )
+        cfg = Config.from_dict(
+            self.base | {"backfill": True, "backfill_state_file": "/tmp/bf"}
+        )
+        self.assertTrue(cfg.backfill)
+
+    def test_max_records_must_be_positive_int(self):
+        for bad in (0, -1, "500", 1.5, True):
+            with self.assertRaises(ConfigValidationError):
+                Config.from_dict(
+                    self.base
+                    | {
+                        "backfill": True,
+                        "backfill_state_file": "/tmp/bf",
+                        "backfill_max_records": bad,
+                    }
+                )
+
+
+class TestInfluxApiVersion(unittest.TestCase):
+    def setUp(self):
+        self.base = _base_dict() | {
+            "influx": True,
+            "influx_bucket": "a/b/c",
+            "influx_host": "influx.example.com",
+            "influx_measurement_name": "air",
+        }
+
+    def test_v2_requires_token(self):
+        with self.assertRaises(ConfigValidationError):
+            Config.from_dict(self.base | {"influx_api_version": 2})
+        cfg = Config.from_dict(
+            self.base | {"influx_api_version": 2, "influx_token": "s3cret"}
+        )
+        # v2 bucket names aren't database/retention_policy pairs:
+        self.assertEqual(cfg.influx_bucket, "a/b/c")
+        self.assertIsNone(cfg.influx_org)
+
+    def test_bad_version(self):
+        for bad in (0, 3, "2", True):
+            with self.assertRaises(ConfigValidationError):
+                Config.from_dict(
+                    self.base | {"influx_api_version": bad, "influx_token": "t"}
+                )
+
+
+class TestStore(unittest.TestCase):
+    def test_defaults(self):
+        cfg = Config.from_dict(_base_dict())
+        self.assertFalse(cfg.store)
+        self.assertEqual(cfg.store_retention_days, 90)
+
+    def test_requires_file(self):
+        with self.assertRaises(ConfigValidationError):
+            Config.from_dict(_base_dict() | {"store": True})
+        cfg = Config.from_dict(
+            _base_dict() | {"store": True, "store_file": "/tmp/readings.db"}
+        )
+        self.assertEqual(cfg.store_file, "/tmp/readings.db")
+
+    def test_retention_must_be_positive_int(self):
+        for bad in (0, -1, "30", 1.5, True):
+            with self.assertRaises(ConfigValidationError):
+                Config.from_dict(
+                    _base_dict()
+                    | {
+                        "store": True,
+                        "store_file": "/tmp/readings.db",
+                        "store_retention_days": bad,
+                    }
+                )
+
+
 class TestPorts(unittest.TestCase):
     def test_influx_port_range(self):
         base = _base_dict() | {
@@ -35,6 +212,21 @@ class TestPorts(unittest.TestCase):
             with self.assertRaises(ConfigValidationError):
                 Config.from_dict(base | {"influx_port": bad})
 
+    def test_mqtt_qos_and_retain(self):
+        base = _base_dict() | {
+            "mqtt": True,
+            "mqtt_broker": "mqtt.example.com",
+            "mqtt_topic": "test-topic",
+        }
+        cfg = Config.from_dict(base)
+        self.assertEqual(cfg.mqtt_qos, 0)
+        self.assertFalse(cfg.mqtt_retain)
+        for bad in (-1, 3, "1", True):
+            with self.assertRaises(ConfigValidationError):
+                Config.from_dict(base | {"mqtt_qos": bad})
+        with self.assertRaises(ConfigValidationError):
+            Config.from_dict(base | {"mqtt_retain": 1})
+
     def test_mqtt_port_range(self):
         base = _base_dict() | {
             "mqtt": True,
@@ -112,10 +304,152 @@ class TestWebConfig(unittest.TestCase):
                     }
                 )
 
+    def test_web_without_notify(self):
+        base = _base_dict() | {"notify": False}
+        self.assertFalse(Config.from_dict(base).web_server_enabled())
+        cfg = Config.from_dict(base | {"web": True})
+        self.assertTrue(cfg.web_server_enabled())
+        with self.assertRaises(ConfigValidationError):
+            Config.from_dict(base | {"web": True, "web_port": 0})
+        with self.assertRaises(ConfigValidationError):
+            Config.from_dict(base | {"web": "yes"})
+
     def test_web_validation_skipped_without_base_url(self):
         cfg = Config.from_dict(_base_dict() | {"mute_short_h": -5})
         self.assertEqual(cfg.mute_short_h, -5)
 
 
+class TestAlertRules(unittest.TestCase):
+    def _rule(self, **kwargs) -> dict:
+        return {"name": "hot", "metric": "temp_c", "above": 28} | kwargs
+
+    def test_defaults(self):
+        cfg = Config.from_dict(_base_dict() | {"alert_rules": [self._rule()]})
+        self.assertEqual(cfg.alert_rules[0].aggregate, "mean")
+        self.assertEqual(cfg.alert_rules[0].window_min, 0)
+        self.assertEqual(cfg.alert_rules[0].level, "yellow")
+        self.assertEqual(Config.from_dict(_base_dict()).alert_rules, [])
+
+    def test_bad_rules(self):
+        for bad in (
+            {"name": ""},
+            {"metric": "radon"},
+            {"aggregate": "median"},
+            {"window_min": -1},
+            {"below": 10},
+            {"above": None},
+            {"above": "28"},
+            {"clear_at": 29},
+            {"level": "green"},
+            {"every": 0},
+            {"priority": "loud"},
+        ):
+            with self.subTest(bad=bad), self.assertRaises(ConfigValidationError):
+                Config.from_dict(_base_dict() | {"alert_rules": [self._rule(**bad)]})
+
+    def test_below_clear_at(self):
+        rule = {"name": "dry", "metric": "humidity_pct", "below": 30}
+        Config.from_dict(_base_dict() | {"alert_rules": [rule | {"clear_at": 35}]})
+        with self.assertRaises(ConfigValidationError):
+            Config.from_dict(_base_dict() | {"alert_rules": [rule | {"clear_at": 25}]})
+
+    def test_must_be_list_of_uniquely_named_objects(self):
+        for bad in ({}, ["hot"], [self._rule(), self._rule()]):
+            with self.subTest(bad=bad), self.assertRaises(ConfigValidationError):
+                Config.from_dict(_base_dict() | {"alert_rules": bad})
+
+
+class TestTrend(unittest.TestCase):
+    def test_defaults(self):
+        cfg = Config.from_dict(_base_dict())
+        self.assertEqual((0, 15), (cfg.trend_lead_min, cfg.trend_window_min))
+
+    def test_bad_values(self):
+        for bad in (
+            {"trend_lead_min": -1},
+            {"trend_lead_min": 1.5},
+            {"trend_window_min": 0},
+            {"trend_window_min": "15"},
+        ):
+            with self.subTest(bad=bad), self.assertRaises(ConfigValidationError):
+                Config.from_dict(_base_dict() | bad)
+
+
+class TestPollAdaptive(unittest.TestCase):
+    def test_defaults(self):
+        cfg = Config.from_dict(_base_dict() | {"poll_align_refresh": False})
+        self.assertFalse(cfg.poll_adaptive)
+        self.assertEqual(2, cfg.poll_interval_ceiling())
+        cfg = Config.from_dict(
+            _base_dict() | {"poll_align_refresh": False, "poll_adaptive": True}
+        )
+        self.assertEqual((1, 10), (cfg.poll_interval_min, cfg.poll_interval_max))
+        self.assertEqual(10, cfg.poll_interval_ceiling())
+
+    def test_bad_values(self):
+        for bad in (
+            {"poll_adaptive": "yes"},
+            {"poll_adaptive": True, "poll_interval_min": 0},
+            {"poll_adaptive": True, "poll_interval_min": 3},
+            {"poll_adaptive": True, "poll_interval_max": 1},
+            {"poll_adaptive": True, "poll_fast_ppm_per_min": 0},
+            {"poll_adaptive": True, "poll_low_battery_pct": 101},
+        ):
+            with self.subTest(bad=bad), self.assertRaises(ConfigValidationError):
+                Config.from_dict(_base_dict() | bad)
+
+
+class TestPollAlignRefresh(unittest.TestCase):
+    def test_defaults(self):
+        cfg = Config.from_dict(_base_dict())
+        self.assertTrue(cfg.poll_aligned())
+        # a poll can wait up to 10 min for the device's next measurement:
+        self.assertEqual(12, cfg.poll_interval_ceiling())
+
+    def test_not_aligned_when_passive(self):
+        cfg = Config.from_dict(_base_dict() | {"ble_read_mode": "passive"})
+        self.assertFalse(cfg.poll_aligned())
+        self.assertEqual(2, cfg.poll_interval_ceiling())
+
+    def test_must_be_bool(self):
+        with self.assertRaises(ConfigValidationError):
+            Config.from_dict(_base_dict() | {"poll_align_refresh": 1})
+
+
+def _influx_dict() -> dict:
+    return {
+        "influx": True,
+        "influx_bucket": "aranet/1-year",
+        "influx_host": "influx.example.com",
+        "influx_measurement_name": "aranet4",
+    }
+
+
+class TestRollup(unittest.TestCase):
+    def test_defaults(self):
+        self.assertEqual([], Config.from_dict(_base_dict()).rollup_windows_min)
+        cfg = Config.from_dict(
+            _base_dict() | _influx_dict() | {"rollup_windows_min": [15, 60]}
+        )
+        self.assertEqual("aranet/1-year", cfg.rollup_influx_bucket)
+        self.assertEqual("aranet4_rollup", cfg.rollup_influx_measurement_name)
+
+    def test_bad_values(self):
+        for bad in (
+            {"rollup_windows_min": 15},
+            {"rollup_windows_min": [0]},
+            {"rollup_windows_min": [15, 15]},
+            {"rollup_windows_min": [True]},
+            {"rollup_windows_min": [15], "rollup_influx_bucket": "a/b/c"},
+            {"rollup_windows_min": [15], "rollup_influx_measurement_name": ""},
+        ):
+            with self.subTest(bad=bad), self.assertRaises(ConfigValidationError):
+                Config.from_dict(_base_dict() | _influx_dict() | bad)
+
+    def test_requires_influx_or_mqtt(self):
+        with self.assertRaises(ConfigValidationError):
+            Config.from_dict(_base_dict() | {"rollup_windows_min": [15]})
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,48 @@
+import asyncio
+import sys
+import threading
+import unittest
+from unittest import mock
+
+from daemon_thread import run_in_daemon_thread
+
+
+class TestRunInDaemonThread(unittest.TestCase):
+    def test_returns_when_fn_does(self):
+        ran = []
+        asyncio.run(run_in_daemon_thread(lambda: ran.append(1), "test"))
+        self.assertEqual([1], ran)
+
+    def test_raises_what_fn_does(self):
+        def fail():
+            raise ValueError("boom")
+
+        with self.assertRaisesRegex(ValueError, "boom"):
+            asyncio.run(run_in_daemon_thread(fail, "test"))
+
+    def test_system_exit_fails_the_task(self):
+        with self.assertRaisesRegex(RuntimeError, "test exited: SystemExit") as cm:
+            asyncio.run(run_in_daemon_thread(lambda: sys.exit(3), "test"))
+        self.assertIsInstance(cm.exception.__cause__, SystemExit)
+
+    def test_cancelling_abandons_fn(self):
+        release = threading.Event()
+
+        async def run():
+            task = asyncio.create_task(run_in_daemon_thread(release.wait, "test"))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(run())
+        (thread,) = [t for t in threading.enumerate() if t.name == "test"]
+        # fn returning after the loop closed mustn't raise on the thread:
+        with mock.patch("threading.excepthook") as excepthook:
+            release.set()
+            thread.join()
+        excepthook.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import asyncio
+import datetime
+import unittest
+
+from clock import VirtualClock
+from fakeble import FakeBackend, FakeDevice, FakeValues
+from libclaranet4 import Ara4Connection, BTIOError
+
+T0 = datetime.datetime(2026, 1, 5, 12, 0, tzinfo=datetime.UTC)
+
+
+def _constant(t: datetime.datetime, rng) -> FakeValues:
+    return FakeValues(co2=800, temp_c=21.5, humidity_pct=40, pressure_mbar=1012.3)
+
+
+class TestFakeBackend(unittest.TestCase):
+    def setUp(self):
+        self.clock = VirtualClock(T0)
+        self.device = FakeDevice("FA:KE", script=_constant, interval_s=60)
+        self.backend = FakeBackend([self.device], self.clock, seed=1)
+
+    def _connection(self) -> Ara4Connection:
+        return Ara4Connection(
+            "FA:KE", backend=self.backend, clock=self.clock, min_backoff_s=5
+        )
+
+    def test_reads_scripted_measurements(self):
+        conn = self._connection()
+        first = asyncio.run(conn.read())
+        self.assertEqual(
+            (800, 21.5, 1012.3), (first.co2, first.temperature, first.pressure)
+        )
+        self.assertEqual((90, 60), (first.battery, first.interval_s))
+        self.assertEqual(T0, first.received_at)
+
+        # read again before the next measurement, it's the same one; the device
+        # rounds its age to the second:
+        self.clock.advance((60 - first.ago_s) / 2)
+        again = asyncio.run(conn.read())
+        self.assertAlmostEqual(
+            first.sampled_at.timestamp(), again.sampled_at.timestamp(), delta=1
+        )
+        # and after it, the next one:
+        self.clock.advance(60)
+        self.assertAlmostEqual(
+            first.sampled_at.timestamp() + 60,
+            asyncio.run(conn.read()).sampled_at.timestamp(),
+            delta=1,
+        )
+
+    def test_same_seed_same_values(self):
+        device = FakeDevice("FA:KE")
+        self.assertEqual(device.measurement(T0, 7), device.measurement(T0, 7))
+        self.assertNotEqual(device.measurement(T0, 7), device.measurement(T0, 8))
+
+    def test_backoff_follows_the_clock(self):
+        conn = self._connection()
+        self.device.failure_rate = 1.0
+        with self.assertRaisesRegex(BTIOError, "fake connection failure"):
+            asyncio.run(conn.read())
+        self.device.failure_rate = 0.0
+        with self.assertRaisesRegex(BTIOError, "not reconnecting"):
+            asyncio.run(conn.read())
+        self.clock.advance(5)
+        self.assertEqual(800, asyncio.run(conn.read()).co2)
+        self.assertEqual(1, self.backend.failures)
+
+    def test_unknown_device_is_not_found(self):
+        conn = Ara4Connection("AA:BB", backend=self.backend, clock=self.clock)
+        with self.assertRaisesRegex(BTIOError, "could not find"):
+            asyncio.run(conn.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
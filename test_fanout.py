@@ -0,0 +1,73 @@
+import threading
+import time
+import unittest
+
+from fanout import SinkFanout, SinkJob
+
+
+class TestSinkFanout(unittest.TestCase):
+    def setUp(self):
+        self.fanout = SinkFanout(["a", "b"])
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+        self.fanout.shutdown()
+
+    def _hang(self) -> bool:
+        self.release.wait(timeout=5)
+        return True
+
+    def test_runs_sinks_concurrently(self):
+        barrier = threading.Barrier(2, timeout=1)
+
+        def job() -> bool:
+            barrier.wait()  # breaks unless both sinks run at once
+            return True
+
+        results = self.fanout.run({"a": SinkJob(job, 2), "b": SinkJob(job, 2)})
+        self.assertTrue(results["a"].ok)
+        self.assertTrue(results["b"].ok)
+
+    def test_slow_sink_times_out_without_holding_up_others(self):
+        started_at = time.monotonic()
+        results = self.fanout.run(
+            {"a": SinkJob(self._hang, 0.1), "b": SinkJob(lambda: True, 1)}
+        )
+        self.assertLess(time.monotonic() - started_at, 1)
+        self.assertFalse(results["a"].ok)
+        self.assertIn("timed out", results["a"].error)
+        self.assertTrue(results["b"].ok)
+
+    def test_overrunning_sink_is_skipped_until_it_finishes(self):
+        self.fanout.run({"a": SinkJob(self._hang, 0.05)})
+        ran = []
+        results = self.fanout.run({"a": SinkJob(lambda: ran.append(1) or True, 1)})
+        self.assertFalse(results["a"].ok)
+        self.assertEqual("still busy with a previous write", results["a"].error)
+        self.assertEqual([], ran)
+
+        # once the overrunning write finishes, the sink is free again:
+        finished = threading.Event()
+        self.fanout._overrunning["a"].add_done_callback(lambda _: finished.set())
+        self.release.set()
+        self.assertTrue(finished.wait(timeout=5))
+        results = self.fanout.run({"a": SinkJob(lambda: ran.append(1) or True, 1)})
+        self.assertTrue(results["a"].ok)
+        self.assertEqual([1], ran)
+
+    def test_failures_are_reported(self):
+        def boom() -> bool:
+            raise RuntimeError("boom")
+
+        results = self.fanout.run(
+            {"a": SinkJob(boom, 1), "b": SinkJob(lambda: False, 1)}
+        )
+        self.assertFalse(results["a"].ok)
+        self.assertEqual("boom", results["a"].error)
+        self.assertFalse(results["b"].ok)
+        self.assertIsNone(results["b"].error)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,219 @@
+import datetime
+import gzip
+import http.server
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import conv
+from clock import VirtualClock
+from config import Config
+from influx import InfluxWriter, LineProtocolEncoder, split_bucket
+from rollup import RollupAggregator
+from spool import Spool
+from testutil import measurement
+
+T0 = datetime.datetime(2026, 1, 1, 12, 0, tzinfo=datetime.UTC)
+
+
+def _cfg(**kwargs) -> Config:
+    return Config.from_dict(
+        {
+            "aranet_device_address": "test-addr",
+            "device_name": "test",
+            "influx": True,
+            "influx_bucket": "dzhome/1-year",
+            "influx_host": "influx.example.com",
+            "influx_measurement_name": "aranet4",
+        }
+        | kwargs
+    )
+
+
+class TestSplitBucket(unittest.TestCase):
+    def test_split(self):
+        self.assertEqual(split_bucket("dzhome"), ("dzhome", None))
+        self.assertEqual(split_bucket("dzhome/1-year"), ("dzhome", "1-year"))
+        with self.assertRaises(ValueError):
+            split_bucket("a/b/c")
+
+
+@mock.patch("influxdb.InfluxDBClient")
+class TestInfluxWriter(unittest.TestCase):
+    def test_flushes_buffer_in_one_request(self, client_cls):
+        client = client_cls.return_value
+        client.write_points.return_value = True
+        cfg = _cfg()
+        flushed = []
+        writer = InfluxWriter(cfg, on_flushed=flushed.extend)
+        writer.add(measurement(cfg, T0, co2=600))
+        writer.add(measurement(cfg, T0 + datetime.timedelta(minutes=2), co2=700))
+        self.assertTrue(writer.flush_due())
+        self.assertTrue(writer.flush())
+
+        client_cls.assert_called_once()
+        client.write_points.assert_called_once()
+        points = client.write_points.call_args.args[0]
+        self.assertEqual([p["fields"]["co2_ppm"] for p in points], [600, 700])
+        self.assertEqual(points[0]["tags"]["aranet_name"], "test")
+        kwargs = client.write_points.call_args.kwargs
+        self.assertEqual(kwargs["database"], "dzhome")
+        self.assertEqual(kwargs["retention_policy"], "1-year")
+        self.assertEqual(
+            flushed, [("test", T0), ("test", T0 + datetime.timedelta(minutes=2))]
+        )
+        self.assertFalse(writer.flush_due())
+
+    def test_failed_flush_keeps_points(self, client_cls):
+        client = client_cls.return_value
+        client.write_points.side_effect = [ConnectionError("down"), True]
+        cfg = _cfg()
+        writer = InfluxWriter(cfg)
+        writer.add(measurement(cfg, T0))
+        self.assertFalse(writer.flush())
+        self.assertTrue(writer.flush_due())
+        self.assertTrue(writer.flush())
+        self.assertEqual(len(client.write_points.call_args.args[0]), 1)
+
+    def test_failed_flush_spools_points(self, client_cls):
+        client_cls.return_value.write_points.return_value = False
+        cfg = _cfg()
+        with tempfile.TemporaryDirectory() as d:
+            spool = Spool(d, "influx", max_bytes=1024 * 1024)
+            flushed = []
+            writer = InfluxWriter(cfg, on_flushed=flushed.extend, spool=spool)
+            writer.add(measurement(cfg, T0, co2=650))
+            self.assertFalse(writer.flush())
+            self.assertFalse(writer.flush_due())
+            records, _ = spool.peek(10)
+            self.assertEqual([r["fields"]["co2_ppm"] for r in records], [650])
+            self.assertEqual(flushed, [("test", T0)])
+
+    def test_flush_waits_for_size_or_age(self, client_cls):
+        cfg = _cfg(influx_batch_size=2, influx_flush_interval_s=60)
+        clock = VirtualClock(T0)
+        writer = InfluxWriter(cfg, clock=clock)
+        writer.add(measurement(cfg, T0))
+        clock.advance(59)
+        self.assertFalse(writer.flush_due())
+        clock.advance(1)
+        self.assertTrue(writer.flush_due())
+        writer.flush()
+        writer.add(measurement(cfg, T0))
+        self.assertFalse(writer.flush_due())
+        writer.add(measurement(cfg, T0))
+        self.assertTrue(writer.flush_due())
+
+
+class TestLineProtocolEncoder(unittest.TestCase):
+    def test_encode(self):
+        cfg = _cfg(
+            devices=[
+                {"address": "test-addr", "name": "living room, east"},
+            ],
+        )
+        line = LineProtocolEncoder(cfg).encode(measurement(cfg, T0, co2=650))
+        self.assertEqual(
+            "aranet4,aranet_addr=test-addr,aranet_name=living\\ room\\,\\ east "
+            "rssi=-70i,temp_c=21.0,temp_f=69.8,humidity_pct=40.0,"
+            f"humidity_abs={conv.absolute_humidity_g_m3(21.0, 40.0)!r},"
+            f"pressure_mbar=1012.0,pressure_inHg={conv.mbar_to_inhg(1012.0)!r},"
+            "co2_ppm=650i,"
+            'co2_warning_level="green" 1767268800',
+            line,
+        )
+
+
+class _InfluxStandIn(http.server.BaseHTTPRequestHandler):
+    """Records /api/v2/write requests, answering with the server's status"""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.requests.append((self.path, dict(self.headers), body))
+        self.send_response(self.server.status)
+        self.end_headers()
+        if self.server.status >= 400:
+            self.wfile.write(b'{"message": "bad"}')
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestInfluxV2(unittest.TestCase):
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _InfluxStandIn)
+        self.server.requests = []
+        self.server.status = 204
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _cfg(self, **kwargs) -> Config:
+        return _cfg(
+            influx_api_version=2,
+            influx_bucket="aranet",
+            influx_host="127.0.0.1",
+            influx_port=self.server.server_address[1],
+            influx_token="s3cret",
+            influx_org="home",
+            **kwargs,
+        )
+
+    def test_writes_gzipped_line_protocol(self):
+        cfg = self._cfg(influx_batch_size=2)
+        writer = InfluxWriter(cfg)
+        for i in range(3):
+            writer.add(
+                measurement(cfg, T0 + datetime.timedelta(minutes=i), co2=600 + i)
+            )
+        self.assertTrue(writer.flush())
+        writer.close()
+
+        self.assertEqual(2, len(self.server.requests))
+        path, headers, body = self.server.requests[0]
+        self.assertEqual("/api/v2/write?bucket=aranet&precision=s&org=home", path)
+        self.assertEqual("Token s3cret", headers["Authorization"])
+        self.assertEqual("gzip", headers["Content-Encoding"])
+        lines = gzip.decompress(body).decode().split("\n")
+        self.assertEqual(2, len(lines))
+        self.assertTrue(lines[0].endswith(f" {int(T0.timestamp())}"))
+        self.assertIn("co2_ppm=600i", lines[0])
+        lines = gzip.decompress(self.server.requests[1][2]).decode().split("\n")
+        self.assertEqual(1, len(lines))
+        self.assertIn("co2_ppm=602i", lines[0])
+
+    def test_failed_write_spools_lines(self):
+        self.server.status = 500
+        cfg = self._cfg()
+        with tempfile.TemporaryDirectory() as d:
+            spool = Spool(d, InfluxWriter.spool_name(cfg), max_bytes=1024 * 1024)
+            writer = InfluxWriter(cfg, spool=spool)
+            writer.add(measurement(cfg, T0, co2=650))
+            self.assertFalse(writer.flush())
+            records, _ = spool.peek(10)
+            self.assertEqual(1, len(records))
+            self.assertIn("co2_ppm=650i", records[0]["line"])
+
+            self.server.status = 204
+            self.assertTrue(writer.write_spooled(records))
+            body = gzip.decompress(self.server.requests[-1][2]).decode()
+            self.assertEqual(records[0]["line"], body)
+
+    def test_writes_rollups_to_their_bucket(self):
+        cfg = self._cfg(rollup_windows_min=[15], rollup_influx_bucket="aranet_long")
+        rollups = RollupAggregator([15], datetime.timedelta(0))
+        rollups.add(measurement(cfg, T0, co2=650))
+        writer = InfluxWriter(cfg)
+        self.assertTrue(
+            writer.write_rollups(rollups.close_due(T0 + datetime.timedelta(hours=1)))
+        )
+        path, _, body = self.server.requests[0]
+        self.assertEqual("/api/v2/write?bucket=aranet_long&precision=s&org=home", path)
+        self.assertIn("co2_ppm_last=650i", gzip.decompress(body).decode())
+
+
+if __name__ == "__main__":
+    unittest.main()
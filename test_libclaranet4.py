@@ -0,0 +1,351 @@
+import asyncio
+import datetime
+import struct
+import unittest
+from unittest import mock
+
+from bleak.backends.device import BLEDevice
+from bleak.backends.scanner import AdvertisementData
+
+from clock import VirtualClock
+from libclaranet4 import (
+    ARANET_MANUFACTURER_ID,
+    RECONNECT_MAX_BACKOFF_S,
+    RECONNECT_MIN_BACKOFF_S,
+    AdvertisementListener,
+    Ara4Connection,
+    BleBackend,
+    BTIOError,
+    Device,
+    DiscoveryCache,
+    Reading,
+    _parse_history_chunk,
+    history_indexes,
+)
+
+# manufacturer data advertised by an Aranet4 (firmware v1.4.19) with Smart Home
+# integration enabled: 601 ppm, 22.75 °C, 1012.3 mbar, 45% RH, 88% battery:
+ADV_INTEGRATIONS_ON = bytes.fromhex("2213040100000c5902c7018b272d58012c017b005500")
+# the same device with Smart Home integration disabled:
+ADV_INTEGRATIONS_OFF = bytes.fromhex("02130401000c0f")
+
+
+def _adv(manufacturer_data: dict[int, bytes], rssi: int = -70) -> AdvertisementData:
+    return AdvertisementData(
+        local_name="Aranet4 12345",
+        manufacturer_data=manufacturer_data,
+        service_data={},
+        service_uuids=[],
+        tx_power=None,
+        rssi=rssi,
+        platform_data=(),
+    )
+
+
+class TestDiscoveryCache(unittest.TestCase):
+    def setUp(self):
+        self.ble_device = BLEDevice("AA:BB:CC:DD:EE:FF", "Aranet4 12345", None)
+
+    def test_lookup_is_case_insensitive(self):
+        cache = DiscoveryCache()
+        cache.record(self.ble_device, -60)
+        self.assertIs(cache.lookup("aa:bb:cc:dd:ee:ff"), self.ble_device)
+        self.assertEqual(cache.device("aa:bb:cc:dd:ee:ff").rssi, -60)
+
+    def test_rssi_updates_on_record(self):
+        cache = DiscoveryCache()
+        cache.record(self.ble_device, -60)
+        cache.record(self.ble_device, -72)
+        self.assertEqual(cache.device(self.ble_device.address).rssi, -72)
+
+    def test_expired_entry_not_used_for_connecting(self):
+        clock = VirtualClock(datetime.datetime(2026, 1, 1, tzinfo=datetime.UTC))
+        cache = DiscoveryCache(ttl_s=10, clock=clock)
+        cache.record(self.ble_device, -60)
+        clock.advance(9)
+        self.assertIs(cache.lookup(self.ble_device.address), self.ble_device)
+        clock.advance(1)
+        self.assertIsNone(cache.lookup(self.ble_device.address))
+        # but its RSSI is still the latest known:
+        self.assertEqual(cache.device(self.ble_device.address).rssi, -60)
+
+    def test_invalidate(self):
+        cache = DiscoveryCache()
+        cache.record(self.ble_device, -60)
+        cache.invalidate(self.ble_device.address)
+        self.assertIsNone(cache.lookup(self.ble_device.address))
+        self.assertIsNone(cache.device(self.ble_device.address))
+
+
+class TestReadingFromAdvertisement(unittest.TestCase):
+    def setUp(self):
+        self.device = Device(address="AA:BB:CC:DD:EE:FF", name="Aranet4", rssi=-70)
+
+    def test_decodes_measurements(self):
+        r = Reading.from_advertisement(self.device, ADV_INTEGRATIONS_ON)
+        self.assertEqual(r.co2, 601)
+        self.assertEqual(r.temperature, 22.8)
+        self.assertEqual(r.pressure, 1012.3)
+        self.assertEqual(r.humidity, 45.0)
+        self.assertEqual(r.battery, 88)
+        self.assertEqual((r.interval_s, r.ago_s), (300, 123))
+        self.assertEqual(r.sampled_at, r.received_at - datetime.timedelta(seconds=123))
+        self.assertEqual(r.rssi, -70)
+        self.assertEqual(r.address, "AA:BB:CC:DD:EE:FF")
+
+    def test_integrations_disabled(self):
+        self.assertIsNone(Reading.from_advertisement(self.device, ADV_INTEGRATIONS_OFF))
+
+    def test_truncated(self):
+        self.assertIsNone(
+            Reading.from_advertisement(self.device, ADV_INTEGRATIONS_ON[:12])
+        )
+
+
+class TestAdvertisementListener(unittest.TestCase):
+    def setUp(self):
+        self.ble_device = BLEDevice("AA:BB:CC:DD:EE:FF", "Aranet4 12345", None)
+
+    def test_collects_latest_per_device(self):
+        cache = DiscoveryCache()
+        listener = AdvertisementListener(["aa:bb:cc:dd:ee:ff"], cache=cache)
+        adv = _adv({ARANET_MANUFACTURER_ID: ADV_INTEGRATIONS_ON}, rssi=-65)
+        listener._on_advertisement(self.ble_device, adv)
+        readings = listener.pop_readings()
+        self.assertEqual(list(readings), ["aa:bb:cc:dd:ee:ff"])
+        self.assertEqual(readings["aa:bb:cc:dd:ee:ff"].co2, 601)
+        self.assertEqual(cache.device(self.ble_device.address).rssi, -65)
+        self.assertEqual(listener.pop_readings(), {})
+
+    def test_ignores_other_devices(self):
+        listener = AdvertisementListener(["11:22:33:44:55:66"])
+        adv = _adv({ARANET_MANUFACTURER_ID: ADV_INTEGRATIONS_ON})
+        listener._on_advertisement(self.ble_device, adv)
+        self.assertEqual(listener.pop_readings(), {})
+
+    def test_ignores_adverts_without_measurements(self):
+        listener = AdvertisementListener()
+        listener._on_advertisement(self.ble_device, _adv({0x004C: b"\x02\x15"}))
+        listener._on_advertisement(
+            self.ble_device, _adv({ARANET_MANUFACTURER_ID: ADV_INTEGRATIONS_OFF})
+        )
+        self.assertEqual(listener.pop_readings(), {})
+
+
+@mock.patch("libclaranet4.BleakClient")
+class TestConnectionStages(unittest.TestCase):
+    def test_reports_scan_connect_and_read(self, client_cls):
+        client = client_cls.return_value
+        client.connect = mock.AsyncMock()
+        client.read_gatt_char = mock.AsyncMock(
+            return_value=bytearray(struct.pack("<HHHBBH", 600, 440, 10123, 45, 88, 120))
+        )
+        stages = []
+        conn = Ara4Connection("AA:BB", on_stage=lambda stage, s: stages.append(stage))
+        ble_device = BLEDevice("AA:BB", "Aranet4 12345", None)
+        with mock.patch(
+            "libclaranet4._scan_for", mock.AsyncMock(return_value=(ble_device, -60))
+        ):
+            asyncio.run(conn.read())
+        self.assertEqual(["ble.scan", "ble.connect", "ble.read"], stages)
+
+        # the next read reuses the connection, and the cache skips the scan:
+        client.is_connected = True
+        asyncio.run(conn.read())
+        self.assertEqual(["ble.scan", "ble.connect", "ble.read", "ble.read"], stages)
+
+
+class _Client:
+    """A BleakClient stand-in, whose connects fail while its backend says so"""
+
+    def __init__(self, backend: "_Backend", disconnected_callback):
+        self.backend = backend
+        self.disconnected_callback = disconnected_callback
+        self.is_connected = False
+
+    async def connect(self):
+        if self.backend.fail_connects:
+            raise BTIOError("connection failed")
+        self.backend.connects += 1
+        self.is_connected = True
+
+    async def disconnect(self):
+        self.is_connected = False
+
+    async def read_gatt_char(self, uuid: str) -> bytearray:
+        return bytearray(struct.pack("<HHHBBBHH", 600, 440, 10123, 45, 88, 0, 60, 5))
+
+    def drop(self):
+        """Drop the link, as the device or adapter would"""
+        self.is_connected = False
+        self.disconnected_callback(self)
+
+
+class _Backend(BleBackend):
+    def __init__(self):
+        self.ble_device = BLEDevice("AA:BB", "Aranet4 12345", None)
+        self.rssi = -60
+        self.fail_connects = False
+        self.connects = 0
+        self.scans = 0
+        self.clients: list[_Client] = []
+
+    async def scan_for(self, address: str):
+        self.scans += 1
+        return self.ble_device, self.rssi
+
+    def client(self, ble_device, disconnected_callback) -> _Client:
+        self.clients.append(_Client(self, disconnected_callback))
+        return self.clients[-1]
+
+
+class TestAra4Connection(unittest.TestCase):
+    def setUp(self):
+        self.clock = VirtualClock(datetime.datetime(2026, 1, 1, tzinfo=datetime.UTC))
+        self.backend = _Backend()
+
+    def _connection(self, **kwargs) -> Ara4Connection:
+        return Ara4Connection("AA:BB", backend=self.backend, clock=self.clock, **kwargs)
+
+    def test_backoff_doubles_up_to_max(self):
+        conn = self._connection()
+        self.backend.fail_connects = True
+        backoff_s = RECONNECT_MIN_BACKOFF_S
+        for _ in range(8):
+            with self.assertRaisesRegex(BTIOError, "connection failed"):
+                asyncio.run(conn.read())
+            self.clock.advance(backoff_s - 1)
+            with self.assertRaisesRegex(BTIOError, "not reconnecting"):
+                asyncio.run(conn.read())
+            self.clock.advance(1)
+            backoff_s = min(RECONNECT_MAX_BACKOFF_S, backoff_s * 2)
+        self.assertEqual(RECONNECT_MAX_BACKOFF_S, backoff_s)
+
+        # a successful connection resets the backoff:
+        self.backend.fail_connects = False
+        asyncio.run(conn.read())
+        self.backend.clients[-1].drop()
+        self.backend.fail_connects = True
+        with self.assertRaisesRegex(BTIOError, "connection failed"):
+            asyncio.run(conn.read())
+        self.clock.advance(RECONNECT_MIN_BACKOFF_S)
+        self.backend.fail_connects = False
+        self.assertEqual(600, asyncio.run(conn.read()).co2)
+
+    def test_keep_connected(self):
+        conn = self._connection()
+        for _ in range(3):
+            asyncio.run(conn.read())
+        self.assertEqual(1, self.backend.connects)
+        self.assertTrue(conn.is_connected)
+
+        # a dropped link is reopened on the next read:
+        self.backend.clients[-1].drop()
+        asyncio.run(conn.read())
+        self.assertEqual(2, self.backend.connects)
+
+    def test_without_keep_connected(self):
+        conn = self._connection(keep_connected=False)
+        for _ in range(3):
+            asyncio.run(conn.read())
+        self.assertEqual(3, self.backend.connects)
+        self.assertFalse(conn.is_connected)
+
+    def test_refreshes_rssi_after_ttl(self):
+        conn = self._connection(cache=DiscoveryCache(ttl_s=600, clock=self.clock))
+        self.assertEqual(-60, asyncio.run(conn.read()).rssi)
+        self.backend.rssi = -75
+        self.clock.advance(599)
+        self.assertEqual(-60, asyncio.run(conn.read()).rssi)
+        # the device only advertises while it's not connected, so reconnect:
+        self.clock.advance(1)
+        self.assertEqual(-75, asyncio.run(conn.read()).rssi)
+        self.assertEqual((2, 2), (self.backend.scans, self.backend.connects))
+
+    def test_logs_connection_lifetime(self):
+        conn = self._connection()
+        asyncio.run(conn.read())
+        self.clock.advance(120)
+        with self.assertLogs("libclaranet4", "INFO") as logs:
+            self.backend.clients[-1].drop()
+        self.assertEqual(120, conn.last_lifetime_s)
+        self.assertIn(
+            "AA:BB: connection closed after 120s (disconnected by device or adapter)",
+            logs.output[0],
+        )
+
+        # only at debug level when connections are closed after every read:
+        conn = self._connection(keep_connected=False)
+        with self.assertLogs("libclaranet4", "DEBUG") as logs:
+            asyncio.run(conn.read())
+        self.assertEqual("DEBUG", logs.records[-1].levelname)
+        self.assertIn("(keep_connected is off)", logs.output[-1])
+
+
+class TestHistory(unittest.TestCase):
+    def setUp(self):
+        self.newest = datetime.datetime(2026, 1, 1, 12, 0, tzinfo=datetime.UTC)
+
+    def _ago(self, seconds: int) -> datetime.datetime:
+        return self.newest - datetime.timedelta(seconds=seconds)
+
+    def test_indexes_after_since(self):
+        # records at 300 s intervals; 1000 of them, the newest taken at newest:
+        self.assertEqual(
+            history_indexes(self._ago(300), self.newest, 1000, 300), range(1000, 1001)
+        )
+        self.assertEqual(
+            history_indexes(self._ago(301), self.newest, 1000, 300), range(999, 1001)
+        )
+        self.assertEqual(
+            history_indexes(self._ago(3000), self.newest, 1000, 300), range(991, 1001)
+        )
+
+    def test_indexes_clamped_to_stored_history(self):
+        self.assertEqual(
+            history_indexes(self._ago(10**7), self.newest, 1000, 300), range(1, 1001)
+        )
+
+    def test_no_indexes_after_newest(self):
+        self.assertFalse(history_indexes(self.newest, self.newest, 1000, 300))
+        self.assertFalse(history_indexes(self._ago(600), self.newest, 0, 300))
+
+    def test_parse_chunk(self):
+        header = struct.pack("<BHHHHB", 4, 300, 1000, 42, 991, 3)
+        start, values = _parse_history_chunk(
+            4, header + struct.pack("<HHH", 601, 602, 603)
+        )
+        self.assertEqual(start, 991)
+        self.assertEqual(values, [601, 602, 603])
+
+    def test_parse_humidity_chunk(self):
+        header = struct.pack("<BHHHHB", 2, 300, 1000, 42, 1, 2)
+        self.assertEqual(_parse_history_chunk(2, header + bytes([45, 46]))[1], [45, 46])
+
+    def test_detailed_measurements(self):
+        device = Device(address="AA:BB:CC:DD:EE:FF", name="Aranet4", rssi=-70)
+        r = Reading(
+            device,
+            bytearray(struct.pack("<HHHBBBHH", 601, 455, 10123, 45, 88, 1, 60, 42)),
+        )
+        self.assertEqual((r.co2, r.battery), (601, 88))
+        self.assertEqual((r.interval_s, r.ago_s), (60, 42))
+        # the simple characteristic has neither:
+        simple = Reading(
+            device, bytearray(struct.pack("<HHHBBB", 601, 455, 10123, 45, 88, 1))
+        )
+        self.assertIsNone(simple.interval_s)
+        self.assertEqual(simple.received_at, simple.sampled_at)
+
+    def test_from_values(self):
+        device = Device(address="AA:BB:CC:DD:EE:FF", name="Aranet4", rssi=-70)
+        r = Reading.from_values(
+            device, co2=601, temperature=22.75, pressure=1012.3, humidity=45
+        )
+        self.assertEqual(
+            (r.co2, r.temperature, r.pressure, r.humidity), (601, 22.8, 1012.3, 45.0)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import asyncio
+import logging
+import sys
+import unittest
+from unittest import mock
+
+from config import Config
+from daemon_thread import run_in_daemon_thread
+from main import run_single_process
+
+
+def _cfg() -> Config:
+    return Config.from_dict(
+        {"aranet_device_address": "test-addr", "device_name": "test", "notify": False}
+    )
+
+
+class _Task:
+    """Stands in for the poller, notifier, or web server"""
+
+    def __init__(self, error: BaseException | None = None):
+        self.error = error
+        self.cancelled = False
+
+    async def run_async(self):
+        try:
+            if self.error is not None:
+                raise self.error
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+
+class TestRunSingleProcess(unittest.TestCase):
+    def _run(self, poller: _Task, notifier: _Task, web_server: _Task) -> int:
+        logger = logging.getLogger(__name__)
+        with (
+            mock.patch(
+                "main.build_children", return_value=(web_server, notifier, poller)
+            ),
+            self.assertLogs(logger),
+        ):
+            return asyncio.run(
+                run_single_process(logger, _cfg(), logging.INFO, False, None)
+            )
+
+    def test_fails_fast(self):
+        poller, notifier, web_server = _Task(RuntimeError("boom")), _Task(), _Task()
+        with mock.patch("main.traceback.print_exception"):
+            self.assertEqual(1, self._run(poller, notifier, web_server))
+        self.assertTrue(notifier.cancelled)
+        self.assertTrue(web_server.cancelled)
+
+    def test_fails_fast_when_a_thread_exits(self):
+        class _ThreadExits(_Task):
+            async def run_async(self):
+                await run_in_daemon_thread(lambda: sys.exit(0), "notifier")
+
+        poller, web_server = _Task(), _Task()
+        with mock.patch("main.traceback.print_exception"):
+            self.assertEqual(1, self._run(poller, _ThreadExits(), web_server))
+        self.assertTrue(poller.cancelled)
+        self.assertTrue(web_server.cancelled)
+
+    def test_clean_exit(self):
+        class _Exits(_Task):
+            async def run_async(self):
+                pass
+
+        notifier, web_server = _Task(), _Task()
+        self.assertEqual(0, self._run(_Exits(), notifier, web_server))
+        self.assertTrue(notifier.cancelled)
+        self.assertTrue(web_server.cancelled)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import datetime
+import json
+import unittest
+
+import conv
+from config import Config
+from influx import InfluxEncoder
+from measurement import Encoder, encoder_for, register_encoder
+from mqtt import MqttEncoder
+from testutil import measurement
+
+T0 = datetime.datetime(2026, 1, 1, 12, 0, tzinfo=datetime.UTC)
+
+
+def _cfg() -> Config:
+    return Config.from_dict(
+        {
+            "aranet_device_address": "test-addr",
+            "device_name": "test",
+            "influx": True,
+            "influx_bucket": "dzhome",
+            "influx_host": "influx.example.com",
+            "influx_measurement_name": "aranet4",
+            "mqtt": True,
+            "mqtt_broker": "mqtt.example.com",
+            "mqtt_topic": "sensors/co2/test",
+        }
+    )
+
+
+EXPECTED_FIELDS = {
+    "rssi": -70,
+    "temp_c": 21.0,
+    "temp_f": 69.8,
+    "humidity_pct": 40.0,
+    "humidity_abs": conv.absolute_humidity_g_m3(21.0, 40.0),
+    "pressure_mbar": 1012.0,
+    "pressure_inHg": conv.mbar_to_inhg(1012.0),
+    "co2_ppm": 1100,
+    "co2_warning_level": "yellow",
+}
+
+
+class TestMeasurement(unittest.TestCase):
+    def test_fields(self):
+        m = measurement(_cfg(), T0, ble_name="Aranet4 1ABCD", co2=1100)
+        self.assertEqual("Aranet4 1ABCD", m.ble_name)
+        self.assertEqual(EXPECTED_FIELDS, m.fields())
+        self.assertIs(m.fields(), m.fields())
+
+    def test_slotted(self):
+        with self.assertRaises(AttributeError):
+            measurement(_cfg(), T0).extra = 1
+
+
+class TestEncoders(unittest.TestCase):
+    def test_influx(self):
+        cfg = _cfg()
+        self.assertIsInstance(encoder_for(cfg, "influx"), InfluxEncoder)
+        encoder = InfluxEncoder(cfg)
+        point = encoder.encode(measurement(cfg, T0, co2=1100))
+        self.assertEqual(
+            {
+                "measurement": "aranet4",
+                "tags": {"aranet_name": "test", "aranet_addr": "test-addr"},
+                "time": T0.isoformat(),
+                "fields": EXPECTED_FIELDS,
+            },
+            point,
+        )
+        # the device's tags are built once:
+        self.assertIs(
+            point["tags"], encoder.encode(measurement(cfg, T0, co2=500))["tags"]
+        )
+
+    def test_mqtt(self):
+        cfg = _cfg()
+        self.assertIsInstance(encoder_for(cfg, "mqtt"), MqttEncoder)
+        topic, payload = MqttEncoder(cfg).encode(measurement(cfg, T0, co2=1100))
+        self.assertEqual("sensors/co2/test", topic)
+        self.assertEqual(
+            json.dumps(
+                {
+                    "tags": {"aranet_name": "test", "aranet_addr": "test-addr"},
+                    "time": T0.isoformat(),
+                    "fields": EXPECTED_FIELDS,
+                }
+            ),
+            payload,
+        )
+
+    def test_registry(self):
+        with self.assertRaises(ValueError):
+            encoder_for(_cfg(), "nonexistent")
+        with self.assertRaises(ValueError):
+            register_encoder("influx")(Encoder)
+        # subclasses must implement both methods:
+        with self.assertRaises(TypeError):
+            Encoder(_cfg())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+
+from metrics import MetricsRegistry
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    def test_counter_and_gauge(self):
+        r = MetricsRegistry()
+        polls = r.counter("polls_total", "Polls.")
+        co2 = r.gauge("co2_ppm", "CO2.", ("device",))
+        polls.inc()
+        polls.inc()
+        co2.set(650, device="office")
+        co2.set(21.5, device='the "big" room')
+        self.assertEqual(
+            "# HELP polls_total Polls.\n"
+            "# TYPE polls_total counter\n"
+            "polls_total 2\n"
+            "# HELP co2_ppm CO2.\n"
+            "# TYPE co2_ppm gauge\n"
+            'co2_ppm{device="office"} 650\n'
+            'co2_ppm{device="the \\"big\\" room"} 21.5\n',
+            r.render(),
+        )
+
+    def test_histogram(self):
+        r = MetricsRegistry()
+        h = r.histogram("write_seconds", "Writes.", ("sink",), buckets=(0.1, 1.0))
+        h.observe(0.05, sink="influx")
+        h.observe(0.5, sink="influx")
+        h.observe(3, sink="influx")
+        self.assertEqual(
+            "# HELP write_seconds Writes.\n"
+            "# TYPE write_seconds histogram\n"
+            'write_seconds_bucket{sink="influx",le="0.1"} 1\n'
+            'write_seconds_bucket{sink="influx",le="1"} 2\n'
+            'write_seconds_bucket{sink="influx",le="+Inf"} 3\n'
+            'write_seconds_sum{sink="influx"} 3.55\n'
+            'write_seconds_count{sink="influx"} 3\n',
+            r.render(),
+        )
+
+    def test_labels_must_match(self):
+        c = MetricsRegistry().counter("failures_total", "Failures.", ("sink",))
+        with self.assertRaises(ValueError):
+            c.inc()
+        with self.assertRaises(ValueError):
+            c.inc(sink="influx", device="office")
+
+
+if __name__ == "__main__":
+    unittest.main()
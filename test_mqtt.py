@@ -0,0 +1,73 @@
+import json
+import tempfile
+import unittest
+from unittest import mock
+
+from paho.mqtt.reasoncodes import ReasonCode
+
+from config import Config
+from mqtt import MqttPublisher
+from spool import Spool
+
+
+def _cfg(**kwargs) -> Config:
+    return Config.from_dict(
+        {
+            "aranet_device_address": "test-addr",
+            "device_name": "test",
+            "mqtt": True,
+            "mqtt_broker": "mqtt.example.com",
+            "mqtt_topic": "sensors/co2/test",
+        }
+        | kwargs
+    )
+
+
+@mock.patch("mqtt.mqtt.Client")
+class TestMqttPublisher(unittest.TestCase):
+    def _connect(self, publisher: MqttPublisher, client):
+        client.is_connected.return_value = True
+        publisher._on_connect(client, None, None, ReasonCode(2, identifier=0), None)
+
+    def test_publishes_when_connected(self, client_cls):
+        client = client_cls.return_value
+        client.is_connected.return_value = True
+        client.publish.return_value.rc = 0
+        publisher = MqttPublisher(_cfg(mqtt_qos=1, mqtt_retain=True))
+        self.assertTrue(publisher.publish("t", "p"))
+        client.publish.assert_called_once_with("t", "p", qos=1, retain=True)
+
+    def test_buffers_while_disconnected(self, client_cls):
+        client = client_cls.return_value
+        client.is_connected.return_value = False
+        client.publish.return_value.rc = 0
+        publisher = MqttPublisher(_cfg())
+        self.assertFalse(publisher.publish("t", "p1"))
+        self.assertFalse(publisher.publish("t", "p2"))
+        client.publish.assert_not_called()
+
+        self._connect(publisher, client)
+        self.assertEqual(
+            [c.args for c in client.publish.call_args_list], [("t", "p1"), ("t", "p2")]
+        )
+
+    def test_spools_while_disconnected(self, client_cls):
+        client = client_cls.return_value
+        client.is_connected.return_value = False
+        with tempfile.TemporaryDirectory() as d:
+            spool = Spool(d, "mqtt", max_bytes=1024 * 1024)
+            woken = []
+            publisher = MqttPublisher(
+                _cfg(), spool=spool, on_connect=lambda: woken.append(True)
+            )
+            self.assertFalse(publisher.publish("t", json.dumps({"co2": 600})))
+            self.assertEqual(
+                spool.peek(10)[0], [{"topic": "t", "payload": '{"co2": 600}'}]
+            )
+            self.assertFalse(publisher.publish_batch([("t", "p")]))
+            self._connect(publisher, client)
+            self.assertEqual(woken, [True])
+
+
+if __name__ == "__main__":
+    unittest.main()
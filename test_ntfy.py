@@ -1,9 +1,24 @@
 import datetime
+import http.server
+import logging
+import threading
 import unittest
+from unittest import mock
 
 from co2 import Co2WarningLevel
 from config import Config
-from ntfy import fmt_duration, mute_action, should_notify
+from ntfy import (
+    NTFY_ATTEMPTS,
+    NTFY_BACKOFF_MAX_S,
+    MuteEvent,
+    Notifier,
+    NotifyInbox,
+    ReadingEvent,
+    backoff_s,
+    fmt_duration,
+    mute_action,
+    should_notify,
+)
 
 
 def _cfg() -> Config:
@@ -217,5 +232,192 @@ class TestFmtDuration(unittest.TestCase):
         self.assertEqual(fmt_duration(5400), "1h 30m")
 
 
+def _reading(device: str, co2: int) -> ReadingEvent:
+    return ReadingEvent(
+        device=device, co2=co2, t=datetime.datetime(2026, 1, 1, tzinfo=datetime.UTC)
+    )
+
+
+class TestNotifyInbox(unittest.TestCase):
+    def test_coalesces_readings_per_device(self):
+        inbox = NotifyInbox()
+        inbox.put(_reading("office", 900))
+        inbox.put(_reading("bedroom", 700))
+        inbox.put(_reading("office", 1500))
+        self.assertEqual(2, len(inbox))
+        self.assertEqual(_reading("bedroom", 700), inbox.get())
+        # the newer reading went to the back of the queue:
+        self.assertEqual(_reading("office", 1500), inbox.get())
+
+    def test_keeps_every_mute(self):
+        inbox = NotifyInbox()
+        inbox.put(MuteEvent(mute_seconds=3600))
+        inbox.put(_reading("office", 900))
+        inbox.put(MuteEvent(mute_seconds=0))
+        self.assertTrue(inbox.has_reading("office"))
+        self.assertEqual(
+            [MuteEvent(3600), _reading("office", 900), MuteEvent(0)],
+            [inbox.get() for _ in range(3)],
+        )
+        self.assertFalse(inbox.has_reading("office"))
+
+    def test_bounds_mutes(self):
+        inbox = NotifyInbox(max_mutes=2)
+        for secs in (60, 120, 180):
+            inbox.put(MuteEvent(mute_seconds=secs))
+        inbox.put(MuteEvent(mute_seconds=240))
+        self.assertEqual([180, 240], [inbox.get().mute_seconds for _ in range(2)])
+
+    def test_get_waits_for_put(self):
+        inbox = NotifyInbox()
+        threading.Timer(0.05, inbox.put, args=(_reading("office", 900),)).start()
+        self.assertEqual(_reading("office", 900), inbox.get())
+
+
+class TestBackoff(unittest.TestCase):
+    def test_jittered_and_capped(self):
+        with mock.patch("ntfy.random.uniform", side_effect=lambda lo, hi: hi):
+            self.assertEqual([1.0, 2.0, 4.0], [backoff_s(r) for r in (1, 2, 3)])
+            self.assertEqual(NTFY_BACKOFF_MAX_S, backoff_s(20))
+        for _ in range(100):
+            self.assertLessEqual(0.0, backoff_s(3))
+            self.assertLessEqual(backoff_s(3), 4.0)
+
+
+class _NtfyStandIn(http.server.BaseHTTPRequestHandler):
+    """Records messages, answering with the server's next status"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.messages.append(body.decode())
+        self.server.connections.add(self.client_address)
+        self.send_response(self.server.statuses.pop(0) if self.server.statuses else 200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@mock.patch("ntfy.time.sleep")
+class TestSend(unittest.TestCase):
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _NtfyStandIn)
+        self.server.messages = []
+        self.server.connections = set()
+        self.server.statuses = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        cfg = Config.from_dict(
+            {
+                "aranet_device_address": "test-addr",
+                "device_name": "test",
+                "notify": True,
+                "ntfy_server": f"http://127.0.0.1:{self.server.server_address[1]}",
+                "ntfy_topic": "co2",
+                "notify_room_name": "Office",
+            }
+        )
+        self.notifier = Notifier(cfg, NotifyInbox(), log_level=logging.INFO)
+        self.logger = logging.getLogger(__name__)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_reuses_connection(self, sleep):
+        for _ in range(3):
+            self.assertTrue(self.notifier._send(self.logger, "hi", {}))
+        self.assertEqual(3, len(self.server.messages))
+        self.assertEqual(1, len(self.server.connections))
+
+    def test_retries_server_errors(self, sleep):
+        self.server.statuses = [503, 429]
+        with self.assertLogs("test_ntfy", logging.WARNING):
+            self.assertTrue(self.notifier._send(self.logger, "hi", {}))
+        self.assertEqual(["hi"] * 3, self.server.messages)
+        self.assertEqual(2, sleep.call_count)
+
+    def test_gives_up(self, sleep):
+        self.server.statuses = [503] * NTFY_ATTEMPTS
+        with self.assertLogs("test_ntfy", logging.WARNING):
+            self.assertFalse(self.notifier._send(self.logger, "hi", {}))
+        self.assertEqual(NTFY_ATTEMPTS, len(self.server.messages))
+
+    def test_no_retry_on_client_error(self, sleep):
+        self.server.statuses = [403]
+        with self.assertLogs("test_ntfy", logging.ERROR):
+            self.assertFalse(self.notifier._send(self.logger, "hi", {}))
+        self.assertEqual(1, len(self.server.messages))
+        sleep.assert_not_called()
+
+    def _notifier(self, **kwargs) -> Notifier:
+        cfg = Config.from_dict(
+            {
+                "aranet_device_address": "test-addr",
+                "device_name": "test",
+                "notify": True,
+                "ntfy_server": f"http://127.0.0.1:{self.server.server_address[1]}",
+                "ntfy_topic": "co2",
+                "notify_room_name": "Office",
+                "co2_red": 1400,
+            }
+            | kwargs
+        )
+        return Notifier(cfg, NotifyInbox(), log_level=logging.INFO)
+
+    def test_alert_rule_messages(self, sleep):
+        notifier = self._notifier(
+            alert_rules=[
+                {"name": "hot", "metric": "temp_c", "above": 28, "level": "red"}
+            ]
+        )
+        with self.assertLogs("test_ntfy", logging.INFO):
+            notifier._handle_reading(
+                self.logger,
+                ReadingEvent(
+                    device="test",
+                    co2=1500,
+                    t=datetime.datetime(2026, 1, 1, tzinfo=datetime.UTC),
+                    temp_c=29.04,
+                ),
+            )
+        self.assertEqual(
+            ["Office: CO2 1500 ppm", "Office: temperature 29.0 °C"],
+            self.server.messages,
+        )
+
+    def test_trend(self, sleep):
+        notifier = self._notifier(
+            co2_yellow=2000, trend_lead_min=15, notify_yellow_every=30
+        )
+        with self.assertLogs("test_ntfy", logging.INFO):
+            # rising 20 ppm/min, so at 1120 ppm, red is 14 minutes off:
+            for minute, ppm in enumerate((1080, 1100, 1120, 1140, 1160)):
+                notifier._handle_reading(
+                    self.logger,
+                    ReadingEvent(
+                        device="test",
+                        co2=ppm,
+                        t=datetime.datetime(2026, 1, 1, 0, minute, tzinfo=datetime.UTC),
+                    ),
+                )
+        # the first two readings weren't a trend yet, and later warnings were
+        # rate limited:
+        self.assertEqual(
+            ["Office: CO2 will reach red in ~14 minutes (1120 ppm, rising 20 ppm/min)"],
+            self.server.messages,
+        )
+
+    def test_superseded(self, sleep):
+        self.server.statuses = [503]
+        with self.assertLogs("test_ntfy", logging.INFO):
+            self.assertFalse(
+                self.notifier._send(self.logger, "hi", {}, superseded=lambda: True)
+            )
+        self.assertEqual(1, len(self.server.messages))
+
+
 if __name__ == "__main__":
     unittest.main()
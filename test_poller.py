@@ -0,0 +1,197 @@
+import asyncio
+import datetime
+import logging
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from backfill import BackfillState
+from clock import VirtualClock
+from config import Config
+from fakeble import FakeBackend, FakeDevice
+from poller import Poller
+from shared import SharedBuffer
+from testutil import reading
+
+T0 = datetime.datetime(2026, 1, 5, 12, 0, tzinfo=datetime.UTC)
+
+
+def _cfg(**kwargs) -> Config:
+    return Config.from_dict(
+        {
+            "aranet_device_address": "FA:KE",
+            "device_name": "test",
+            "influx": True,
+            "influx_bucket": "dzhome",
+            "influx_host": "influx.example.com",
+            "influx_measurement_name": "aranet4",
+            "influx_flush_interval_s": 3600,
+        }
+        | kwargs
+    )
+
+
+class _SlowBackend(FakeBackend):
+    """Reads take read_s[address] seconds on the clock; records when each starts"""
+
+    def __init__(self, devices: list[FakeDevice], clock, read_s: dict[str, float]):
+        super().__init__(devices, clock)
+        self.read_s = read_s
+        self.started_at: dict[str, float] = {}  # by address
+
+    def client(self, ble_device, disconnected_callback):
+        client = super().client(ble_device, disconnected_callback)
+        read = client.read_gatt_char
+
+        async def slow_read(uuid: str) -> bytearray:
+            self.started_at[ble_device.address] = self.clock.monotonic()
+            await self.clock.sleep(self.read_s[ble_device.address])
+            return await read(uuid)
+
+        client.read_gatt_char = slow_read
+        return client
+
+
+class _HistoryConnection:
+    """Serves a reading a minute from T0 to now, each timed a second off from
+    the whole minute it's written live at"""
+
+    def __init__(self, clock: VirtualClock):
+        self.clock = clock
+
+    async def read_history(self, since: datetime.datetime, limit: int):
+        history = []
+        minute = 0
+        while (t := T0 + datetime.timedelta(minutes=minute)) <= self.clock.now():
+            t += datetime.timedelta(seconds=(-1) ** minute)
+            if t > since:
+                history.append((t, reading("FA:KE")))
+            minute += 1
+        return history[:limit]
+
+
+class _RecordingInflux:
+    def __init__(self):
+        self.written: list[datetime.datetime] = []
+
+    def write(self, measurements) -> bool:
+        self.written.extend(m.t for m in measurements)
+        return True
+
+
+@mock.patch("influxdb.InfluxDBClient")
+class TestPoller(unittest.TestCase):
+    def test_flushes_and_closes(self, client_cls):
+        client = client_cls.return_value
+        client.write_points.return_value = True
+        clock = VirtualClock(T0)
+        backend = FakeBackend([FakeDevice("FA:KE")], clock)
+        poller = Poller(
+            _cfg(), None, logging.INFO, False, clock=clock, ble_backend=backend
+        )
+        logger = logging.getLogger(__name__)
+
+        async def run():
+            poller.start(logger)
+            await poller.poll_due(logger)
+            # buffered, for up to influx_flush_interval_s:
+            client.write_points.assert_not_called()
+            self.assertTrue(poller._connections["FA:KE"].is_connected)
+            await poller.stop(logger)
+
+        with self.assertLogs(logger, "INFO"):
+            asyncio.run(run())
+        self.assertEqual(1, len(client.write_points.call_args.args[0]))
+        client.close.assert_called_once()
+        self.assertFalse(poller._connections["FA:KE"].is_connected)
+
+    def test_oversized_shared_values_are_skipped(self, client_cls):
+        clock = VirtualClock(T0)
+        backend = FakeBackend([FakeDevice("FA:KE")], clock)
+        latest_buf, metrics_buf = SharedBuffer(8), SharedBuffer(8)
+        poller = Poller(
+            _cfg(),
+            None,
+            logging.INFO,
+            False,
+            latest_buf=latest_buf,
+            metrics_buf=metrics_buf,
+            clock=clock,
+            ble_backend=backend,
+        )
+        logger = logging.getLogger(__name__)
+
+        async def run():
+            poller.start(logger)
+            await poller.poll_due(logger)
+            await poller.stop(logger)
+
+        with self.assertLogs(logger, "ERROR") as logs:
+            asyncio.run(run())
+        self.assertIn("not sharing the latest readings", logs.output[0])
+        self.assertIn("not sharing metrics", logs.output[1])
+        self.assertEqual(b"", latest_buf.value)
+
+    def test_reads_start_staggered(self, client_cls):
+        addresses = [f"FA:KE:00:00:00:0{i}" for i in range(4)]
+        cfg = Config.from_dict(
+            {
+                "devices": [{"address": a, "name": f"d{a[-1]}"} for a in addresses],
+                "store": True,
+                "store_file": ":memory:",
+                "poll_concurrency": 2,
+                "poll_stagger_s": 2,
+            }
+        )
+        clock = VirtualClock(T0)
+        # the first two reads end together, freeing both slots at once:
+        backend = _SlowBackend(
+            [FakeDevice(a) for a in addresses],
+            clock,
+            read_s=dict(zip(addresses, (10, 8, 1, 1), strict=True)),
+        )
+        poller = Poller(
+            cfg, None, logging.INFO, False, clock=clock, ble_backend=backend
+        )
+        logger = logging.getLogger(__name__)
+
+        async def run():
+            poller.start(logger)
+            await poller.poll_due(logger)
+            await poller.stop(logger)
+
+        with self.assertLogs(logger, "INFO"):
+            asyncio.run(run())
+        self.assertEqual([0, 2, 10, 12], [backend.started_at[a] for a in addresses])
+
+    def test_backfill_alongside_live_writes_writes_each_reading_once(self, _):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, "backfill.json")
+        clock = VirtualClock(T0)
+        cfg = _cfg(backfill=True, backfill_state_file=path, backfill_max_records=3)
+        poller = Poller(cfg, None, logging.INFO, False, clock=clock)
+        poller._backfill = BackfillState(path, datetime.timedelta(seconds=90))
+        poller._connections["FA:KE"] = _HistoryConnection(clock)
+        poller._influx = influx = _RecordingInflux()
+        logger = logging.getLogger(__name__)
+
+        async def run():
+            # down for minutes 1 through 9, then polled every minute, catching
+            # up on the gap 3 readings per poll:
+            for minute in (0, *range(10, 21)):
+                clock.advance_to(minute * 60)
+                influx.written.append(clock.now())
+                poller._backfill.record_live_writes([("test", clock.now())])
+                await poller._backfill_once(logger)
+
+        with self.assertLogs(logger, "INFO"):
+            asyncio.run(run())
+        self.assertIsNone(poller._backfill.pending("test"))
+        minutes = [round((t - T0).total_seconds() / 60) for t in influx.written]
+        self.assertEqual(list(range(21)), sorted(minutes))
+
+
+if __name__ == "__main__":
+    unittest.main()
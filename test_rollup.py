@@ -0,0 +1,158 @@
+import datetime
+import json
+import unittest
+from unittest import mock
+
+from config import Config
+from influx import rollup_line
+from mqtt import rollup_message
+from rollup import ROLLUP_MAX_PENDING, RollupAggregator, RollupWriter
+from testutil import measurement
+
+T0 = datetime.datetime(2026, 1, 1, 12, 0, tzinfo=datetime.UTC)
+GRACE = datetime.timedelta(minutes=2)
+
+
+def _at(minutes: float) -> datetime.datetime:
+    return T0 + datetime.timedelta(minutes=minutes)
+
+
+def _cfg(**kwargs) -> Config:
+    return Config.from_dict(
+        {
+            "aranet_device_address": "test-addr",
+            "device_name": "test",
+            "influx": True,
+            "influx_bucket": "aranet",
+            "influx_host": "influx.example.com",
+            "influx_measurement_name": "aranet4",
+            "mqtt": True,
+            "mqtt_broker": "mqtt.example.com",
+            "mqtt_topic": "sensors/co2/test",
+            "rollup_windows_min": [15, 60],
+        }
+        | kwargs
+    )
+
+
+class TestRollupAggregator(unittest.TestCase):
+    def test_closes_window_on_later_measurement(self):
+        cfg = _cfg()
+        rollups = RollupAggregator([15, 60], GRACE)
+        for minutes, co2 in ((1, 600), (6, 900), (11, 600)):
+            self.assertEqual([], rollups.add(measurement(cfg, _at(minutes), co2=co2)))
+        closed = rollups.add(measurement(cfg, _at(16), co2=800))
+        self.assertEqual([15], [r.window_min for r in closed])
+        r = closed[0]
+        self.assertEqual((T0, 3), (r.start, r.count))
+        self.assertEqual(
+            (600, 900, 700, 600),
+            tuple(r.fields[f"co2_ppm_{s}"] for s in ("min", "max", "mean", "last")),
+        )
+        self.assertEqual(21.0, r.fields["temp_c_mean"])
+        # strings, like the warning level, don't roll up:
+        self.assertNotIn("co2_warning_level_last", r.fields)
+        self.assertEqual(
+            {"aranet_name": "test", "aranet_addr": "test-addr", "window": "15m"},
+            r.tags(),
+        )
+
+    def test_closes_window_after_grace(self):
+        cfg = _cfg()
+        rollups = RollupAggregator([15], GRACE)
+        rollups.add(measurement(cfg, _at(1), co2=600))
+        self.assertEqual([], rollups.close_due(T0 + datetime.timedelta(minutes=16)))
+        closed = rollups.close_due(T0 + datetime.timedelta(minutes=17))
+        self.assertEqual([1], [r.count for r in closed])
+        self.assertEqual([], rollups.close_due(T0 + datetime.timedelta(minutes=60)))
+
+    def test_late_measurement_is_left_out(self):
+        cfg = _cfg()
+        rollups = RollupAggregator([15], GRACE)
+        rollups.add(measurement(cfg, _at(1), co2=600))
+        rollups.add(measurement(cfg, _at(16), co2=600))
+        self.assertEqual([], rollups.add(measurement(cfg, _at(14), co2=600)))
+        self.assertEqual(1, rollups.late)
+
+
+class TestEncoding(unittest.TestCase):
+    def test_line_protocol(self):
+        cfg = _cfg()
+        rollups = RollupAggregator([15], GRACE)
+        rollups.add(measurement(cfg, _at(1), co2=600))
+        (r,) = rollups.close_due(T0 + datetime.timedelta(hours=1))
+        line = rollup_line(cfg, r)
+        self.assertTrue(
+            line.startswith("aranet4_rollup,aranet_addr=test-addr,aranet_name=test,")
+        )
+        self.assertIn(",window=15m ", line)
+        self.assertIn("co2_ppm_max=600i", line)
+        self.assertIn("co2_ppm_mean=600.0", line)
+        self.assertIn("count=1i", line)
+        self.assertTrue(line.endswith(f" {int(T0.timestamp())}"))
+
+    def test_mqtt_message(self):
+        cfg = _cfg()
+        rollups = RollupAggregator([15], GRACE)
+        rollups.add(measurement(cfg, _at(1), co2=600))
+        (r,) = rollups.close_due(T0 + datetime.timedelta(hours=1))
+        topic, payload = rollup_message(r)
+        self.assertEqual("sensors/co2/test/rollup", topic)
+        payload = json.loads(payload)
+        self.assertEqual(T0.isoformat(), payload["time"])
+        self.assertEqual(600, payload["fields"]["co2_ppm_last"])
+
+
+class TestRollupWriter(unittest.TestCase):
+    def _rollups(self, n: int) -> list:
+        cfg = _cfg()
+        rollups = RollupAggregator([15], GRACE)
+        closed = []
+        for i in range(n + 1):
+            closed.extend(rollups.add(measurement(cfg, _at(15 * i), co2=600)))
+        return closed
+
+    def test_retries_failed_influx_writes(self):
+        influx, mqtt = mock.Mock(), mock.Mock()
+        influx.write_rollups.return_value = False
+        mqtt.publish_rollup.return_value = True
+        writer = RollupWriter(influx=influx, mqtt=mqtt)
+        writer.add(self._rollups(2))
+        self.assertFalse(writer.write())
+        self.assertEqual(2, mqtt.publish_rollup.call_count)
+        self.assertTrue(writer.pending())
+
+        influx.write_rollups.return_value = True
+        writer.add(self._rollups(1))
+        self.assertTrue(writer.write())
+        self.assertEqual(3, len(influx.write_rollups.call_args.args[0]))
+        # MQTT holds on to messages itself, so each rollup is published once:
+        self.assertEqual(3, mqtt.publish_rollup.call_count)
+        self.assertFalse(writer.pending())
+
+    def test_pending_is_bounded(self):
+        writer = RollupWriter(influx=mock.Mock())
+        rollups = self._rollups(1)
+        writer.add(rollups * (ROLLUP_MAX_PENDING + 5))
+        self.assertEqual(ROLLUP_MAX_PENDING, len(writer._influx_pending))
+
+    def test_overflow_during_write_keeps_newer_rollups(self):
+        influx = mock.Mock()
+        writer = RollupWriter(influx=influx)
+        rollups = self._rollups(1)
+        writer.add(rollups * ROLLUP_MAX_PENDING)
+        newer = self._rollups(3)
+
+        def write_rollups(batch) -> bool:
+            # rollups closed while the write is in flight push some of the
+            # batch out:
+            writer.add(newer)
+            return True
+
+        influx.write_rollups.side_effect = write_rollups
+        self.assertTrue(writer.write())
+        self.assertEqual(newer, list(writer._influx_pending))
+
+
+if __name__ == "__main__":
+    unittest.main()
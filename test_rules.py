@@ -0,0 +1,137 @@
+import datetime
+import random
+import unittest
+
+from co2 import Co2WarningLevel
+from config import Config
+from rules import RollingWindow, RuleEngine, rules_for
+
+T0 = datetime.datetime(2026, 1, 1, tzinfo=datetime.UTC)
+
+
+def _cfg(**kwargs) -> Config:
+    return Config.from_dict(
+        {
+            "aranet_device_address": "test-addr",
+            "device_name": "test",
+            "co2_yellow": 1000,
+            "co2_red": 1400,
+        }
+        | kwargs
+    )
+
+
+def _at(minutes: float) -> datetime.datetime:
+    return T0 + datetime.timedelta(minutes=minutes)
+
+
+class TestRollingWindow(unittest.TestCase):
+    def test_matches_brute_force(self):
+        rng = random.Random(4)
+        points = []
+        t = 0.0
+        for _ in range(500):
+            t += rng.uniform(0, 90)
+            points.append((t, rng.uniform(400, 2000)))
+        for aggregate, fn in (
+            ("mean", lambda vs: sum(vs) / len(vs)),
+            ("max", max),
+            ("min", min),
+        ):
+            window = RollingWindow(600, aggregate)
+            for i, (t, v) in enumerate(points):
+                expected = fn([pv for pt, pv in points[: i + 1] if pt >= t - 600])
+                self.assertAlmostEqual(expected, window.add(t, v), msg=aggregate)
+
+
+class TestRulesFor(unittest.TestCase):
+    def test_builtins(self):
+        rules = rules_for(_cfg(notify_yellow_every=30, ntfy_priority_red="4"))
+        self.assertEqual(["co2_yellow", "co2_red"], [r.name for r in rules])
+        self.assertEqual((1000, 30), (rules[0].above, rules[0].every))
+        self.assertEqual((1400, "4"), (rules[1].above, rules[1].priority))
+
+    def test_configured_rule_replaces_builtin(self):
+        rule = {"name": "co2_red", "metric": "co2_ppm", "above": 1600, "level": "red"}
+        rules = rules_for(_cfg(alert_rules=[rule]))
+        self.assertEqual(["co2_yellow", "co2_red"], [r.name for r in rules])
+        self.assertEqual(1600, rules[1].above)
+
+
+class TestRuleEngine(unittest.TestCase):
+    def _levels(self, engine: RuleEngine, minutes: float, **values) -> dict:
+        return {
+            a.metric: a.level for a in engine.evaluate("office", _at(minutes), values)
+        }
+
+    def test_builtins_match_co2_levels(self):
+        cfg = _cfg()
+        engine = RuleEngine(cfg)
+        for i, ppm in enumerate((400, 999, 1000, 1399, 1400, 2000, 1200, 600)):
+            self.assertEqual(
+                {"co2_ppm": Co2WarningLevel.from_ppm(cfg, ppm)},
+                self._levels(engine, i, co2_ppm=ppm),
+            )
+
+    def test_windowed_mean_with_hysteresis(self):
+        rule = {
+            "name": "hot",
+            "metric": "temp_c",
+            "window_min": 10,
+            "above": 28,
+            "clear_at": 26,
+        }
+        engine = RuleEngine(_cfg(alert_rules=[rule]))
+        green, yellow = Co2WarningLevel.GREEN, Co2WarningLevel.YELLOW
+        # a single hot reading doesn't lift the 10 minute mean past 28:
+        self.assertEqual(green, self._levels(engine, 0, temp_c=25)["temp_c"])
+        self.assertEqual(green, self._levels(engine, 4, temp_c=30)["temp_c"])
+        self.assertEqual(yellow, self._levels(engine, 8, temp_c=31)["temp_c"])
+        # mean 28, falling but not yet below clear_at:
+        self.assertEqual(yellow, self._levels(engine, 14, temp_c=23)["temp_c"])
+        self.assertEqual(green, self._levels(engine, 16, temp_c=23)["temp_c"])
+        self.assertEqual(
+            "temperature 28.7 °C (mean over 10 min)", engine.rules[-1].describe(28.67)
+        )
+
+    def test_windowed_rule_waits_for_the_window(self):
+        rule = {"name": "hot", "metric": "temp_c", "window_min": 15, "above": 28}
+        engine = RuleEngine(_cfg(alert_rules=[rule]))
+        green, yellow = Co2WarningLevel.GREEN, Co2WarningLevel.YELLOW
+        levels = [self._levels(engine, m, temp_c=35)["temp_c"] for m in range(14)]
+        # alerts once the readings span 80% of the window, 12 minutes:
+        self.assertEqual([green] * 12 + [yellow] * 2, levels)
+        engine = RuleEngine(_cfg(alert_rules=[rule]))
+        self._levels(engine, 0, temp_c=35)
+        # after a gap longer than the window, it waits again:
+        self.assertEqual(green, self._levels(engine, 20, temp_c=35)["temp_c"])
+
+    def test_highest_level_wins(self):
+        rules = [
+            {"name": "damp", "metric": "humidity_pct", "above": 60},
+            {"name": "wet", "metric": "humidity_pct", "above": 70, "level": "red"},
+        ]
+        engine = RuleEngine(_cfg(alert_rules=rules))
+        alerts = engine.evaluate("office", T0, {"co2_ppm": 500, "humidity_pct": 75})
+        humidity = next(a for a in alerts if a.metric == "humidity_pct")
+        self.assertEqual(
+            (Co2WarningLevel.RED, "wet"), (humidity.level, humidity.rule.name)
+        )
+        self.assertEqual("humidity 75%", humidity.rule.describe(75))
+
+    def test_missing_values_are_skipped(self):
+        rule = {"name": "low", "metric": "pressure_mbar", "below": 980}
+        engine = RuleEngine(_cfg(alert_rules=[rule]))
+        self.assertEqual(
+            {"co2_ppm"}, set(self._levels(engine, 0, co2_ppm=500, pressure_mbar=None))
+        )
+
+    def test_devices_are_independent(self):
+        engine = RuleEngine(_cfg())
+        engine.evaluate("office", T0, {"co2_ppm": 1500})
+        alerts = engine.evaluate("bedroom", T0, {"co2_ppm": 500})
+        self.assertEqual([Co2WarningLevel.GREEN], [a.level for a in alerts])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+import datetime
+import time
+import unittest
+
+from config import Config
+from schedule import PollSchedule
+from testutil import measurement
+
+T0 = datetime.datetime(2026, 1, 1, tzinfo=datetime.UTC)
+
+
+def _at(minutes: float) -> datetime.datetime:
+    return T0 + datetime.timedelta(minutes=minutes)
+
+
+def _cfg(**kwargs) -> Config:
+    return Config.from_dict(
+        {
+            "aranet_device_address": "test-addr",
+            "device_name": "test",
+            "poll_interval": 2,
+            "poll_adaptive": True,
+            "poll_interval_min": 1,
+            "poll_interval_max": 6,
+            "poll_fast_ppm_per_min": 20,
+            "poll_low_battery_pct": 15,
+            "poll_align_refresh": False,
+        }
+        | kwargs
+    )
+
+
+class TestPollSchedule(unittest.TestCase):
+    def test_fixed_without_poll_adaptive(self):
+        cfg = _cfg(poll_adaptive=False)
+        schedule = PollSchedule(cfg)
+        self.assertFalse(schedule.update([measurement(cfg, _at(0), co2=1500)]))
+        self.assertEqual(120, schedule.interval_s)
+
+    def test_lengthens_while_stable(self):
+        cfg = _cfg()
+        schedule = PollSchedule(cfg)
+        intervals = []
+        minutes = 0.0
+        for _ in range(5):
+            schedule.update([measurement(cfg, _at(minutes), co2=600)])
+            intervals.append(schedule.interval_s)
+            minutes += schedule.interval_s / 60
+        # the first reading has nothing to compare to:
+        self.assertEqual([120, 180, 270, 360, 360], intervals)
+        self.assertEqual("CO2 stable", schedule.reason)
+
+    def test_shortens_when_changing_fast_or_alerting(self):
+        cfg = _cfg()
+        schedule = PollSchedule(cfg)
+        schedule.update([measurement(cfg, _at(0), co2=600)])
+        self.assertTrue(schedule.update([measurement(cfg, _at(2), co2=650)]))
+        self.assertEqual(60, schedule.interval_s)
+        self.assertEqual("CO2 changing 25 ppm/min", schedule.reason)
+        schedule.update([measurement(cfg, _at(3), co2=660)])
+        self.assertEqual(120, schedule.interval_s)
+        schedule.update([measurement(cfg, _at(5), co2=1100)])
+        self.assertEqual(
+            (60, "CO2 is yellow or red"), (schedule.interval_s, schedule.reason)
+        )
+
+    def test_backs_off_on_low_battery(self):
+        cfg = _cfg()
+        schedule = PollSchedule(cfg)
+        schedule.update([measurement(cfg, _at(0), co2=600, battery=10)])
+        self.assertEqual(240, schedule.interval_s)
+        self.assertEqual("poll_interval; low battery", schedule.reason)
+        # even while alerting, it's no shorter than poll_interval:
+        schedule.update([measurement(cfg, _at(4), co2=1100, battery=10)])
+        self.assertEqual(120, schedule.interval_s)
+        self.assertEqual("CO2 is yellow or red; low battery", schedule.reason)
+
+    def test_no_readings(self):
+        cfg = _cfg()
+        schedule = PollSchedule(cfg)
+        schedule.update([measurement(cfg, _at(0), co2=1100)])
+        # a poll that read nothing new leaves the interval as it was:
+        self.assertFalse(schedule.update([]))
+        self.assertEqual(
+            (60, "CO2 is yellow or red"), (schedule.interval_s, schedule.reason)
+        )
+
+
+class TestPollScheduleTiming(unittest.TestCase):
+    def test_fixed_cadence(self):
+        cfg = _cfg(poll_adaptive=False)
+        schedule = PollSchedule(cfg)
+        self.assertEqual(cfg.devices, schedule.due(time.monotonic()))
+        schedule.schedule(cfg.devices[0], 1000.0, measurement(cfg, _at(0), co2=600))
+        self.assertEqual(1120.0, schedule.next_due_at())
+        self.assertEqual([], schedule.due(1000.0))
+        self.assertEqual(cfg.devices, schedule.due(1116.0))
+
+    def test_aligned_to_refresh(self):
+        cfg = _cfg(poll_adaptive=False, poll_align_refresh=True)
+        schedule = PollSchedule(cfg)
+        now = time.monotonic()
+        # measured 30 s ago, every 5 min; the next measurement is after the
+        # 2 min poll_interval, 270 s from now:
+        m = measurement(cfg, _at(0), co2=600, interval_s=300)
+        m.t = datetime.datetime.now(datetime.UTC) - datetime.timedelta(seconds=30)
+        schedule.schedule(cfg.devices[0], now, m)
+        self.assertAlmostEqual(now + 275, schedule.next_due_at(), delta=1)
+        schedule.update([m])
+        self.assertEqual(300, schedule.effective_interval_s())
+
+        # every minute, the first measurement 2 min from now is 150 s away:
+        m.refresh_s = 60
+        schedule.schedule(cfg.devices[0], now, m)
+        self.assertAlmostEqual(now + 155, schedule.next_due_at(), delta=1)
+
+    def test_aligned_reads_every_measurement(self):
+        cfg = _cfg(poll_adaptive=False, poll_interval=1, poll_align_refresh=True)
+        schedule = PollSchedule(cfg)
+        now = time.monotonic()
+        # polled just after a measurement, taken every minute, as aligned polls are:
+        m = measurement(cfg, _at(0), co2=600, interval_s=60)
+        m.t = datetime.datetime.now(datetime.UTC) - datetime.timedelta(seconds=5)
+        schedule.schedule(cfg.devices[0], now, m)
+        self.assertAlmostEqual(now + 60, schedule.next_due_at(), delta=1)
+
+    def test_spacing(self):
+        cfg = _cfg(poll_adaptive=False)
+        schedule = PollSchedule(cfg)
+        self.assertEqual(120, schedule.spacing_s(measurement(cfg, _at(0), co2=600)))
+        # polls every 2 min read every other measurement taken every minute, or
+        # every one taken every 5 min:
+        m = measurement(cfg, _at(0), co2=600, interval_s=60)
+        self.assertEqual(120, schedule.spacing_s(m))
+        m.refresh_s = 90
+        self.assertEqual(180, schedule.spacing_s(m))
+        m.refresh_s = 300
+        self.assertEqual(300, schedule.spacing_s(m))
+
+    def test_failed_reads_keep_the_cadence(self):
+        cfg = _cfg(poll_adaptive=False, poll_align_refresh=True)
+        schedule = PollSchedule(cfg)
+        schedule.schedule(cfg.devices[0], 1000.0, None)
+        self.assertEqual(1120.0, schedule.next_due_at())
+
+    def test_repeats(self):
+        cfg = _cfg()
+        schedule = PollSchedule(cfg)
+        first = measurement(cfg, _at(0), co2=600, interval_s=300)
+        self.assertFalse(schedule.is_repeat(first))
+        schedule.update([first])
+        # read again, its age a second off:
+        self.assertTrue(
+            schedule.is_repeat(measurement(cfg, _at(1 / 60), co2=600, interval_s=300))
+        )
+        self.assertFalse(
+            schedule.is_repeat(measurement(cfg, _at(5), co2=610, interval_s=300))
+        )
+        # without the device's interval, nothing is a repeat:
+        self.assertFalse(schedule.is_repeat(measurement(cfg, _at(0), co2=600)))
+
+
+if __name__ == "__main__":
+    unittest.main()
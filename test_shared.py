@@ -0,0 +1,99 @@
+import datetime
+import multiprocessing
+import unittest
+from unittest import mock
+
+from latest import LatestReadings
+from shared import SharedBuffer, SharedState, _Seqlock
+
+NOW = datetime.datetime.now(datetime.UTC).replace(microsecond=0)
+
+
+def _write_from_child(state: SharedState, buf: SharedBuffer):
+    state.mute_until = NOW
+    buf.value = b"from the child"
+
+
+class TestSharedState(unittest.TestCase):
+    def test_unset(self):
+        state = SharedState()
+        self.assertIsNone(state.last_poll_at)
+        self.assertIsNone(state.mute_until)
+        self.assertIsNone(state.poll_interval_s)
+        self.assertEqual((None, None), state.sinks()["influx"])
+
+    def test_set(self):
+        state = SharedState()
+        state.last_poll_at = NOW
+        state.mute_until = NOW + datetime.timedelta(hours=1)
+        self.assertEqual(NOW, state.last_poll_at)
+        self.assertEqual(NOW + datetime.timedelta(hours=1), state.mute_until)
+        state.mute_until = None
+        self.assertIsNone(state.mute_until)
+        state.poll_interval_s = 90.0
+        self.assertEqual(90.0, state.poll_interval_s)
+
+    def test_sinks(self):
+        state = SharedState()
+        earlier = NOW - datetime.timedelta(minutes=5)
+        state.record_sinks(earlier, {"influx": True, "mqtt": True})
+        state.record_sinks(NOW, {"influx": False})
+        sinks = state.sinks()
+        self.assertEqual((earlier, NOW), sinks["influx"])
+        self.assertEqual((earlier, None), sinks["mqtt"])
+        self.assertEqual((None, None), sinks["store"])
+
+
+class TestSeqlock(unittest.TestCase):
+    def test_gives_up_on_optimistic_reads(self):
+        lock = _Seqlock(ordered=True)
+        # as if a writer died mid-write, without holding the lock:
+        lock._seq.value = 1
+        self.assertEqual("copied", lock.read(lambda: "copied"))
+
+    def test_locks_without_ordered_stores(self):
+        lock = _Seqlock(ordered=False)
+        with mock.patch.object(lock, "_seq") as seq:
+            self.assertEqual("copied", lock.read(lambda: "copied"))
+        self.assertEqual([], seq.mock_calls)
+
+
+class TestSharedBuffer(unittest.TestCase):
+    def test_replace(self):
+        buf = SharedBuffer(16)
+        self.assertEqual(b"", buf.value)
+        buf.value = b"a longer value"
+        buf.value = b"short"
+        self.assertEqual(b"short", buf.value)
+
+    def test_too_long(self):
+        buf = SharedBuffer(4)
+        buf.value = b"abc"
+        with self.assertRaises(ValueError):
+            buf.value = b"abcde"
+        self.assertEqual(b"abc", buf.value)
+
+    def test_latest_round_trip(self):
+        self.assertIsNone(LatestReadings.unpack(b""))
+        latest = LatestReadings(
+            body=b'{"devices": {}}', etag="0" * 16, last_modified=NOW
+        )
+        buf = SharedBuffer(1024)
+        buf.value = latest.pack()
+        self.assertEqual(latest, LatestReadings.unpack(buf.value))
+
+
+class TestAcrossProcesses(unittest.TestCase):
+    def test_child_writes_are_visible(self):
+        state = SharedState()
+        buf = SharedBuffer(64)
+        p = multiprocessing.Process(target=_write_from_child, args=(state, buf))
+        p.start()
+        p.join(timeout=10)
+        self.assertEqual(0, p.exitcode)
+        self.assertEqual(NOW, state.mute_until)
+        self.assertEqual(b"from the child", buf.value)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import os
+import tempfile
+import unittest
+
+from spool import Spool, SpoolReplayer
+
+
+class TestSpool(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _drain(self, spool: Spool, limit: int = 100) -> list[dict]:
+        result = []
+        while True:
+            records, position = spool.peek(limit)
+            spool.commit(position)
+            if not records:
+                return result
+            result.extend(records)
+
+    def test_fifo(self):
+        spool = Spool(self.dir, "influx", max_bytes=1024 * 1024)
+        self.assertFalse(spool.pending())
+        spool.append([{"n": 1}, {"n": 2}])
+        spool.append([{"n": 3}])
+        self.assertTrue(spool.pending())
+        records, position = spool.peek(2)
+        self.assertEqual(records, [{"n": 1}, {"n": 2}])
+        # not committed, so peeked again:
+        self.assertEqual(spool.peek(2)[0], records)
+        spool.commit(position)
+        self.assertEqual(self._drain(spool), [{"n": 3}])
+        self.assertFalse(spool.pending())
+
+    def test_survives_restart(self):
+        spool = Spool(self.dir, "influx", max_bytes=1024 * 1024)
+        spool.append([{"n": i} for i in range(5)])
+        spool.commit(spool.peek(2)[1])
+
+        spool = Spool(self.dir, "influx", max_bytes=1024 * 1024)
+        self.assertEqual(self._drain(spool), [{"n": i} for i in range(2, 5)])
+        spool.append([{"n": 5}])
+        self.assertEqual(self._drain(spool), [{"n": 5}])
+
+    def test_sinks_are_separate(self):
+        Spool(self.dir, "influx", max_bytes=1024).append([{"sink": "influx"}])
+        Spool(self.dir, "mqtt", max_bytes=1024).append([{"sink": "mqtt"}])
+        self.assertEqual(
+            self._drain(Spool(self.dir, "mqtt", max_bytes=1024)), [{"sink": "mqtt"}]
+        )
+
+    def test_evicts_oldest_when_full(self):
+        spool = Spool(self.dir, "influx", max_bytes=800)
+        for i in range(100):
+            spool.append([{"n": i}])
+        remaining = self._drain(spool)
+        self.assertLess(len(remaining), 100)
+        self.assertEqual(remaining[-1], {"n": 99})
+        ns = [r["n"] for r in remaining]
+        self.assertEqual(ns, list(range(ns[0], 100)))
+        total = sum(
+            os.path.getsize(os.path.join(self.dir, f))
+            for f in os.listdir(self.dir)
+            if f.endswith(".jsonl")
+        )
+        self.assertLessEqual(total, 800)
+
+    def test_consumed_segments_deleted(self):
+        spool = Spool(self.dir, "influx", max_bytes=800)
+        for i in range(20):
+            spool.append([{"n": i}])
+        self._drain(spool)
+        segments = [f for f in os.listdir(self.dir) if f.endswith(".jsonl")]
+        self.assertLessEqual(len(segments), 1)
+
+    def test_skips_truncated_record(self):
+        spool = Spool(self.dir, "influx", max_bytes=1024 * 1024)
+        spool.append([{"n": 1}])
+        with open(os.path.join(self.dir, "influx.00000000.jsonl"), "ab") as f:
+            f.write(b'{"n":')
+        spool = Spool(self.dir, "influx", max_bytes=1024 * 1024)
+        spool.append([{"n": 2}])
+        self.assertEqual(self._drain(spool), [{"n": 1}, {"n": 2}])
+
+
+class TestSpoolReplayer(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.spool = Spool(self.tmp.name, "mqtt", max_bytes=1024 * 1024)
+        self.spool.append([{"n": i} for i in range(5)])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_drains_in_batches(self):
+        sent = []
+        replayer = SpoolReplayer(
+            self.spool, lambda r: sent.append(r) or True, "mqtt", batch_size=2
+        )
+        replayer._drain()
+        self.assertEqual(sent, [[{"n": 0}, {"n": 1}], [{"n": 2}, {"n": 3}], [{"n": 4}]])
+        self.assertFalse(self.spool.pending())
+
+    def test_stops_on_failure(self):
+        replayer = SpoolReplayer(self.spool, lambda r: False, "mqtt", batch_size=2)
+        replayer._drain()
+        self.assertEqual(self.spool.peek(10)[0], [{"n": i} for i in range(5)])
+
+
+if __name__ == "__main__":
+    unittest.main()
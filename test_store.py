@@ -0,0 +1,90 @@
+import datetime
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from config import Config
+from store import ReadingStore, query_readings
+from testutil import measurement
+
+NOW = datetime.datetime.now(datetime.UTC).replace(microsecond=0)
+
+
+CFG = Config.from_dict(
+    {
+        "devices": [
+            {"address": "office-addr", "name": "office"},
+            {"address": "bedroom-addr", "name": "bedroom"},
+        ],
+        "store": True,
+        "store_file": "unused.db",
+    }
+)
+
+
+class TestReadingStore(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._dir.name, "readings.db")
+        self.store = ReadingStore(self.path, retention_days=7)
+
+    def tearDown(self):
+        self.store.close()
+        self._dir.cleanup()
+
+    def test_wal_mode(self):
+        db = sqlite3.connect(self.path)
+        self.assertEqual("wal", db.execute("PRAGMA journal_mode").fetchone()[0])
+        db.close()
+
+    def test_flush_and_query(self):
+        for i in range(3):
+            t = NOW - datetime.timedelta(minutes=10 - i)
+            self.store.add(measurement(CFG, t, device="office", co2=600 + i))
+            self.store.add(measurement(CFG, t, device="bedroom", co2=700 + i))
+        self.assertEqual(
+            [], list(query_readings(self.path, NOW - datetime.timedelta(hours=1), NOW))
+        )
+        self.assertTrue(self.store.flush())
+
+        rows = list(query_readings(self.path, NOW - datetime.timedelta(hours=1), NOW))
+        self.assertEqual(6, len(rows))
+        self.assertEqual(
+            (
+                "bedroom",
+                NOW - datetime.timedelta(minutes=10),
+                700,
+                21.0,
+                40.0,
+                1012.0,
+                -70,
+            ),
+            rows[0],
+        )
+        rows = list(
+            query_readings(
+                self.path,
+                NOW - datetime.timedelta(minutes=9),
+                NOW,
+                device="office",
+            )
+        )
+        self.assertEqual([601, 602], [r[2] for r in rows])
+
+    def test_prunes_old_readings(self):
+        self.store.add(
+            measurement(CFG, NOW - datetime.timedelta(days=8), device="office")
+        )
+        self.store.add(measurement(CFG, NOW, device="office"))
+        self.assertTrue(self.store.flush())
+        rows = list(query_readings(self.path, NOW - datetime.timedelta(days=30), NOW))
+        self.assertEqual([NOW], [r[1] for r in rows])
+
+    def test_missing_database(self):
+        with self.assertRaises(sqlite3.Error):
+            query_readings(os.path.join(self._dir.name, "nope.db"), NOW, NOW)
+
+
+if __name__ == "__main__":
+    unittest.main()
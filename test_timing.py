@@ -0,0 +1,100 @@
+import json
+import logging
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from timing import StageTimer
+
+
+class TestStageTimer(unittest.TestCase):
+    def test_percentiles(self):
+        timer = StageTimer("test")
+        for ms in range(1, 101):
+            timer.record("ble.read", ms / 1000)
+        self.assertEqual({50: 0.051, 90: 0.091, 99: 0.1}, timer.percentiles("ble.read"))
+        self.assertEqual({}, timer.percentiles("nothing"))
+
+    def test_window_rolls(self):
+        timer = StageTimer("test", window=10)
+        for _ in range(10):
+            timer.record("poll", 5.0)
+        for _ in range(10):
+            timer.record("poll", 1.0)
+        self.assertEqual({50: 1.0, 90: 1.0, 99: 1.0}, timer.percentiles("poll"))
+
+    def test_stage_times_failures_too(self):
+        timer = StageTimer("test")
+        with self.assertRaises(RuntimeError), timer.stage("sink.influx"):
+            raise RuntimeError("boom")
+        self.assertIn(99, timer.percentiles("sink.influx"))
+
+    def test_summary_is_periodic(self):
+        logger = logging.getLogger(__name__)
+        with mock.patch("timing.time.monotonic", return_value=0.0):
+            timer = StageTimer("test", summary_interval_s=60)
+            timer.record("poll", 1.5)
+        with (
+            mock.patch("timing.time.monotonic", return_value=59.0),
+            self.assertNoLogs(logger),
+        ):
+            timer.maybe_log_summary(logger)
+        with (
+            mock.patch("timing.time.monotonic", return_value=60.0),
+            self.assertLogs(logger) as logs,
+        ):
+            timer.maybe_log_summary(logger)
+        self.assertIn("poll 1500/1500/1500 (n=1)", logs.output[0])
+
+    def test_trace(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "trace.jsonl")
+            timer = StageTimer("poller", trace_path=path)
+            timer.record("ble.read", 0.25, device="office")
+            timer.record("poll", 1.0)
+            timer.close()
+            with open(path) as f:
+                lines = [json.loads(line) for line in f]
+        self.assertEqual(
+            [("ble.read", 0.25, "office"), ("poll", 1.0, None)],
+            [(r["stage"], r["duration_s"], r.get("device")) for r in lines],
+        )
+        self.assertEqual("poller", lines[0]["process"])
+
+    def test_trace_is_bounded(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "trace.jsonl")
+            timer = StageTimer("poller", trace_path=path, trace_max_bytes=1000)
+            for _ in range(600):
+                timer.record("poll", 1.0)
+            timer.close()
+            # moved aside every 256 lines, once past trace_max_bytes:
+            with open(f"{path}.1") as f:
+                self.assertEqual(256, len(f.readlines()))
+            with open(path) as f:
+                self.assertEqual(88, len(f.readlines()))
+
+    def test_close_ends_tracing(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "trace.jsonl")
+            timer = StageTimer("poller", trace_path=path)
+            timer.record("poll", 1.0)
+            timer.close()
+            timer.record("poll", 1.0)
+            with open(path) as f:
+                self.assertEqual(1, len(f.readlines()))
+
+    def test_unwritable_trace_stops_tracing(self):
+        with tempfile.TemporaryDirectory() as d:
+            timer = StageTimer("poller", trace_path=os.path.join(d, "no", "x"))
+            with self.assertLogs("timing", "ERROR") as logs:
+                timer.record("poll", 1.0)
+                timer.record("poll", 1.0)
+        self.assertEqual(1, len(logs.output))
+        self.assertIn("stopping timing trace", logs.output[0])
+        self.assertEqual({50: 1.0, 90: 1.0, 99: 1.0}, timer.percentiles("poll"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import random
+import unittest
+
+from trend import SlidingFit
+
+
+def _brute_force(points: list[tuple[float, float]]) -> tuple[float, float]:
+    n = len(points)
+    mx = sum(x for x, _ in points) / n
+    my = sum(y for _, y in points) / n
+    slope = sum((x - mx) * (y - my) for x, y in points) / sum(
+        (x - mx) ** 2 for x, _ in points
+    )
+    return slope, my + slope * (points[-1][0] - mx)
+
+
+class TestSlidingFit(unittest.TestCase):
+    def test_exact_line(self):
+        fit = SlidingFit(15)
+        for minute in range(10):
+            fit.add(minute, 800 + 20 * minute)
+        slope, latest = fit.line()
+        self.assertAlmostEqual(20, slope)
+        self.assertAlmostEqual(980, latest)
+        self.assertAlmostEqual(21, fit.time_to(1400))
+
+    def test_no_trend(self):
+        fit = SlidingFit(15)
+        fit.add(0, 800)
+        fit.add(2, 900)
+        self.assertIsNone(fit.line())
+        fit.add(4, 1000)
+        self.assertIsNotNone(fit.line())
+        # falling, or already there:
+        self.assertIsNone(fit.time_to(900))
+        falling = SlidingFit(15)
+        for minute, ppm in enumerate((1000, 900, 800)):
+            falling.add(minute, ppm)
+        self.assertIsNone(falling.time_to(1400))
+
+    def test_matches_brute_force_over_a_long_run(self):
+        rng = random.Random(21)
+        fit = SlidingFit(15)
+        points = []
+        # minutes since the epoch, as the notifier uses, over about two weeks:
+        x = 29_500_000.0
+        for _ in range(10_000):
+            x += rng.uniform(0.5, 3)
+            y = rng.uniform(400, 2000)
+            fit.add(x, y)
+            points.append((x, y))
+        window = [(px, py) for px, py in points if px >= x - 15]
+        slope, latest = fit.line()
+        expected_slope, expected_latest = _brute_force(window)
+        self.assertEqual(len(window), len(fit))
+        self.assertAlmostEqual(expected_slope, slope, places=6)
+        self.assertAlmostEqual(expected_latest, latest, places=6)
+
+    def test_restarts_after_a_gap(self):
+        fit = SlidingFit(15)
+        for minute in range(5):
+            fit.add(minute, 2000 - 100 * minute)
+        for minute in range(100, 105):
+            fit.add(minute, 500 + 10 * minute)
+        self.assertEqual(5, len(fit))
+        self.assertAlmostEqual(10, fit.line()[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
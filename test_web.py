@@ -0,0 +1,227 @@
+import datetime
+import logging
+import os
+import tempfile
+import unittest
+
+from config import Config
+from latest import LatestReadings, LatestTracker
+from shared import SharedBuffer, SharedState
+from store import ReadingStore
+from testutil import measurement
+from web import WebServer
+
+NOW = datetime.datetime.now(datetime.UTC).replace(microsecond=0)
+
+
+def _cfg(**kwargs) -> Config:
+    return Config.from_dict(
+        {
+            "devices": [
+                {"address": "office-addr", "name": "office"},
+                {"address": "bedroom-addr", "name": "bedroom"},
+            ],
+            "web": True,
+        }
+        | kwargs
+    )
+
+
+def _app(
+    cfg: Config,
+    latest: LatestReadings | None = None,
+    poller_metrics: str = "",
+    state: SharedState | None = None,
+):
+    latest_buf = SharedBuffer(4096)
+    if latest is not None:
+        latest_buf.value = latest.pack()
+    metrics_buf = SharedBuffer(4096)
+    metrics_buf.value = poller_metrics.encode("utf-8")
+    server = WebServer(
+        cfg,
+        state=state or SharedState(),
+        latest_buf=latest_buf,
+        metrics_bufs=[metrics_buf, SharedBuffer(4096)],
+        ntfy_queue=None,
+        log_level=logging.INFO,
+    )
+    return server._make_app(logging.getLogger(__name__)).test_client()
+
+
+class TestHealth(unittest.TestCase):
+    def test_no_poll_yet(self):
+        resp = _app(_cfg()).get("/health")
+        self.assertEqual(503, resp.status_code)
+        self.assertEqual("unhealthy", resp.get_json()["status"])
+
+    def test_recent_poll(self):
+        state = SharedState()
+        state.last_poll_at = NOW
+        state.record_sinks(NOW, {"influx": True, "mqtt": False})
+        resp = _app(_cfg(), state=state).get("/health")
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(
+            {
+                "influx": {"last_ok": NOW.isoformat(), "last_failed": None},
+                "mqtt": {"last_ok": None, "last_failed": NOW.isoformat()},
+            },
+            resp.get_json()["sinks"],
+        )
+
+    def test_stale_poll(self):
+        state = SharedState()
+        state.last_poll_at = NOW - datetime.timedelta(hours=1)
+        self.assertEqual(503, _app(_cfg(), state=state).get("/health").status_code)
+
+    def test_threshold_scales_with_poll_interval(self):
+        state = SharedState()
+        state.last_poll_at = NOW - datetime.timedelta(minutes=20)
+        self.assertEqual(503, _app(_cfg(), state=state).get("/health").status_code)
+        # polling adaptively every 10 min, a poll 20 min ago is recent enough:
+        state.poll_interval_s = 600.0
+        resp = _app(_cfg(), state=state).get("/health")
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(600.0, resp.get_json()["poll_interval_s"])
+
+
+class TestLatest(unittest.TestCase):
+    def setUp(self):
+        self.cfg = _cfg()
+        self.tracker = LatestTracker()
+
+    def test_no_readings_yet(self):
+        self.assertIsNone(self.tracker.update([]))
+        self.assertEqual(503, _app(self.cfg).get("/latest").status_code)
+
+    def test_keeps_latest_per_device(self):
+        t1 = NOW - datetime.timedelta(minutes=2)
+        self.tracker.update(
+            [
+                measurement(self.cfg, t1, device="office", co2=600),
+                measurement(self.cfg, t1, device="bedroom", co2=700),
+            ]
+        )
+        # bedroom failed to read this time:
+        latest = self.tracker.update(
+            [measurement(self.cfg, NOW, device="office", co2=650)]
+        )
+        self.assertEqual(NOW, latest.last_modified)
+
+        resp = _app(self.cfg, latest).get("/latest")
+        self.assertEqual(200, resp.status_code)
+        devices = resp.get_json()["devices"]
+        self.assertEqual(650, devices["office"]["co2_ppm"])
+        self.assertEqual(NOW.isoformat(), devices["office"]["time"])
+        self.assertEqual(700, devices["bedroom"]["co2_ppm"])
+        self.assertEqual(f'"{latest.etag}"', resp.headers["ETag"])
+        self.assertEqual(NOW, resp.last_modified)
+
+    def test_conditional_get(self):
+        latest = self.tracker.update(
+            [measurement(self.cfg, NOW, device="office", co2=650)]
+        )
+        client = _app(self.cfg, latest)
+        resp = client.get("/latest", headers={"If-None-Match": f'"{latest.etag}"'})
+        self.assertEqual(304, resp.status_code)
+        self.assertEqual(b"", resp.data)
+        resp = client.get("/latest", headers={"If-None-Match": '"stale"'})
+        self.assertEqual(200, resp.status_code)
+
+        newer = self.tracker.update(
+            [measurement(self.cfg, NOW, device="office", co2=660)]
+        )
+        self.assertNotEqual(latest.etag, newer.etag)
+
+
+class TestMetrics(unittest.TestCase):
+    def test_serves_rendered_metrics(self):
+        resp = _app(_cfg(), poller_metrics="an4mon_polls_total 3\n").get("/metrics")
+        self.assertEqual(200, resp.status_code)
+        self.assertTrue(resp.content_type.startswith("text/plain; version=0.0.4"))
+        self.assertTrue(resp.data.startswith(b"an4mon_polls_total 3\n"))
+        self.assertIn(b"\nan4mon_muted 0\n", resp.data)
+
+    def test_muted_is_current_at_scrape_time(self):
+        state = SharedState()
+        state.mute_until = NOW + datetime.timedelta(hours=1)
+        self.assertIn(
+            b"\nan4mon_muted 1\n", _app(_cfg(), state=state).get("/metrics").data
+        )
+        # expired, with nothing having happened since:
+        state.mute_until = NOW - datetime.timedelta(seconds=1)
+        self.assertIn(
+            b"\nan4mon_muted 0\n", _app(_cfg(), state=state).get("/metrics").data
+        )
+
+
+class TestReadings(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._dir.name, "readings.db")
+        self.cfg = _cfg(store=True, store_file=self.path)
+        store = ReadingStore(self.path, retention_days=7)
+        for i in range(3):
+            for device in self.cfg.devices:
+                store.add(
+                    measurement(
+                        self.cfg,
+                        NOW - datetime.timedelta(hours=i),
+                        device=device.name,
+                        co2=600 + i,
+                    )
+                )
+        store.flush()
+        store.close()
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def test_defaults_to_last_day(self):
+        resp = _app(self.cfg).get("/readings")
+        self.assertEqual(200, resp.status_code)
+        rows = resp.get_json()
+        self.assertEqual(6, len(rows))
+        self.assertEqual(
+            {
+                "device": "bedroom",
+                "time": (NOW - datetime.timedelta(hours=2)).isoformat(),
+                "co2_ppm": 602,
+                "temp_c": 21.0,
+                "humidity_pct": 40.0,
+                "pressure_mbar": 1012.0,
+                "rssi": -70,
+            },
+            rows[0],
+        )
+
+    def test_filters(self):
+        since = (NOW - datetime.timedelta(minutes=90)).isoformat()
+        resp = _app(self.cfg).get(
+            "/readings", query_string={"since": since, "device": "office"}
+        )
+        self.assertEqual([601, 600], [r["co2_ppm"] for r in resp.get_json()])
+        resp = _app(self.cfg).get(
+            "/readings",
+            query_string={"until": (NOW - datetime.timedelta(hours=2)).isoformat()},
+        )
+        self.assertEqual([602, 602], [r["co2_ppm"] for r in resp.get_json()])
+
+    def test_bad_time(self):
+        resp = _app(self.cfg).get("/readings", query_string={"since": "yesterday"})
+        self.assertEqual(400, resp.status_code)
+
+    def test_store_disabled(self):
+        self.assertEqual(404, _app(_cfg()).get("/readings").status_code)
+
+    def test_store_missing(self):
+        cfg = _cfg(store=True, store_file=os.path.join(self._dir.name, "nope.db"))
+        self.assertEqual(503, _app(cfg).get("/readings").status_code)
+
+    def test_no_mute_route_without_notify(self):
+        resp = _app(self.cfg).post("/mute", json={"s": 60})
+        self.assertEqual(404, resp.status_code)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+"""Helpers shared by the tests"""
+
+import datetime
+from typing import Final
+
+from config import Config
+from libclaranet4 import Device, Reading
+from measurement import Measurement
+
+# an ordinary indoor reading:
+READING_VALUES: Final = {
+    "co2": 600,
+    "temperature": 21.0,
+    "pressure": 1012.0,
+    "humidity": 40,
+}
+
+
+def reading(address: str = "test-addr", name: str = "Aranet4", **values) -> Reading:
+    """Return a Reading of READING_VALUES, with any of them overridden"""
+    return Reading.from_values(
+        Device(address=address, name=name, rssi=-70), **(READING_VALUES | values)
+    )
+
+
+def measurement(
+    cfg: Config,
+    t: datetime.datetime,
+    device: str | None = None,
+    ble_name: str = "Aranet4",
+    interval_s: int | None = None,
+    **values,
+) -> Measurement:
+    """Return a Measurement of reading(**values) taken at t.
+
+    It's from the configured device named device, or the first one.
+    """
+    dev = next(d for d in cfg.devices if device is None or d.name == device)
+    r = reading(dev.address, ble_name, **values)
+    if interval_s is not None:
+        r.interval_s = interval_s
+    return Measurement.from_reading(cfg, dev, r, t)
@@ -0,0 +1,147 @@
+import collections
+import datetime
+import json
+import logging
+import os
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager, suppress
+from typing import IO, Final
+
+# latencies kept per stage for percentiles; older ones roll off:
+STAGE_WINDOW: Final = 512
+STAGE_SUMMARY_INTERVAL_S: Final = 15 * 60
+STAGE_PERCENTILES: Final = (50, 90, 99)
+# a trace file this big is moved aside, replacing the one moved aside before:
+TRACE_MAX_BYTES: Final = 64 * 1024 * 1024
+# lines written between checks of the trace file's size:
+_TRACE_CHECK_LINES: Final = 256
+
+
+class StageTimer:
+    """Times the stages of a pipeline, keeping rolling percentiles per stage.
+
+    Recording a timing costs a deque append, so this stays on in production.
+    maybe_log_summary() logs every stage's percentiles at most every
+    summary_interval_s. With a trace_path, every timing is also appended to that
+    file as a JSON line, along with its attributes (e.g. the device name). Once
+    the file reaches trace_max_bytes, it's moved to trace_path + ".1", so the
+    trace takes at most about twice that. If the trace can't be written, that's
+    logged and tracing stops. close() ends tracing.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        trace_path: str | None = None,
+        window: int = STAGE_WINDOW,
+        summary_interval_s: float = STAGE_SUMMARY_INTERVAL_S,
+        trace_max_bytes: int = TRACE_MAX_BYTES,
+    ):
+        self._name = name
+        self._logger = logging.getLogger(__name__)
+        self._trace_path = trace_path
+        self._trace: IO[str] | None = None
+        self._trace_lines = 0  # written since the file was opened
+        self._trace_max_bytes = trace_max_bytes
+        self._window = window
+        self._summary_interval_s = summary_interval_s
+        self._summarized_at = time.monotonic()
+        self._timings: dict[str, collections.deque[float]] = {}
+
+    @contextmanager
+    def stage(self, stage: str, **attrs) -> Iterator[None]:
+        """Time the body of a with block as stage, whether or not it raises"""
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(stage, time.monotonic() - started_at, **attrs)
+
+    def record(self, stage: str, duration_s: float, **attrs):
+        timings = self._timings.get(stage)
+        if timings is None:
+            timings = self._timings[stage] = collections.deque(maxlen=self._window)
+        timings.append(duration_s)
+        if self._trace_path is not None:
+            try:
+                self._write_trace(stage, duration_s, attrs)
+            except OSError as e:
+                self._logger.error(
+                    f"{self._name}: stopping timing trace to {self._trace_path}: {e}"
+                )
+                self.close()
+
+    def _write_trace(self, stage: str, duration_s: float, attrs: dict):
+        if self._trace is None:
+            # several processes append to the same file; line buffering keeps
+            # each line a single write:
+            self._trace = open(self._trace_path, "a", buffering=1)  # noqa: SIM115 - kept open, closed by close()
+            self._trace_lines = 0
+        self._trace.write(
+            json.dumps(
+                {
+                    "t": datetime.datetime.now(datetime.UTC).isoformat(),
+                    "process": self._name,
+                    "stage": stage,
+                    "duration_s": round(duration_s, 6),
+                }
+                | attrs
+            )
+            + "\n"
+        )
+        self._trace_lines += 1
+        if self._trace_lines % _TRACE_CHECK_LINES == 0:
+            self._maybe_rotate_trace()
+
+    def _maybe_rotate_trace(self):
+        try:
+            st = os.stat(self._trace_path)
+        except FileNotFoundError:
+            st = None
+        if st is None or not os.path.samestat(st, os.fstat(self._trace.fileno())):
+            # another process moved it aside (or it was deleted); reopen it:
+            self._trace.close()
+            self._trace = None
+        elif st.st_size >= self._trace_max_bytes:
+            os.replace(self._trace_path, f"{self._trace_path}.1")
+            self._trace.close()
+            self._trace = None
+
+    def percentiles(self, stage: str) -> dict[int, float]:
+        """Return STAGE_PERCENTILES of the stage's recent timings, in seconds"""
+        timings = sorted(self._timings.get(stage, ()))
+        if not timings:
+            return {}
+        return {
+            p: timings[min(len(timings) - 1, len(timings) * p // 100)]
+            for p in STAGE_PERCENTILES
+        }
+
+    def summary(self) -> str:
+        parts = []
+        for stage, timings in self._timings.items():
+            pcts = "/".join(f"{v * 1000:.0f}" for v in self.percentiles(stage).values())
+            parts.append(f"{stage} {pcts} (n={len(timings)})")
+        return (
+            f"{self._name} stage latencies, p"
+            + "/p".join(str(p) for p in STAGE_PERCENTILES)
+            + " ms: "
+            + ", ".join(parts)
+        )
+
+    def maybe_log_summary(self, logger: logging.Logger):
+        if not self._timings:
+            return
+        now = time.monotonic()
+        if now - self._summarized_at < self._summary_interval_s:
+            return
+        self._summarized_at = now
+        logger.info(self.summary())
+
+    def close(self):
+        self._trace_path = None
+        if self._trace is not None:
+            trace, self._trace = self._trace, None
+            with suppress(OSError):  # e.g. flushing to a full disk
+                trace.close()
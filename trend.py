@@ -0,0 +1,83 @@
+import collections
+from typing import Final
+
+# fewer points than this don't make a trend:
+TREND_MIN_POINTS: Final = 3
+
+
+class SlidingFit:
+    """A least-squares line through the points seen over the last window.
+
+    The fit's sums are updated as points arrive and leave the window, so adding
+    a point is amortized O(1), however many the window holds. x is measured
+    from an origin that moves forward with the window, which keeps the sums
+    small enough that float error doesn't swamp the slope.
+    """
+
+    def __init__(self, window: float):
+        self._window = window
+        # of (x, y), oldest first:
+        self._points: collections.deque[tuple[float, float]] = collections.deque()
+        # the sums are of x - _origin:
+        self._origin = 0.0
+        self._sx = 0.0
+        self._sy = 0.0
+        self._sxx = 0.0
+        self._sxy = 0.0
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def add(self, x: float, y: float):
+        points = self._points
+        if not points:
+            self._origin = x
+        points.append((x, y))
+        self._sum(x, y, 1)
+        while points[0][0] < x - self._window:
+            self._sum(*points.popleft(), -1)
+
+        if len(points) == 1:
+            # start over, so float error in the sums can't build up:
+            self._origin = x
+            self._sx, self._sy, self._sxx, self._sxy = 0.0, y, 0.0, 0.0
+        elif points[0][0] - self._origin > self._window:
+            self._rebase(points[0][0])
+
+    def _sum(self, x: float, y: float, sign: int):
+        x -= self._origin
+        self._sx += sign * x
+        self._sy += sign * y
+        self._sxx += sign * x * x
+        self._sxy += sign * x * y
+
+    def _rebase(self, origin: float):
+        """Measure x from origin, adjusting the sums to match"""
+        d = origin - self._origin
+        n = len(self._points)
+        self._sxx += -2 * d * self._sx + n * d * d
+        self._sxy -= d * self._sy
+        self._sx -= n * d
+        self._origin = origin
+
+    def line(self) -> tuple[float, float] | None:
+        """Return the fit's (slope, y at the latest x), or None if there's no trend"""
+        n = len(self._points)
+        if n < TREND_MIN_POINTS:
+            return None
+        denom = n * self._sxx - self._sx * self._sx
+        if denom <= 0:
+            return None
+        slope = (n * self._sxy - self._sx * self._sy) / denom
+        intercept = (self._sy - slope * self._sx) / n
+        return slope, intercept + slope * (self._points[-1][0] - self._origin)
+
+    def time_to(self, y: float) -> float | None:
+        """Return how long after the latest x the fit reaches y, if it's rising"""
+        line = self.line()
+        if line is None:
+            return None
+        slope, latest = line
+        if slope <= 0 or latest >= y:
+            return None
+        return (y - latest) / slope
@@ -1,34 +1,52 @@
+from __future__ import annotations
+
 import datetime
+import json
 import logging
 import multiprocessing
-from multiprocessing.managers import Namespace
+import sqlite3
+from collections.abc import Iterator
 from typing import Final
 
 import waitress
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
 
 import lib_mpex
+from clock import SYSTEM_CLOCK, Clock
 from config import Config
+from daemon_thread import run_in_daemon_thread
+from latest import LatestReadings
 from log import LOG_DEFAULT_FMT
-from ntfy import MuteEvent
+from metrics import METRICS_CONTENT_TYPE, MetricsRegistry
+from ntfy import MuteEvent, NotifyInbox
+from shared import SharedBuffer, SharedState
+from store import STORE_COLUMNS, STORE_FETCH_ROWS, query_readings
 
 HEALTH_UNHEALTHY_POLLS: Final = 3  # unhealthy after this many missed poll intervals
 MAX_MUTE_S: Final = 30 * 24 * 60 * 60  # longest accepted mute request
+READINGS_DEFAULT_WINDOW: Final = datetime.timedelta(hours=24)
+# with --single-process, the web server shares a process with everything else:
+WEB_SINGLE_PROCESS_THREADS: Final = 2
 
 
 class WebServer(lib_mpex.ChildProcess):
     def __init__(
         self,
         config: Config,
-        mute_ns: Namespace,
-        health_ns: Namespace,
-        ntfy_queue: multiprocessing.Queue,  # of ReadingEvent | MuteEvent
+        state: SharedState,
+        latest_buf: SharedBuffer,  # of packed LatestReadings
+        metrics_bufs: list[SharedBuffer],  # rendered by the poller and notifier
+        # of ReadingEvent | MuteEvent:
+        ntfy_queue: multiprocessing.Queue | NotifyInbox | None,
         log_level: int,
+        clock: Clock = SYSTEM_CLOCK,
     ):
         self._config = config
-        self._mute_ns = mute_ns
-        self._health_ns = health_ns
+        self._clock = clock
+        self._state = state
+        self._latest_buf = latest_buf
+        self._metrics_bufs = metrics_bufs
         self._ntfy_queue = ntfy_queue
         self._log_level = log_level
 
@@ -37,30 +55,123 @@ class WebServer(lib_mpex.ChildProcess):
         logging.basicConfig(level=self._log_level, format=LOG_DEFAULT_FMT)
         logging.getLogger("waitress").setLevel(self._log_level + 10)
         logger.info("starting web server")
+        waitress.serve(
+            self._make_app(logger),
+            listen=f"{self._config.web_bind_to}:{self._config.web_port}",
+        )
 
-        unhealthy_t = datetime.timedelta(
-            minutes=HEALTH_UNHEALTHY_POLLS * self._config.poll_interval
+    async def run_async(self):
+        """Serve until cancelled, on a thread; raises if the server fails"""
+        logger = logging.getLogger(__name__)
+        logging.getLogger("waitress").setLevel(self._log_level + 10)
+        logger.info("starting web server")
+        server = waitress.create_server(
+            self._make_app(logger),
+            listen=f"{self._config.web_bind_to}:{self._config.web_port}",
+            threads=WEB_SINGLE_PROCESS_THREADS,
         )
+        try:
+            await run_in_daemon_thread(server.run, "web-server")
+        finally:
+            server.close()
 
+    def app(self) -> Flask:
+        """Return the server's Flask app, e.g. to query it without serving it"""
+        return self._make_app(logging.getLogger(__name__))
+
+    def _make_app(self, logger: logging.Logger) -> Flask:
         app = Flask("an4mon")
         CORS(app)
 
         @app.route("/health", methods=["GET"])
         def health():
-            last_poll_at = self._health_ns.last_poll_at
+            sinks = {
+                sink: {
+                    "last_ok": ok_at.isoformat() if ok_at else None,
+                    "last_failed": failed_at.isoformat() if failed_at else None,
+                }
+                for sink, (ok_at, failed_at) in self._state.sinks().items()
+                if ok_at or failed_at
+            }
+            # the poller's current interval, which varies with poll_adaptive:
+            interval_s = self._state.poll_interval_s or self._config.poll_interval * 60
+            unhealthy_t = datetime.timedelta(
+                seconds=HEALTH_UNHEALTHY_POLLS * interval_s
+            )
+            last_poll_at = self._state.last_poll_at
             if last_poll_at is None:
                 return jsonify(
-                    {"status": "unhealthy", "error": "no successful poll yet"}
+                    {
+                        "status": "unhealthy",
+                        "error": "no successful poll yet",
+                        "poll_interval_s": interval_s,
+                        "sinks": sinks,
+                    }
                 ), 503
-            if datetime.datetime.now(datetime.UTC) - last_poll_at >= unhealthy_t:
+            if self._clock.now() - last_poll_at >= unhealthy_t:
                 return jsonify(
                     {
                         "status": "unhealthy",
                         "error": f"no successful poll in over {unhealthy_t}",
+                        "poll_interval_s": interval_s,
+                        "sinks": sinks,
                     }
                 ), 503
-            return jsonify({"status": "ok"})
+            return jsonify(
+                {"status": "ok", "poll_interval_s": interval_s, "sinks": sinks}
+            )
 
+        @app.route("/latest", methods=["GET"])
+        def latest():
+            snapshot = LatestReadings.unpack(self._latest_buf.value)
+            if snapshot is None:
+                return jsonify({"error": "no readings yet"}), 503
+            resp = Response(snapshot.body, mimetype="application/json")
+            resp.set_etag(snapshot.etag)
+            resp.last_modified = snapshot.last_modified
+            # clients may keep it, but must revalidate (cheaply, via 304s):
+            resp.cache_control.no_cache = True
+            return resp.make_conditional(request)
+
+        @app.route("/metrics", methods=["GET"])
+        def metrics():
+            # rendered by the poller and notifier as things change, not per
+            # scrape; but a mute expires without anything happening, so whether
+            # notifications are muted is worked out here:
+            mute_until = self._state.mute_until
+            muted = mute_until is not None and self._clock.now() < mute_until
+            return Response(
+                b"".join(buf.value for buf in self._metrics_bufs)
+                + _render_muted(muted),
+                content_type=METRICS_CONTENT_TYPE,
+            )
+
+        @app.route("/readings", methods=["GET"])
+        def readings():
+            if not self._config.store:
+                return jsonify({"error": "the reading store is not enabled"}), 404
+            now = self._clock.now()
+            try:
+                since = _parse_time(
+                    request.args.get("since"), now - READINGS_DEFAULT_WINDOW
+                )
+                until = _parse_time(request.args.get("until"), now)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            try:
+                rows = query_readings(
+                    self._config.store_file, since, until, request.args.get("device")
+                )
+            except sqlite3.Error as e:
+                logger.error(f"reading store query failed: {e}")
+                return jsonify({"error": "the reading store is unavailable"}), 503
+            return Response(_stream_json_array(rows), mimetype="application/json")
+
+        if self._config.mute_enabled():
+            self._add_mute_route(app, logger)
+        return app
+
+    def _add_mute_route(self, app: Flask, logger: logging.Logger):
         @app.route("/mute", methods=["POST"])
         def mute():
             body = request.get_json(silent=True)
@@ -73,18 +184,52 @@ class WebServer(lib_mpex.ChildProcess):
             if secs > MAX_MUTE_S:
                 return jsonify({"error": f"'s' must be at most {MAX_MUTE_S}"}), 400
 
-            now = datetime.datetime.now(datetime.UTC)
+            now = self._clock.now()
             if secs < 1:
-                self._mute_ns.mute_until = now
+                self._state.mute_until = now
                 logger.info("unmuted")
                 self._ntfy_queue.put_nowait(MuteEvent(mute_seconds=0))
             else:
                 mute_until = now + datetime.timedelta(seconds=secs)
-                self._mute_ns.mute_until = mute_until
+                self._state.mute_until = mute_until
                 logger.info(f"muted until {mute_until}")
                 self._ntfy_queue.put_nowait(MuteEvent(mute_seconds=secs))
             return jsonify({"status": "ok"})
 
-        waitress.serve(
-            app, listen=f"{self._config.web_bind_to}:{self._config.web_port}"
-        )
+
+def _parse_time(value: str | None, default: datetime.datetime) -> datetime.datetime:
+    """Parse an ISO 8601 query parameter; times without a zone are taken as UTC"""
+    if not value:
+        return default
+    try:
+        t = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"not an ISO 8601 time: {value}") from None
+    return t if t.tzinfo is not None else t.replace(tzinfo=datetime.UTC)
+
+
+def _render_muted(muted: bool) -> bytes:
+    # a registry per scrape, since waitress serves scrapes on several threads:
+    metrics = MetricsRegistry()
+    metrics.gauge("an4mon_muted", "Whether CO2 notifications are muted.").set(
+        1 if muted else 0
+    )
+    return metrics.render().encode("utf-8")
+
+
+def _stream_json_array(rows: Iterator[tuple]) -> Iterator[str]:
+    """Serialize store rows as a JSON array of objects, STORE_FETCH_ROWS at a time"""
+    yield "["
+    sep = ""
+    chunk = []
+    for row in rows:
+        obj = dict(zip(STORE_COLUMNS, row))
+        obj["time"] = obj["time"].isoformat()
+        chunk.append(json.dumps(obj))
+        if len(chunk) >= STORE_FETCH_ROWS:
+            yield sep + ",".join(chunk)
+            sep = ","
+            chunk = []
+    if chunk:
+        yield sep + ",".join(chunk)
+    yield "]"